@@ -0,0 +1,166 @@
+# ella_dbo/async_db_manager.py
+"""Async mirror of db_manager for FastAPI handlers and background pollers.
+
+Every call is dispatched to a small dedicated thread pool, so coroutines never
+block the event loop on sqlite3. Each worker thread reuses its pooled db_manager
+connection, which makes the worker count the upper bound on open connections.
+The synchronous db_manager functions stay the source of truth for scripts.
+"""
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from ella_dbo import db_manager
+from ella_dbo.records import EventRecord
+
+logger = logging.getLogger(__name__)
+
+DB_MAX_WORKERS = int(os.getenv("ELLA_DB_MAX_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="ella-db")
+
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _upsert_user(lookup_field: str, lookup_value: Any, **kwargs) -> None:
+    with db_manager.get_db_connection() as conn:
+        db_manager.upsert_user(conn, lookup_field, lookup_value, **kwargs)
+
+
+async def get_user(memgpt_user_id: str) -> Optional[Dict[str, Any]]:
+    """Retrieve a user row by memgpt_user_id."""
+    return await _run(db_manager.get_user_data_by_field, 'memgpt_user_id', memgpt_user_id)
+
+
+async def get_user_data_by_field(field_name: str, field_value: Any) -> Optional[Dict[str, Any]]:
+    """Retrieve a user row by any indexed lookup field."""
+    return await _run(db_manager.get_user_data_by_field, field_name, field_value)
+
+
+async def get_active_users() -> List[Dict[str, Any]]:
+    """Retrieve all users with a memgpt_user_id."""
+    return await _run(db_manager.get_active_users)
+
+
+async def upsert_user(lookup_field: str, lookup_value: Any, **kwargs) -> None:
+    """Insert or update a user in its own transaction."""
+    await _run(_upsert_user, lookup_field, lookup_value, **kwargs)
+
+
+async def add_event(user_id: str, event_data: Dict[str, Any]) -> Optional[str]:
+    return await _run(db_manager.add_event, user_id, event_data)
+
+
+async def add_events_bulk(user_id: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return await _run(db_manager.add_events_bulk, user_id, events)
+
+
+async def get_events(user_id: str, time_min: str, time_max: str) -> List[EventRecord]:
+    return await _run(db_manager.get_events, user_id, time_min, time_max)
+
+
+async def get_events_overlapping(user_id: str, start_ts: int, end_ts: int) -> List[EventRecord]:
+    return await _run(db_manager.get_events_overlapping, user_id, start_ts, end_ts)
+
+
+async def get_event(event_id: str) -> Optional[Dict[str, Any]]:
+    return await _run(db_manager.get_event, event_id)
+
+
+async def update_event(event_id: str, event_data: Dict[str, Any]) -> bool:
+    return await _run(db_manager.update_event, event_id, event_data)
+
+
+async def delete_event(event_id: str) -> bool:
+    return await _run(db_manager.delete_event, event_id)
+
+
+async def extend_occurrences(now_ts: Optional[int] = None) -> int:
+    return await _run(db_manager.extend_occurrences, now_ts)
+
+
+async def schedule_reminders(reminders: List[Dict[str, Any]]) -> int:
+    return await _run(db_manager.schedule_reminders, reminders)
+
+
+async def claim_due_reminders(worker_id: str, until_ts: int,
+                              shards: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    return await _run(db_manager.claim_due_reminders, worker_id, until_ts, shards=shards)
+
+
+async def claim_user_reminders(worker_id: str, user_ids: List[str], until_ts: int) -> List[Dict[str, Any]]:
+    return await _run(db_manager.claim_user_reminders, worker_id, user_ids, until_ts)
+
+
+async def settle_missed_reminders(shards: Optional[List[int]] = None) -> Dict[str, int]:
+    return await _run(db_manager.settle_missed_reminders, shards=shards)
+
+
+async def get_pending_reminders(until_ts: int, shards: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    return await _run(db_manager.get_pending_reminders, until_ts, shards)
+
+
+async def get_reminder_content(event_id: str, occurrence_ts: int, reminder_key: str,
+                               event_version: int) -> Optional[str]:
+    return await _run(db_manager.get_reminder_content, event_id, occurrence_ts, reminder_key, event_version)
+
+
+async def store_reminder_content(event_id: str, occurrence_ts: int, reminder_key: str,
+                                 event_version: int, content: str) -> bool:
+    return await _run(db_manager.store_reminder_content, event_id, occurrence_ts, reminder_key, event_version, content)
+
+
+async def prune_reminder_content() -> int:
+    return await _run(db_manager.prune_reminder_content)
+
+
+async def complete_reminder(event_id: str, occurrence_ts: int, reminder_key: str,
+                            success: bool, error: Optional[str] = None) -> bool:
+    return await _run(db_manager.complete_reminder, event_id, occurrence_ts, reminder_key, success, error)
+
+
+async def prune_reminder_deliveries() -> int:
+    return await _run(db_manager.prune_reminder_deliveries)
+
+
+async def record_event_changes(changes: List[Dict[str, Any]]) -> Optional[int]:
+    return await _run(db_manager.record_event_changes, changes)
+
+
+async def get_event_changes(after_seq: int, limit: int = 1000) -> List[Dict[str, Any]]:
+    return await _run(db_manager.get_event_changes, after_seq, limit)
+
+
+async def get_latest_event_change_seq() -> int:
+    return await _run(db_manager.get_latest_event_change_seq)
+
+
+async def prune_event_changes() -> int:
+    return await _run(db_manager.prune_event_changes)
+
+
+async def acquire_shard_leases(service: str, owner: str) -> Optional[List[int]]:
+    return await _run(db_manager.acquire_shard_leases, service, owner)
+
+
+async def release_shard_leases(service: str, owner: str) -> int:
+    return await _run(db_manager.release_shard_leases, service, owner)
+
+
+async def get_gmail_history_id(mailbox: str, owner: str) -> Optional[str]:
+    return await _run(db_manager.get_gmail_history_id, mailbox, owner)
+
+
+async def set_gmail_history_id(mailbox: str, owner: str, history_id: Optional[str]) -> bool:
+    return await _run(db_manager.set_gmail_history_id, mailbox, owner, history_id)
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stop the worker threads; pooled connections are closed by db_manager."""
+    _executor.shutdown(wait=wait)
@@ -2,27 +2,157 @@
 import os
 import sqlite3
 import uuid
+import atexit
 import contextlib
 import logging
 import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
 from typing import List, Optional, Dict, Any, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import importlib.util
 
+from ella_dbo.recurrence import expand_occurrences, is_recurring, get_zone
+from ella_dbo.records import EventRecord
+
 
 current_dir = os.path.dirname(__file__)
 DB_FILE = os.path.join(current_dir, "database.db")
 
+# Connection tuning; every pooled connection is opened once with these settings.
+DB_TIMEOUT = float(os.getenv("ELLA_DB_TIMEOUT", "30"))
+DB_MMAP_SIZE = int(os.getenv("ELLA_DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_CACHED_STATEMENTS = int(os.getenv("ELLA_DB_CACHED_STATEMENTS", "256"))
+
+# In-process user profile cache; see UserCache.
+USER_CACHE_SIZE = int(os.getenv("ELLA_USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("ELLA_USER_CACHE_TTL", "300"))
+
+# Recurring series are materialized into event_occurrences up to a rolling
+# horizon, starting no further back than the lookback for old series.
+OCCURRENCE_HORIZON = int(os.getenv("ELLA_OCCURRENCE_HORIZON_DAYS", "90")) * 86400
+OCCURRENCE_LOOKBACK = int(os.getenv("ELLA_OCCURRENCE_LOOKBACK_DAYS", "365")) * 86400
+OCCURRENCE_REFRESH_SLACK = 86400
+
+# Reminder delivery ledger: a claimed reminder whose worker has not reported
+# back within the timeout is claimable again; failed sends retry up to
+# REMINDER_MAX_ATTEMPTS times before the row is marked failed.
+REMINDER_CLAIM_TIMEOUT = int(os.getenv("ELLA_REMINDER_CLAIM_TIMEOUT", "300"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("ELLA_REMINDER_MAX_ATTEMPTS", "3"))
+REMINDER_RETENTION = int(os.getenv("ELLA_REMINDER_RETENTION_DAYS", "30")) * 86400
+# Catch-up after downtime: reminders overdue by more than REMINDER_REPLAY_GRACE
+# seconds are replayed, at most REMINDER_REPLAY_USER_CAP per user, unless
+# their event has already started; the rest are recorded as missed.
+REMINDER_REPLAY_GRACE = int(os.getenv("ELLA_REMINDER_REPLAY_GRACE", "120"))
+REMINDER_REPLAY_USER_CAP = int(os.getenv("ELLA_REMINDER_REPLAY_USER_CAP", "5"))
+
+# Event change log rows are only needed until every reader has caught up.
+EVENT_CHANGE_RETENTION = int(os.getenv("ELLA_EVENT_CHANGE_RETENTION_HOURS", "24")) * 3600
+
+# Background pollers split users into SHARD_COUNT shards and each worker
+# works only the shards it holds a lease on. The count is fixed because
+# reminder ledger rows record their shard; leases not renewed within
+# SHARD_LEASE_TTL seconds are taken over by the remaining workers.
+SHARD_COUNT = 64
+SHARD_LEASE_TTL = int(os.getenv("ELLA_SHARD_LEASE_TTL", "90"))
+
+# Gmail sync cursors of workers that stopped updating them this long ago are dropped.
+GMAIL_CURSOR_RETENTION = 7 * 86400
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class _ConnectionPool(threading.local):
+    """Per-thread connections keyed by database path, reused across calls."""
+
+    def __init__(self):
+        self.connections = {}
+        self.depths = {}
+        self.after_transaction = {}
+
+
+_pool = _ConnectionPool()
+_pool_lock = threading.Lock()
+_open_connections = []
+_pool_generation = 0
+
+
+def _open_connection(db_file: str, track: bool = True) -> sqlite3.Connection:
+    """Open a new connection with WAL journaling and the shared tuning pragmas.
+
+    Untracked connections are owned by the caller, who must close them.
+    """
+    conn = sqlite3.connect(
+        db_file,
+        timeout=DB_TIMEOUT,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if not track:
+        return conn
+    with _pool_lock:
+        _open_connections.append(conn)
+    logger.debug(f"Opened pooled database connection to {db_file}")
+    return conn
+
+
+def _acquire_connection() -> sqlite3.Connection:
+    """Return this thread's connection to DB_FILE, opening it on first use."""
+    key = (os.getpid(), DB_FILE)
+    entry = _pool.connections.get(key)
+    if entry is None or entry[1] != _pool_generation:
+        entry = (_open_connection(DB_FILE), _pool_generation)
+        _pool.connections[key] = entry
+        _pool.depths[key] = 0
+    return entry[0]
+
+
+def close_all_connections():
+    """Close every pooled connection (used on shutdown and by tests)."""
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        connections = list(_open_connections)
+        _open_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+    _pool.connections.clear()
+    _pool.depths.clear()
+    _pool.after_transaction.clear()
+
+
+atexit.register(close_all_connections)
+
+
 class DatabaseConnectionManager:
+    """Context manager around the calling thread's pooled connection.
+
+    Nested blocks share one transaction; only the outermost block commits or
+    rolls back. The connection itself stays open for reuse.
+    """
+
     def __init__(self):
         self.conn = None
+        self._key = None
 
     def __enter__(self):
         try:
-            self.conn = sqlite3.connect(DB_FILE)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = _acquire_connection()
+            self._key = (os.getpid(), DB_FILE)
+            _pool.depths[self._key] = _pool.depths.get(self._key, 0) + 1
             return self.conn
         except sqlite3.Error as e:
             logger.error(f"Database connection error: {e}")
@@ -30,30 +160,102 @@ class DatabaseConnectionManager:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.conn:
-            if exc_type:
-                self.conn.rollback()
-            else:
-                self.conn.commit()
-            self.conn.close()
+            depth = _pool.depths.get(self._key, 1) - 1
+            _pool.depths[self._key] = depth
+            if depth > 0:
+                return
+            callbacks = _pool.after_transaction.pop(self._key, [])
+            try:
+                if exc_type:
+                    self.conn.rollback()
+                else:
+                    self.conn.commit()
+            finally:
+                for callback in callbacks:
+                    callback()
 
 def get_db_connection():
     return DatabaseConnectionManager()
 
-# Add this function to your db_manager.py file
-def run_migrations():
-    migrations_dir = os.path.join(os.path.dirname(__file__), 'migrations')
-    for filename in sorted(os.listdir(migrations_dir)):
-        if filename.endswith('.py'):
-            print(f"Running migration: {filename}")
-            spec = importlib.util.spec_from_file_location(
-                f"migrations.{filename[:-3]}",
-                os.path.join(migrations_dir, filename)
+def after_transaction(callback) -> None:
+    """Run callback once the calling thread's outermost transaction commits or rolls back.
+
+    Outside a get_db_connection() block it runs right away.
+    """
+    key = (os.getpid(), DB_FILE)
+    if _pool.depths.get(key, 0) > 0:
+        _pool.after_transaction.setdefault(key, []).append(callback)
+    else:
+        callback()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+
+def _discover_migrations() -> List[tuple]:
+    """Return (version, filename) for each NNN_name.py in MIGRATIONS_DIR, in order."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        prefix = filename.split('_', 1)[0]
+        if filename.endswith('.py') and prefix.isdigit():
+            migrations.append((int(prefix), filename))
+    return sorted(migrations)
+
+
+def _load_migration(filename: str):
+    spec = importlib.util.spec_from_file_location(
+        f"migrations.{filename[:-3]}",
+        os.path.join(MIGRATIONS_DIR, filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_schema_version(conn) -> int:
+    """Highest applied migration version, or 0 for a database never migrated."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def run_migrations() -> int:
+    """Apply pending migrations, each once and in its own transaction.
+
+    A current schema costs one SELECT. Each pending migration runs under
+    BEGIN IMMEDIATE and re-checks schema_version, so concurrent workers
+    booting together apply it exactly once. A failing migration is rolled
+    back, along with its schema_version row. Returns how many were applied.
+    """
+    migrations = _discover_migrations()
+    with get_db_connection() as conn:
+        current = get_schema_version(conn)
+    if not migrations or current >= migrations[-1][0]:
+        logger.debug(f"Database schema is current at version {current}")
+        return 0
+
+    applied = 0
+    for version, filename in migrations:
+        if version <= current:
+            continue
+        with get_db_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                continue
+            logger.info(f"Running migration: {filename}")
+            _load_migration(filename).migrate(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, filename[:-3], datetime.now(timezone.utc).isoformat())
             )
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            module.migrate()
+            applied += 1
+    logger.info(f"Applied {applied} migration(s); schema is at version {migrations[-1][0]}")
+    return applied
 
-# Modify your initialize_database function to run migrations
 def initialize_database():
     """Initialize the database, creating it if it doesn't exist and setting up tables."""
     try:
@@ -61,6 +263,7 @@ def initialize_database():
             create_table(conn)
         logger.info("Database initialized and tables created successfully.")
         run_migrations()  # Run migrations after initializing the database
+        extend_occurrences()
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
@@ -75,6 +278,7 @@ def create_table(conn):
         memgpt_user_api_key TEXT,
         email TEXT,
         phone TEXT,
+        phone_digits TEXT,
         name TEXT,
         roles TEXT,
         default_agent_key TEXT,
@@ -97,17 +301,280 @@ def create_table(conn):
         location TEXT,
         reminders TEXT,
         recurrence TEXT,
+        local_timezone TEXT,
+        start_ts INTEGER,
+        end_ts INTEGER,
+        occurrences_until INTEGER,
+        version INTEGER NOT NULL DEFAULT 1,
         FOREIGN KEY (user_id) REFERENCES users (memgpt_user_id)
     );"""
+
+    create_occurrences_table_sql = """
+    CREATE TABLE IF NOT EXISTS event_occurrences (
+        event_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        PRIMARY KEY (event_id, start_ts),
+        FOREIGN KEY (event_id) REFERENCES events (id)
+    );"""
+
+    create_reminder_deliveries_table_sql = """
+    CREATE TABLE IF NOT EXISTS reminder_deliveries (
+        event_id TEXT NOT NULL,
+        occurrence_ts INTEGER NOT NULL,
+        reminder_key TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        shard INTEGER NOT NULL DEFAULT 0,
+        fire_ts INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_by TEXT,
+        claimed_at INTEGER,
+        delivered_at INTEGER,
+        last_error TEXT,
+        created_at INTEGER NOT NULL,
+        PRIMARY KEY (event_id, occurrence_ts, reminder_key)
+    );"""
+
+    create_reminder_content_table_sql = """
+    CREATE TABLE IF NOT EXISTS reminder_content (
+        event_id TEXT NOT NULL,
+        occurrence_ts INTEGER NOT NULL,
+        reminder_key TEXT NOT NULL,
+        event_version INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        generated_at INTEGER NOT NULL,
+        PRIMARY KEY (event_id, occurrence_ts, reminder_key)
+    );"""
+
+    create_event_changes_table_sql = """
+    CREATE TABLE IF NOT EXISTS event_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        op TEXT NOT NULL,
+        changed_at INTEGER NOT NULL
+    );"""
+
+    create_worker_leases_table_sql = """
+    CREATE TABLE IF NOT EXISTS worker_leases (
+        service TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        owner TEXT,
+        expires_at INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (service, shard)
+    );"""
+
+    create_gmail_sync_state_table_sql = """
+    CREATE TABLE IF NOT EXISTS gmail_sync_state (
+        mailbox TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        history_id TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (mailbox, owner)
+    );"""
+
+    create_worker_heartbeats_table_sql = """
+    CREATE TABLE IF NOT EXISTS worker_heartbeats (
+        service TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        expires_at INTEGER NOT NULL,
+        PRIMARY KEY (service, owner)
+    );"""
     
     try:
         conn.execute(create_users_table_sql)
         conn.execute(create_events_table_sql)
+        conn.execute(create_occurrences_table_sql)
+        conn.execute(create_reminder_deliveries_table_sql)
+        conn.execute(create_reminder_content_table_sql)
+        conn.execute(create_event_changes_table_sql)
+        conn.execute(create_worker_leases_table_sql)
+        conn.execute(create_worker_heartbeats_table_sql)
+        conn.execute(create_gmail_sync_state_table_sql)
         logger.info("Tables created successfully or already exist.")
     except sqlite3.Error as e:
         logger.error(f"An error occurred while creating tables: {e}")
         raise
 
+# Hot queries, kept as constants so the query-plan test can EXPLAIN them verbatim.
+EVENT_COLUMNS = """id, user_id, summary, description, start_time, end_time,
+                       location, reminders, recurrence, local_timezone, start_ts, end_ts, version"""
+
+# Overlap on UTC epoch seconds: a row is returned if any part of it falls
+# inside [start_ts, end_ts). Leading with end_ts keeps the index range to
+# rows that have not finished before the window opens.
+GET_EVENTS_SQL = f"""
+                SELECT {EVENT_COLUMNS}
+                FROM events 
+                WHERE user_id = ? AND end_ts > ? AND start_ts < ?
+                ORDER BY start_ts ASC
+            """
+
+# Same overlap, over materialized occurrences; start_ts/end_ts are the
+# occurrence's own times, so recurring series appear once per instance.
+GET_OCCURRENCES_SQL = """
+                SELECT e.id, e.user_id, e.summary, e.description, e.start_time, e.end_time,
+                       e.location, e.reminders, e.recurrence, e.local_timezone, o.start_ts, o.end_ts, e.version
+                FROM event_occurrences o
+                JOIN events e ON e.id = o.event_id
+                WHERE o.user_id = ? AND o.end_ts > ? AND o.start_ts < ?
+                ORDER BY o.start_ts ASC
+            """
+
+SERIES_COLUMNS = "id, user_id, start_time, local_timezone, recurrence, start_ts, end_ts, occurrences_until"
+
+# Series whose occurrences are missing or end before the refresh threshold.
+SERIES_TO_EXPAND_SQL = f"""
+                SELECT {SERIES_COLUMNS}
+                FROM events
+                WHERE occurrences_until IS NULL OR occurrences_until < ?
+            """
+
+GET_EVENT_SQL = f"""
+                SELECT {EVENT_COLUMNS}
+                FROM events 
+                WHERE id = ?
+            """
+
+INSERT_EVENT_SQL = """
+                INSERT INTO events (
+                    id, user_id, summary, description, start_time, end_time, 
+                    location, reminders, recurrence, local_timezone, start_ts, end_ts
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+
+# Claim every reminder due by a cutoff in the caller's shards (a JSON array),
+# in one statement. Pending rows and claims abandoned by a dead worker both
+# qualify; the (status, fire_ts) index serves both branches of the IN.
+CLAIM_DUE_REMINDERS_SQL = """
+                UPDATE reminder_deliveries
+                SET status = 'claimed', claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+                WHERE status IN ('pending', 'claimed') AND fire_ts <= ?
+                  AND (status = 'pending' OR claimed_at < ?)
+                  AND shard IN (SELECT value FROM json_each(?))
+                RETURNING event_id, occurrence_ts, reminder_key, user_id, fire_ts, attempts
+            """
+
+# Claim one set of users' reminders due by a cutoff (coalescing a user's
+# reminders into one send); the (user_id, status) index finds them.
+CLAIM_USER_REMINDERS_SQL = """
+                UPDATE reminder_deliveries
+                SET status = 'claimed', claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+                WHERE user_id IN (SELECT value FROM json_each(?)) AND status IN ('pending', 'claimed')
+                  AND fire_ts <= ? AND (status = 'pending' OR claimed_at < ?)
+                RETURNING event_id, occurrence_ts, reminder_key, user_id, fire_ts, attempts
+            """
+
+INSERT_REMINDER_SQL = """
+                INSERT OR IGNORE INTO reminder_deliveries (
+                    event_id, occurrence_ts, reminder_key, user_id, shard, fire_ts, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """
+
+# Bounds used when a caller does not restrict the time window.
+MIN_TIMESTAMP = -(2 ** 62)
+MAX_TIMESTAMP = 2 ** 62
+
+# Columns get_user_data_by_field is called with; each is backed by an index.
+USER_LOOKUP_FIELDS = ('memgpt_user_id', 'email', 'phone', 'auth0_user_id')
+
+def to_utc_timestamp(value: Union[str, datetime, int, float], tz_name: Optional[str] = 'UTC') -> int:
+    """Convert an ISO string or datetime to UTC epoch seconds.
+
+    Naive values are interpreted in tz_name (falling back to UTC when the zone
+    is unknown); values that already carry an offset keep it.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        try:
+            tz = ZoneInfo(tz_name or 'UTC')
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Unknown timezone {tz_name!r}, treating time as UTC")
+            tz = timezone.utc
+        dt = dt.replace(tzinfo=tz)
+    return int(dt.timestamp())
+
+
+def _expand_series(conn, series, now_ts: int) -> None:
+    """Materialize a series' occurrences up to now_ts + OCCURRENCE_HORIZON.
+
+    Single events get one occurrence and are marked complete. Recurring series
+    continue from occurrences_until, so each pass only adds new instances.
+    """
+    event_id, user_id, start_time, local_timezone, recurrence, start_ts, end_ts, occurrences_until = series
+    if start_ts is None or end_ts is None:
+        return
+    if not is_recurring(recurrence):
+        conn.execute("INSERT OR IGNORE INTO event_occurrences (event_id, user_id, start_ts, end_ts) VALUES (?, ?, ?, ?)",
+                     (event_id, user_id, start_ts, end_ts))
+        conn.execute("UPDATE events SET occurrences_until = ? WHERE id = ?", (MAX_TIMESTAMP, event_id))
+        return
+
+    horizon_ts = now_ts + OCCURRENCE_HORIZON
+    from_ts = occurrences_until if occurrences_until is not None else max(start_ts, now_ts - OCCURRENCE_LOOKBACK)
+    try:
+        occurrences, resume_ts = expand_occurrences(
+            start_time, end_ts - start_ts, local_timezone, recurrence, from_ts, horizon_ts)
+    except Exception as e:
+        logger.error(f"Could not expand recurrence for event {event_id}, keeping first instance only: {e}")
+        occurrences, resume_ts = [(start_ts, end_ts)], None
+    conn.executemany("INSERT OR IGNORE INTO event_occurrences (event_id, user_id, start_ts, end_ts) VALUES (?, ?, ?, ?)",
+                     [(event_id, user_id, occ_start, occ_end) for occ_start, occ_end in occurrences])
+    conn.execute("UPDATE events SET occurrences_until = ? WHERE id = ?",
+                 (MAX_TIMESTAMP if resume_ts is None else resume_ts, event_id))
+
+
+def _rematerialize_event(conn, event_id: str) -> None:
+    """Drop an event's occurrences and expand it again from scratch."""
+    conn.execute("DELETE FROM event_occurrences WHERE event_id = ?", (event_id,))
+    _drop_pending_reminders(conn, event_id)
+    series = conn.execute(f"SELECT {SERIES_COLUMNS} FROM events WHERE id = ?", (event_id,)).fetchone()
+    if series:
+        _expand_series(conn, tuple(series[:-1]) + (None,), int(time.time()))
+
+
+def extend_occurrences(now_ts: Optional[int] = None) -> int:
+    """Roll the occurrence horizon forward, expanding only series that need it.
+
+    Returns the number of series that were (re)expanded. Cheap enough to call
+    every poll: most of the time no series is near its horizon.
+    """
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    threshold = now_ts + OCCURRENCE_HORIZON - OCCURRENCE_REFRESH_SLACK
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(SERIES_TO_EXPAND_SQL, (threshold,)).fetchall()
+            for series in rows:
+                _expand_series(conn, tuple(series), now_ts)
+        if rows:
+            logger.info(f"Expanded occurrences for {len(rows)} event series")
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Error extending event occurrences: {str(e)}", exc_info=True)
+        return 0
+
+
+def _event_insert_params(event_id: str, user_id: str, event_data: Dict[str, Any]) -> tuple:
+    """Build the INSERT_EVENT_SQL parameters, raising on malformed event data."""
+    local_timezone = event_data.get('local_timezone', 'UTC')
+    return (
+        event_id, user_id, 
+        event_data['summary'], 
+        event_data.get('description', ''),
+        event_data['start']['dateTime'],
+        event_data['end']['dateTime'],
+        event_data.get('location', ''),
+        json.dumps(event_data.get('reminders', {'useDefault': True})),
+        json.dumps(event_data.get('recurrence', [])),
+        local_timezone,
+        to_utc_timestamp(event_data['start']['dateTime'], event_data['start'].get('timeZone') or local_timezone),
+        to_utc_timestamp(event_data['end']['dateTime'], event_data['end'].get('timeZone') or local_timezone)
+    )
+
 # Add new functions for calendar operations
 
 def add_event(user_id: str, event_data: Dict[str, Any]) -> Optional[str]:
@@ -115,76 +582,123 @@ def add_event(user_id: str, event_data: Dict[str, Any]) -> Optional[str]:
         event_id = str(uuid.uuid4())
         with get_db_connection() as conn:
             cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO events (
-                    id, user_id, summary, description, start_time, end_time, 
-                    location, reminders, recurrence, local_timezone
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                event_id, user_id, 
-                event_data['summary'], 
-                event_data.get('description', ''),
-                event_data['start']['dateTime'],
-                event_data['end']['dateTime'],
-                event_data.get('location', ''),
-                json.dumps(event_data.get('reminders', {'useDefault': True})),
-                json.dumps(event_data.get('recurrence', [])),
-                event_data.get('local_timezone', 'UTC')
-            ))
+            cur.execute(INSERT_EVENT_SQL, _event_insert_params(event_id, user_id, event_data))
+            _rematerialize_event(conn, event_id)
         return event_id
     except Exception as e:
         logger.error(f"Error adding event to database: {str(e)}", exc_info=True)
         return None
 
-def get_events(user_id: str, time_min: str, time_max: str) -> List[Dict[str, Any]]:
+def add_events_bulk(user_id: str, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert many events with one executemany in a single transaction.
+
+    Returns one result per input event, in order. Malformed events are
+    reported individually and do not stop the rest of the batch; a database
+    error fails every event in the batch since nothing was committed.
+    """
+    results = []
+    rows = []
+    for index, event_data in enumerate(events):
+        try:
+            params = _event_insert_params(str(uuid.uuid4()), user_id, event_data)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            results.append({'index': index, 'success': False, 'event_id': None, 'message': f"Invalid event data: {e}"})
+            continue
+        rows.append(params)
+        results.append({'index': index, 'success': True, 'event_id': params[0], 'message': None})
+
+    if rows:
+        try:
+            with get_db_connection() as conn:
+                conn.executemany(INSERT_EVENT_SQL, rows)
+                for params in rows:
+                    _rematerialize_event(conn, params[0])
+        except Exception as e:
+            logger.error(f"Error bulk adding events to database: {str(e)}", exc_info=True)
+            for result in results:
+                if result['success']:
+                    result.update(success=False, event_id=None, message=f"Database error: {e}")
+    return results
+
+def iter_events(user_id: str, start_ts: int = MIN_TIMESTAMP, end_ts: int = MAX_TIMESTAMP,
+                batch_size: int = 500):
+    """Yield the user's events overlapping [start_ts, end_ts) as EventRecords.
+
+    Rows are pulled from the cursor in batches on a dedicated connection, so
+    memory stays constant however large the calendar is. The generator may be
+    advanced from different threads (e.g. a streaming HTTP response).
+    """
+    conn = _open_connection(DB_FILE, track=False)
+    try:
+        cur = conn.cursor()
+        cur.row_factory = EventRecord.from_row
+        cur.execute(GET_EVENTS_SQL, (user_id, start_ts, end_ts))
+        while True:
+            records = cur.fetchmany(batch_size)
+            if not records:
+                break
+            yield from records
+    finally:
+        conn.close()
+
+def get_events_overlapping(user_id: str, start_ts: int, end_ts: int) -> List[EventRecord]:
+    """Return the user's event occurrences overlapping [start_ts, end_ts), ordered by start.
+
+    Recurring events are returned once per occurrence, with start_time/end_time
+    and start_ts/end_ts set to that occurrence.
+    """
     try:
         with get_db_connection() as conn:
             cur = conn.cursor()
-            cur.execute("""
-                SELECT id, user_id, summary, description, start_time, end_time, 
-                       location, reminders, recurrence, local_timezone
-                FROM events 
-                WHERE user_id = ? AND start_time >= ? AND end_time <= ?
-                ORDER BY start_time ASC
-            """, (user_id, time_min, time_max))
-            
-            events = []
-            for row in cur.fetchall():
-                event = {
-                    'id': row[0],
-                    'user_id': row[1],
-                    'summary': row[2],
-                    'description': row[3],
-                    'start_time': row[4],
-                    'end_time': row[5],
-                    'location': row[6],
-                    'reminders': row[7],
-                    'recurrence': row[8],
-                    'local_timezone': row[9]
-                }
-                events.append(event)
-            
-            return events
+            cur.row_factory = EventRecord.from_row
+            cur.execute(GET_OCCURRENCES_SQL, (user_id, start_ts, end_ts))
+            return cur.fetchall()
     except Exception as e:
         logger.error(f"Error fetching events from database: {str(e)}", exc_info=True)
         return []
 
+def get_events(user_id: str, time_min: str, time_max: str) -> List[EventRecord]:
+    """Return the user's events overlapping the ISO time window [time_min, time_max)."""
+    return get_events_overlapping(user_id, to_utc_timestamp(time_min), to_utc_timestamp(time_max))
+
 # ... (existing imports and setup)
 
 def update_event(event_id: str, event_data: Dict[str, Any]) -> bool:
     try:
         with get_db_connection() as conn:
             cur = conn.cursor()
+            stored = cur.execute(
+                "SELECT start_time, end_time, recurrence, local_timezone, reminders FROM events WHERE id = ?",
+                (event_id,)).fetchone()
+            if stored is None:
+                return False
+            stored = dict(zip(('start_time', 'end_time', 'recurrence', 'local_timezone', 'reminders'), stored))
+            changed = {key for key, value in event_data.items() if key in stored and value != stored[key]}
+
+            # Keep the UTC epoch columns in step with new times, reading the
+            # stored timezone and the other stored time when not given
+            event_data = dict(event_data)
+            if changed & {'start_time', 'end_time', 'local_timezone'}:
+                timezone = event_data.get('local_timezone') or stored['local_timezone'] or 'UTC'
+                for field in ('start', 'end'):
+                    event_data[f'{field}_ts'] = to_utc_timestamp(
+                        event_data.get(f'{field}_time', stored[f'{field}_time']), timezone)
             
             # Construct the SQL query dynamically based on the provided event_data
             set_clauses = ', '.join([f"{key} = ?" for key in event_data.keys()])
-            query = f"UPDATE events SET {set_clauses} WHERE id = ?"
+            query = f"UPDATE events SET {set_clauses}, version = version + 1 WHERE id = ?"
             
             # Prepare the values for the query
             values = list(event_data.values()) + [event_id]
             
             cur.execute(query, values)
-            return cur.rowcount > 0
+            updated = cur.rowcount > 0
+            # Only a real change of timing invalidates occurrences and pending reminders
+            if updated and changed & {'start_time', 'end_time', 'recurrence', 'local_timezone'}:
+                _rematerialize_event(conn, event_id)
+            elif updated and 'reminders' in changed:
+                _drop_pending_reminders(conn, event_id)
+            return updated
     except Exception as e:
         logger.error(f"Error updating event in database: {str(e)}", exc_info=True)
         return False
@@ -193,6 +707,8 @@ def delete_event(event_id: str) -> bool:
     try:
         with get_db_connection() as conn:
             cur = conn.cursor()
+            cur.execute("DELETE FROM event_occurrences WHERE event_id = ?", (event_id,))
+            _drop_pending_reminders(conn, event_id)
             cur.execute("DELETE FROM events WHERE id = ?", (event_id,))
             return cur.rowcount > 0
     except Exception as e:
@@ -203,73 +719,557 @@ def get_event(event_id: str) -> Optional[Dict[str, Any]]:
     try:
         with get_db_connection() as conn:
             cur = conn.cursor()
-            cur.execute("""
-                SELECT id, user_id, summary, description, start_time, end_time, 
-                       location, reminders, recurrence, local_timezone
-                FROM events 
-                WHERE id = ?
-            """, (event_id,))
+            cur.row_factory = EventRecord.from_row
+            cur.execute(GET_EVENT_SQL, (event_id,))
             
-            row = cur.fetchone()
-            if row:
-                return {
-                    'id': row[0],
-                    'user_id': row[1],
-                    'summary': row[2],
-                    'description': row[3],
-                    'start': {'dateTime': row[4], 'timeZone': row[9]},
-                    'end': {'dateTime': row[5], 'timeZone': row[9]},
-                    'location': row[6],
-                    'reminders': json.loads(row[7]) if row[7] else None,
-                    'recurrence': json.loads(row[8]) if row[8] else None,
-                    'local_timezone': row[9]
-                }
+            record = cur.fetchone()
+            if record:
+                return dict(record.to_event(), user_id=record.user_id)
             return None
     except Exception as e:
         logger.error(f"Error fetching event from database: {str(e)}", exc_info=True)
         return None
 
-# ... (other existing functions)
+# Reminder delivery ledger
+
+def _drop_pending_reminders(conn, event_id: str) -> None:
+    """Forget reminders not yet claimed for an event whose times or reminders changed."""
+    conn.execute("DELETE FROM reminder_deliveries WHERE event_id = ? AND status = 'pending'", (event_id,))
+
+def schedule_reminders(reminders: List[Dict[str, Any]]) -> int:
+    """Record upcoming reminders as pending deliveries.
+
+    Each reminder needs event_id, occurrence_ts, reminder_key, user_id and
+    fire_ts. Reminders already in the ledger, whatever their status, are left
+    untouched, so scheduling the same reminder every poll is harmless.
+    Returns the number of new rows.
+    """
+    if not reminders:
+        return 0
+    now_ts = int(time.time())
+    rows = [
+        (r['event_id'], r['occurrence_ts'], r['reminder_key'], r['user_id'], shard_for(r['user_id']), r['fire_ts'], now_ts)
+        for r in reminders
+    ]
+    try:
+        with get_db_connection() as conn:
+            before = conn.total_changes
+            conn.executemany(INSERT_REMINDER_SQL, rows)
+            return conn.total_changes - before
+    except Exception as e:
+        logger.error(f"Error scheduling reminders: {str(e)}", exc_info=True)
+        return 0
+
+def _shards_param(shards: Optional[List[int]]) -> str:
+    return json.dumps(list(range(SHARD_COUNT)) if shards is None else sorted(shards))
+
+def claim_due_reminders(worker_id: str, until_ts: int, now_ts: Optional[int] = None,
+                        shards: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Atomically claim every reminder due by until_ts in the given shards (default: all).
+
+    A reminder is handed to exactly one caller: the claim is a single UPDATE,
+    so concurrent pollers (threads or processes) serialize on the write lock
+    and never see the same row. Claims older than REMINDER_CLAIM_TIMEOUT are
+    treated as abandoned and handed out again. Results are ordered by fire_ts.
+    """
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(CLAIM_DUE_REMINDERS_SQL,
+                                (worker_id, now_ts, until_ts, now_ts - REMINDER_CLAIM_TIMEOUT,
+                                 _shards_param(shards))).fetchall()
+        return sorted((dict(row) for row in rows), key=lambda r: r['fire_ts'])
+    except Exception as e:
+        logger.error(f"Error claiming due reminders: {str(e)}", exc_info=True)
+        return []
+
+def claim_user_reminders(worker_id: str, user_ids: List[str], until_ts: int,
+                         now_ts: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Atomically claim the given users' reminders due by until_ts, like claim_due_reminders."""
+    if not user_ids:
+        return []
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(CLAIM_USER_REMINDERS_SQL,
+                                (worker_id, now_ts, json.dumps(sorted(user_ids)), until_ts,
+                                 now_ts - REMINDER_CLAIM_TIMEOUT)).fetchall()
+        return sorted((dict(row) for row in rows), key=lambda r: r['fire_ts'])
+    except Exception as e:
+        logger.error(f"Error claiming user reminders: {str(e)}", exc_info=True)
+        return []
+
+def settle_missed_reminders(now_ts: Optional[int] = None, shards: Optional[List[int]] = None,
+                            per_user_cap: int = REMINDER_REPLAY_USER_CAP) -> Dict[str, int]:
+    """Decide what to replay among reminders overdue by more than REMINDER_REPLAY_GRACE.
+
+    Overdue reminders in the given shards (default: all), pending or held by
+    an abandoned claim, are marked 'missed' when their occurrence has already
+    started or when they fall beyond each user's per_user_cap soonest
+    occurrences. What is left is due and claimable as usual. Returns counts
+    of reminders left to 'replay' and marked missed as 'stale' or 'capped'.
+    """
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    overdue_ts = now_ts - REMINDER_REPLAY_GRACE
+    params = (overdue_ts, now_ts - REMINDER_CLAIM_TIMEOUT, _shards_param(shards))
+    overdue = """status IN ('pending', 'claimed') AND fire_ts < ? AND (status = 'pending' OR claimed_at < ?)
+                 AND shard IN (SELECT value FROM json_each(?))"""
+    try:
+        with get_db_connection() as conn:
+            stale = conn.execute(f"""
+                UPDATE reminder_deliveries SET status = 'missed', last_error = 'Event already started'
+                WHERE {overdue} AND occurrence_ts <= ?
+            """, params + (now_ts,)).rowcount
+            capped = conn.execute(f"""
+                UPDATE reminder_deliveries SET status = 'missed', last_error = 'Over the catch-up limit'
+                WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY user_id ORDER BY occurrence_ts, reminder_key
+                        ) AS position
+                        FROM reminder_deliveries WHERE {overdue}
+                    ) WHERE position > ?
+                )
+            """, params + (per_user_cap,)).rowcount
+            replay = conn.execute(f"SELECT COUNT(*) FROM reminder_deliveries WHERE {overdue}", params).fetchone()[0]
+        return {'replay': replay, 'stale': stale, 'capped': capped}
+    except Exception as e:
+        logger.error(f"Error settling missed reminders: {str(e)}", exc_info=True)
+        return {'replay': 0, 'stale': 0, 'capped': 0}
+
+def get_pending_reminders(until_ts: int, shards: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Return pending reminders firing by until_ts in the given shards (default: all), earliest first."""
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute("""
+                SELECT event_id, occurrence_ts, reminder_key, user_id, fire_ts
+                FROM reminder_deliveries
+                WHERE status = 'pending' AND fire_ts <= ?
+                  AND shard IN (SELECT value FROM json_each(?))
+                ORDER BY fire_ts
+            """, (until_ts, _shards_param(shards))).fetchall()
+        return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error fetching pending reminders: {str(e)}", exc_info=True)
+        return []
+
+def get_reminder_content(event_id: str, occurrence_ts: int, reminder_key: str, event_version: int) -> Optional[str]:
+    """Return pre-generated reminder text, if any was written for this event version."""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("""
+                SELECT content FROM reminder_content
+                WHERE event_id = ? AND occurrence_ts = ? AND reminder_key = ? AND event_version = ?
+            """, (event_id, occurrence_ts, reminder_key, event_version)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Error fetching reminder content: {str(e)}", exc_info=True)
+        return None
+
+def store_reminder_content(event_id: str, occurrence_ts: int, reminder_key: str,
+                           event_version: int, content: str) -> bool:
+    """Save reminder text for an event version, replacing text for older versions."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO reminder_content (
+                    event_id, occurrence_ts, reminder_key, event_version, content, generated_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            """, (event_id, occurrence_ts, reminder_key, event_version, content, int(time.time())))
+        return True
+    except Exception as e:
+        logger.error(f"Error storing reminder content: {str(e)}", exc_info=True)
+        return False
+
+def prune_reminder_content(before_ts: Optional[int] = None) -> int:
+    """Delete reminder text for occurrences that started before before_ts (default: a day ago)."""
+    before_ts = int(time.time()) - 86400 if before_ts is None else before_ts
+    try:
+        with get_db_connection() as conn:
+            return conn.execute("DELETE FROM reminder_content WHERE occurrence_ts < ?", (before_ts,)).rowcount
+    except Exception as e:
+        logger.error(f"Error pruning reminder content: {str(e)}", exc_info=True)
+        return 0
+
+def complete_reminder(event_id: str, occurrence_ts: int, reminder_key: str,
+                      success: bool, error: Optional[str] = None) -> bool:
+    """Record the outcome of a claimed reminder.
+
+    Failed sends go back to pending until REMINDER_MAX_ATTEMPTS claims have
+    been made, then stay failed.
+    """
+    key = (event_id, occurrence_ts, reminder_key)
+    try:
+        with get_db_connection() as conn:
+            if success:
+                cur = conn.execute("""
+                    UPDATE reminder_deliveries SET status = 'sent', delivered_at = ?, last_error = NULL
+                    WHERE event_id = ? AND occurrence_ts = ? AND reminder_key = ? AND status = 'claimed'
+                """, (int(time.time()),) + key)
+            else:
+                cur = conn.execute("""
+                    UPDATE reminder_deliveries
+                    SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, last_error = ?
+                    WHERE event_id = ? AND occurrence_ts = ? AND reminder_key = ? AND status = 'claimed'
+                """, (REMINDER_MAX_ATTEMPTS, error) + key)
+            return cur.rowcount > 0
+    except Exception as e:
+        logger.error(f"Error recording reminder delivery: {str(e)}", exc_info=True)
+        return False
+
+def prune_reminder_deliveries(before_ts: Optional[int] = None) -> int:
+    """Delete settled ledger rows that fired before before_ts (default: REMINDER_RETENTION ago)."""
+    before_ts = int(time.time()) - REMINDER_RETENTION if before_ts is None else before_ts
+    try:
+        with get_db_connection() as conn:
+            cur = conn.execute(
+                "DELETE FROM reminder_deliveries WHERE status IN ('sent', 'failed', 'missed') AND fire_ts < ?", (before_ts,))
+            return cur.rowcount
+    except Exception as e:
+        logger.error(f"Error pruning reminder deliveries: {str(e)}", exc_info=True)
+        return 0
+
+# Event change log
+
+def record_event_changes(changes: List[Dict[str, Any]]) -> Optional[int]:
+    """Append changes (event_id, user_id, op) to the log; returns the last seq written."""
+    if not changes:
+        return None
+    now_ts = int(time.time())
+    try:
+        with get_db_connection() as conn:
+            conn.executemany(
+                "INSERT INTO event_changes (event_id, user_id, op, changed_at) VALUES (?, ?, ?, ?)",
+                [(c['event_id'], c['user_id'], c['op'], now_ts) for c in changes]
+            )
+            return conn.execute("SELECT MAX(seq) FROM event_changes").fetchone()[0]
+    except Exception as e:
+        logger.error(f"Error recording event changes: {str(e)}", exc_info=True)
+        return None
+
+def get_event_changes(after_seq: int, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Return logged changes with seq > after_seq, oldest first."""
+    try:
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, event_id, user_id, op, changed_at FROM event_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after_seq, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error reading event changes: {str(e)}", exc_info=True)
+        return []
+
+def get_latest_event_change_seq() -> int:
+    with get_db_connection() as conn:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM event_changes").fetchone()[0]
+
+def prune_event_changes(before_ts: Optional[int] = None) -> int:
+    """Delete log rows older than before_ts (default: EVENT_CHANGE_RETENTION ago)."""
+    before_ts = int(time.time()) - EVENT_CHANGE_RETENTION if before_ts is None else before_ts
+    try:
+        with get_db_connection() as conn:
+            return conn.execute("DELETE FROM event_changes WHERE changed_at < ?", (before_ts,)).rowcount
+    except Exception as e:
+        logger.error(f"Error pruning event changes: {str(e)}", exc_info=True)
+        return 0
+
+# Shard leases
+
+def shard_for(key: str) -> int:
+    """Stable shard of a user id or email address, the same in every process."""
+    return zlib.crc32(key.encode('utf-8')) % SHARD_COUNT
+
+def acquire_shard_leases(service: str, owner: str, ttl: int = SHARD_LEASE_TTL,
+                         now_ts: Optional[int] = None) -> Optional[List[int]]:
+    """Renew owner's leases for service and rebalance; returns the shards it now holds.
+
+    Each call is a heartbeat. The owner keeps at most its fair share of
+    SHARD_COUNT among the workers with a live heartbeat, handing any excess
+    back, and claims free or expired shards up to that share, so a new worker
+    gets shards within a couple of renewals and a dead worker's shards are
+    taken over once its leases expire. Runs under BEGIN IMMEDIATE, so
+    concurrent workers never claim the same shard. Returns None if the
+    leases could not be renewed.
+    """
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    expires_at = now_ts + ttl
+    try:
+        with get_db_connection() as conn:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR IGNORE INTO worker_leases (service, shard) VALUES (?, ?)",
+                             [(service, shard) for shard in range(SHARD_COUNT)])
+            conn.execute("DELETE FROM worker_heartbeats WHERE service = ? AND expires_at <= ?", (service, now_ts))
+            conn.execute("INSERT OR REPLACE INTO worker_heartbeats (service, owner, expires_at) VALUES (?, ?, ?)",
+                         (service, owner, expires_at))
+            workers = conn.execute("SELECT COUNT(*) FROM worker_heartbeats WHERE service = ?", (service,)).fetchone()[0]
+            share = -(-SHARD_COUNT // workers)
+
+            conn.execute("UPDATE worker_leases SET expires_at = ? WHERE service = ? AND owner = ? AND expires_at > ?",
+                         (expires_at, service, owner, now_ts))
+            held = [row[0] for row in conn.execute(
+                "SELECT shard FROM worker_leases WHERE service = ? AND owner = ? AND expires_at > ? ORDER BY shard",
+                (service, owner, now_ts))]
+            if len(held) > share:
+                conn.execute(
+                    "UPDATE worker_leases SET owner = NULL, expires_at = 0 WHERE service = ? AND owner = ? AND shard >= ?",
+                    (service, owner, held[share]))
+                held = held[:share]
+            elif len(held) < share:
+                taken = conn.execute("""
+                    UPDATE worker_leases SET owner = ?, expires_at = ?
+                    WHERE service = ? AND shard IN (
+                        SELECT shard FROM worker_leases WHERE service = ? AND expires_at <= ? ORDER BY shard LIMIT ?
+                    )
+                    RETURNING shard
+                """, (owner, expires_at, service, service, now_ts, share - len(held))).fetchall()
+                held = sorted(held + [row[0] for row in taken])
+            return held
+    except Exception as e:
+        logger.error(f"Error acquiring {service} shard leases for {owner}: {str(e)}", exc_info=True)
+        return None
+
+def release_shard_leases(service: str, owner: str) -> int:
+    """Give up owner's leases and heartbeat so other workers take its shards on their next renewal."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM worker_heartbeats WHERE service = ? AND owner = ?", (service, owner))
+            return conn.execute("UPDATE worker_leases SET owner = NULL, expires_at = 0 WHERE service = ? AND owner = ?",
+                                (service, owner)).rowcount
+    except Exception as e:
+        logger.error(f"Error releasing {service} shard leases for {owner}: {str(e)}", exc_info=True)
+        return 0
+
+# Gmail sync cursors
+
+def get_gmail_history_id(mailbox: str, owner: str) -> Optional[str]:
+    """The historyId owner has synced mailbox up to, or None if it has none yet."""
+    try:
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT history_id FROM gmail_sync_state WHERE mailbox = ? AND owner = ?",
+                               (mailbox, owner)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Error reading Gmail sync state for {mailbox}: {str(e)}", exc_info=True)
+        return None
+
+def set_gmail_history_id(mailbox: str, owner: str, history_id: Optional[str]) -> bool:
+    """Store owner's cursor for mailbox (None forgets it), dropping cursors left by departed workers."""
+    now_ts = int(time.time())
+    try:
+        with get_db_connection() as conn:
+            if history_id is None:
+                conn.execute("DELETE FROM gmail_sync_state WHERE mailbox = ? AND owner = ?", (mailbox, owner))
+            else:
+                conn.execute("""
+                    INSERT OR REPLACE INTO gmail_sync_state (mailbox, owner, history_id, updated_at)
+                    VALUES (?, ?, ?, ?)
+                """, (mailbox, owner, str(history_id), now_ts))
+            conn.execute("DELETE FROM gmail_sync_state WHERE mailbox = ? AND updated_at < ?",
+                         (mailbox, now_ts - GMAIL_CURSOR_RETENTION))
+        return True
+    except Exception as e:
+        logger.error(f"Error saving Gmail sync state for {mailbox}: {str(e)}", exc_info=True)
+        return False
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Reduce a phone number to its digits so formatting differences don't matter."""
+    return re.sub(r'\D', '', phone) if phone else phone
+
+
+class UserCache:
+    """Bounded, TTL-limited read-through cache of user rows.
+
+    Rows are stored once, keyed by memgpt_user_id, with secondary maps from
+    email, normalized phone and auth0_user_id back to that key. Entries are
+    evicted least-recently-used once max_size is reached.
+    """
+
+    SECONDARY_FIELDS = ('email', 'phone', 'auth0_user_id')
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()
+        self._index = {field: {} for field in self.SECONDARY_FIELDS}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(field_name: str, field_value: Any) -> Any:
+        return normalize_phone(field_value) if field_name == 'phone' else field_value
+
+    def _drop(self, memgpt_user_id: str) -> None:
+        entry = self._rows.pop(memgpt_user_id, None)
+        if entry is None:
+            return
+        row = entry[0]
+        for field in self.SECONDARY_FIELDS:
+            key = self._key(field, row.get(field))
+            if key and self._index[field].get(key) == memgpt_user_id:
+                del self._index[field][key]
+
+    def get(self, field_name: str, field_value: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if field_name == 'memgpt_user_id':
+                memgpt_user_id = field_value
+            else:
+                memgpt_user_id = self._index[field_name].get(self._key(field_name, field_value))
+            entry = self._rows.get(memgpt_user_id) if memgpt_user_id else None
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._drop(memgpt_user_id)
+                self.misses += 1
+                return None
+            self._rows.move_to_end(memgpt_user_id)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, row: Dict[str, Any]) -> None:
+        memgpt_user_id = row.get('memgpt_user_id')
+        if not memgpt_user_id or self.max_size <= 0:
+            return
+        with self._lock:
+            self._drop(memgpt_user_id)
+            self._rows[memgpt_user_id] = (dict(row), time.monotonic() + self.ttl)
+            for field in self.SECONDARY_FIELDS:
+                key = self._key(field, row.get(field))
+                if key:
+                    self._index[field][key] = memgpt_user_id
+            while len(self._rows) > self.max_size:
+                self._drop(next(iter(self._rows)))
+                self.evictions += 1
+
+    def invalidate(self, field_name: str, field_value: Any) -> None:
+        """Forget whichever cached user a lookup field currently points at."""
+        with self._lock:
+            if field_name == 'memgpt_user_id':
+                self._drop(field_value)
+            elif field_name in self._index:
+                memgpt_user_id = self._index[field_name].get(self._key(field_name, field_value))
+                if memgpt_user_id:
+                    self._drop(memgpt_user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            for index in self._index.values():
+                index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._rows),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+user_cache = UserCache()
+
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for the in-process user cache."""
+    return user_cache.stats()
+
+
+def user_lookup(field_name, field_value):
+    """The users column and value a lookup matches on; phone numbers match by their digits."""
+    if field_name == 'phone':
+        return 'phone_digits', normalize_phone(field_value)
+    return field_name, field_value
+
 def upsert_user(conn, lookup_field, lookup_value, **kwargs):
     try:
         converted_kwargs = {k: str(v) if isinstance(v, uuid.UUID) else v for k, v in kwargs.items()}
         lookup_value = str(lookup_value) if isinstance(lookup_value, uuid.UUID) else lookup_value
+        if 'phone' in converted_kwargs:
+            converted_kwargs['phone_digits'] = normalize_phone(converted_kwargs['phone'])
+        where_column, where_value = user_lookup(lookup_field, lookup_value)
         
         cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM users WHERE {lookup_field} = ?", (lookup_value,))
+        cur.execute(f"SELECT COUNT(*) FROM users WHERE {where_column} = ?", (where_value,))
         exists = cur.fetchone()[0] > 0
         fields = list(converted_kwargs.keys())
         values = list(converted_kwargs.values())
 
         if exists:
             updates = ', '.join(f"{k} = ?" for k in fields)
-            sql = f"UPDATE users SET {updates} WHERE {lookup_field} = ?"
-            params = values + [lookup_value]
+            sql = f"UPDATE users SET {updates} WHERE {where_column} = ?"
+            params = values + [where_value]
             cur.execute(sql, params)
         else:
+            if lookup_field == 'phone' and 'phone_digits' not in converted_kwargs:
+                fields.append('phone_digits')
+                values.append(where_value)
             fields_str = ', '.join(fields)
-            placeholders = ', '.join('?' * len(kwargs))
+            placeholders = ', '.join('?' * len(fields))
             sql = f"INSERT INTO users ({lookup_field}, {fields_str}) VALUES (?, {placeholders})"
             params = [lookup_value] + values
             cur.execute(sql, params)
 
+        # Pending reminders were planned from the old defaults; the next poll
+        # schedules them again from the new ones.
+        if {'default_reminder_time', 'reminder_method'} & converted_kwargs.keys():
+            cur.execute(
+                f"DELETE FROM reminder_deliveries WHERE status = 'pending' AND user_id IN "
+                f"(SELECT memgpt_user_id FROM users WHERE {where_column} = ?)",
+                (where_value,)
+            )
+
+        # Drop every cached row this write can affect, including rows that
+        # currently own a lookup value being reassigned to this user. Again
+        # once the transaction ends, in case a reader on another connection
+        # cached the old row before the commit.
+        def invalidate():
+            user_cache.invalidate(lookup_field, lookup_value)
+            for field, value in converted_kwargs.items():
+                if field in USER_LOOKUP_FIELDS:
+                    user_cache.invalidate(field, value)
+
+        invalidate()
+        after_transaction(invalidate)
+
         logger.info('User upserted successfully.')
     except Exception as e:
         logger.error(f"Database error during upsert: {e}")
         raise
 
 def get_user_data_by_field(field_name, field_value):
-    """Retrieve user data by a specified field and value."""
+    """Retrieve user data by a specified field and value.
+
+    Lookups on USER_LOOKUP_FIELDS are served from user_cache when possible.
+    """
+    cacheable = field_name in USER_LOOKUP_FIELDS
+    if cacheable:
+        cached = user_cache.get(field_name, field_value)
+        if cached is not None:
+            return cached
     with get_db_connection() as conn:
         cur = conn.cursor()
-        sql = f"SELECT * FROM users WHERE {field_name} = ?"
-        cur.execute(sql, (field_value,))
+        column, value = user_lookup(field_name, field_value)
+        sql = f"SELECT * FROM users WHERE {column} = ?"
+        cur.execute(sql, (value,))
         result = cur.fetchone()
-        return dict(result) if result else None
+        if not result:
+            return None
+        user_data = dict(result)
+        if cacheable:
+            user_cache.put(user_data)
+        return user_data
 
 def get_active_users():
-    """Retrieve all active users (users with memgpt_user_id)."""
+    """Retrieve all active users (users with memgpt_user_id) and warm the user cache."""
     with get_db_connection() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM users WHERE memgpt_user_id IS NOT NULL")
-        return [dict(row) for row in cur.fetchall()]
+        users = [dict(row) for row in cur.fetchall()]
+    for user in users:
+        user_cache.put(user)
+    return users
@@ -0,0 +1,88 @@
+# ella_dbo/event_feed.py
+"""Change feed for calendar event writes.
+
+Writers call ``await event_feed.publish(...)`` after an event is created,
+updated or deleted; readers iterate ``event_feed.subscribe()``, which yields
+batches of change dicts (event_id, user_id, op).
+
+With ELLA_EVENT_FEED=sqlite (the default) every change is also appended to
+the event_changes table, and subscribers read from that log, so a reminder
+service running in another process sees the API's writes within
+ELLA_EVENT_FEED_POLL_INTERVAL seconds. Subscribers in the publishing process
+are woken immediately instead of waiting for the next read. With
+ELLA_EVENT_FEED=local changes only reach subscribers in the same process.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Set
+
+from ella_dbo import async_db_manager
+
+logger = logging.getLogger(__name__)
+
+EVENT_FEED_MODE = os.getenv("ELLA_EVENT_FEED", "sqlite")
+EVENT_FEED_POLL_INTERVAL = float(os.getenv("ELLA_EVENT_FEED_POLL_INTERVAL", "2"))
+LOG_BATCH_SIZE = 1000
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+class EventChangeFeed:
+    def __init__(self, durable: bool = EVENT_FEED_MODE == 'sqlite', poll_interval: float = EVENT_FEED_POLL_INTERVAL):
+        self.durable = durable
+        self.poll_interval = poll_interval
+        self._queues: Set[asyncio.Queue] = set()
+
+    async def publish(self, changes: List[Dict[str, Any]]) -> None:
+        """Publish changes; failures are logged, never raised into the write path."""
+        if not changes:
+            return
+        if self.durable:
+            await async_db_manager.record_event_changes(changes)
+        for queue in self._queues:
+            queue.put_nowait(changes)
+
+    async def publish_change(self, event_id: str, user_id: str, op: str) -> None:
+        await self.publish([{'event_id': event_id, 'user_id': user_id, 'op': op}])
+
+    async def subscribe(self) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield batches of changes published after the subscription started."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues.add(queue)
+        try:
+            if self.durable:
+                async for batch in self._tail_log(queue):
+                    yield batch
+            else:
+                while True:
+                    batch = list(await queue.get())
+                    while not queue.empty():
+                        batch.extend(queue.get_nowait())
+                    yield batch
+        finally:
+            self._queues.discard(queue)
+
+    async def _tail_log(self, queue: asyncio.Queue) -> AsyncIterator[List[Dict[str, Any]]]:
+        last_seq = await async_db_manager.get_latest_event_change_seq()
+        while True:
+            try:
+                # Local publishes only wake the reader early; the log is the source
+                await asyncio.wait_for(queue.get(), self.poll_interval)
+                while not queue.empty():
+                    queue.get_nowait()
+            except asyncio.TimeoutError:
+                pass
+            while True:
+                changes = await async_db_manager.get_event_changes(last_seq, LOG_BATCH_SIZE)
+                if not changes:
+                    break
+                last_seq = changes[-1]['seq']
+                yield changes
+                if len(changes) < LOG_BATCH_SIZE:
+                    break
+
+
+event_feed = EventChangeFeed()
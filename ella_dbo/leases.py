@@ -0,0 +1,84 @@
+# ella_dbo/leases.py
+"""Shard leases that split background polling across worker processes.
+
+Users (and mail senders) map to one of db_manager.SHARD_COUNT shards by a
+stable hash. A ShardLeases instance renews this worker's leases for one
+service every renew_interval seconds (see db_manager.acquire_shard_leases),
+and pollers skip anything whose shard it does not hold. Adding a worker
+moves shards to it within a couple of renewals; a worker that dies stops
+renewing and its shards are taken over once SHARD_LEASE_TTL runs out.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, FrozenSet, List, Optional, Set
+
+from ella_dbo import async_db_manager
+from ella_dbo.db_manager import SHARD_LEASE_TTL, shard_for
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in lease rows and on the reminders it claims.
+WORKER_ID = os.getenv("ELLA_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+RebalanceCallback = Callable[[Set[int], Set[int]], Awaitable[None]]
+
+
+class ShardLeases:
+    def __init__(self, service: str, owner: str = WORKER_ID, ttl: int = SHARD_LEASE_TTL,
+                 renew_interval: Optional[float] = None):
+        self.service = service
+        self.owner = owner
+        self.ttl = ttl
+        self.renew_interval = renew_interval or ttl / 3
+        self._held: FrozenSet[int] = frozenset()
+        self._valid_until = 0.0
+
+    @property
+    def shards(self) -> List[int]:
+        """Shards this worker may work on right now; empty once the leases lapse unrenewed."""
+        if time.time() >= self._valid_until:
+            return []
+        return sorted(self._held)
+
+    def owns_shard(self, shard: int) -> bool:
+        return shard in self._held and time.time() < self._valid_until
+
+    def owns(self, key: str) -> bool:
+        """Whether this worker handles the user id or email address key."""
+        return self.owns_shard(shard_for(key))
+
+    async def renew(self):
+        """Renew and rebalance the leases; returns (gained, lost) shard sets."""
+        started = time.time()
+        held = await async_db_manager.acquire_shard_leases(self.service, self.owner)
+        if held is None:
+            # Keep working the current shards until their leases run out
+            return set(), set()
+        previous = set(self.shards)
+        self._held = frozenset(held)
+        self._valid_until = started + self.ttl
+        gained, lost = self._held - previous, previous - self._held
+        if gained or lost:
+            logger.info(f"{self.service} worker {self.owner} now holds {len(self._held)} shard(s) "
+                        f"(+{len(gained)} -{len(lost)})")
+        return gained, lost
+
+    async def run(self, on_change: Optional[RebalanceCallback] = None) -> None:
+        """Renew every renew_interval seconds, calling on_change(gained, lost) when the shards move."""
+        while True:
+            try:
+                gained, lost = await self.renew()
+                if on_change and (gained or lost):
+                    await on_change(gained, lost)
+            except Exception as e:
+                logger.error(f"Error renewing {self.service} shard leases: {str(e)}", exc_info=True)
+            await asyncio.sleep(self.renew_interval)
+
+    async def release(self) -> None:
+        """Hand the shards back so other workers pick them up on their next renewal."""
+        self._held = frozenset()
+        self._valid_until = 0.0
+        await async_db_manager.release_shard_leases(self.service, self.owner)
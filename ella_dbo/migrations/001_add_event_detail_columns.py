@@ -0,0 +1,11 @@
+# File: ella_dbo/migrations/001_add_event_detail_columns.py
+#
+# Columns added to events after the first deployments (formerly the
+# standalone migration.py / migration2.py scripts).
+
+def migrate(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(events)").fetchall()]
+    for column in ('local_timezone', 'location', 'reminders', 'recurrence'):
+        if column not in columns:
+            print(f"Adding {column} column to events table...")
+            conn.execute(f"ALTER TABLE events ADD COLUMN {column} TEXT")
@@ -0,0 +1,37 @@
+# File: ella_dbo/migrations/002_add_lookup_indexes.py
+#
+# Index the columns used by get_user_data_by_field and get_events so lookups
+# no longer scan the whole users/events tables.
+
+UNIQUE_USER_COLUMNS = ('auth0_user_id', 'memgpt_user_id')
+
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_auth0_user_id ON users (auth0_user_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_memgpt_user_id ON users (memgpt_user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)",
+    "CREATE INDEX IF NOT EXISTS idx_users_phone ON users (phone)",
+    "CREATE INDEX IF NOT EXISTS idx_events_user_start_end ON events (user_id, start_time, end_time)",
+]
+
+
+def check_unique_users(conn):
+    """Refuse to build the unique indexes over duplicate users, naming the rows to merge."""
+    problems = []
+    for column in UNIQUE_USER_COLUMNS:
+        duplicates = conn.execute(
+            f"SELECT {column}, GROUP_CONCAT(id) FROM users WHERE {column} IS NOT NULL "
+            f"GROUP BY {column} HAVING COUNT(*) > 1"
+        ).fetchall()
+        problems.extend(f"{column}={value!r} (users.id {ids})" for value, ids in duplicates)
+    if problems:
+        raise RuntimeError(
+            "Cannot add unique user indexes: users share " + "; ".join(problems) + ". "
+            "Merge or delete the duplicate rows (keep one id per value), then restart to rerun migration 002."
+        )
+
+
+def migrate(conn):
+    check_unique_users(conn)
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.execute("PRAGMA optimize")
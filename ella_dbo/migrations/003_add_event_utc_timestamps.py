@@ -0,0 +1,45 @@
+# File: ella_dbo/migrations/003_add_event_utc_timestamps.py
+#
+# Store event start/end as UTC epoch seconds so get_events can run a numeric
+# overlap query instead of comparing ISO strings with mixed offsets. The
+# string (user_id, start_time, end_time) index from 002 is dropped, since no
+# query uses it any more.
+
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def _to_utc_timestamp(value, tz_name):
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        try:
+            dt = dt.replace(tzinfo=ZoneInfo(tz_name or 'UTC'))
+        except (ZoneInfoNotFoundError, ValueError):
+            dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def migrate(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(events)").fetchall()]
+    for column in ('start_ts', 'end_ts'):
+        if column not in columns:
+            print(f"Adding {column} column to events table...")
+            conn.execute(f"ALTER TABLE events ADD COLUMN {column} INTEGER")
+
+    rows = conn.execute(
+        "SELECT id, start_time, end_time, local_timezone FROM events WHERE start_ts IS NULL OR end_ts IS NULL"
+    ).fetchall()
+    updates = []
+    for event_id, start_time, end_time, local_timezone in rows:
+        try:
+            updates.append((
+                _to_utc_timestamp(start_time, local_timezone),
+                _to_utc_timestamp(end_time, local_timezone),
+                event_id,
+            ))
+        except (TypeError, ValueError) as e:
+            print(f"Skipping event {event_id} with unparseable times: {e}")
+    conn.executemany("UPDATE events SET start_ts = ?, end_ts = ? WHERE id = ?", updates)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user_end_start ON events (user_id, end_ts, start_ts)")
+    conn.execute("DROP INDEX IF EXISTS idx_events_user_start_end")
@@ -0,0 +1,23 @@
+# File: ella_dbo/migrations/004_add_event_occurrences.py
+#
+# Materialized occurrences for recurring events. Rows are filled lazily by
+# db_manager.extend_occurrences(), which picks up every event whose
+# occurrences_until is still NULL after this migration.
+
+def migrate(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(events)").fetchall()]
+    if 'occurrences_until' not in columns:
+        print("Adding occurrences_until column to events table...")
+        conn.execute("ALTER TABLE events ADD COLUMN occurrences_until INTEGER")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS event_occurrences (
+        event_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        PRIMARY KEY (event_id, start_ts),
+        FOREIGN KEY (event_id) REFERENCES events (id)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_occurrences_user_end_start ON event_occurrences (user_id, end_ts, start_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_occurrences_until ON events (occurrences_until)")
@@ -0,0 +1,25 @@
+# File: ella_dbo/migrations/005_add_reminder_deliveries.py
+#
+# Ledger of reminder deliveries, one row per (event, occurrence, reminder).
+# The reminder poller claims due rows from it in a single UPDATE, so the
+# (status, fire_ts) index is what keeps each poll cheap.
+
+def migrate(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reminder_deliveries (
+        event_id TEXT NOT NULL,
+        occurrence_ts INTEGER NOT NULL,
+        reminder_key TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        fire_ts INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_by TEXT,
+        claimed_at INTEGER,
+        delivered_at INTEGER,
+        last_error TEXT,
+        created_at INTEGER NOT NULL,
+        PRIMARY KEY (event_id, occurrence_ts, reminder_key)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_status_fire ON reminder_deliveries (status, fire_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_user_status ON reminder_deliveries (user_id, status)")
@@ -0,0 +1,16 @@
+# File: ella_dbo/migrations/006_add_event_changes.py
+#
+# Append-only log of event writes, tailed by other processes (the reminder
+# service) through ella_dbo.event_feed. AUTOINCREMENT keeps seq values from
+# being reused after old rows are pruned, so a reader's cursor stays valid.
+
+def migrate(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS event_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        op TEXT NOT NULL,
+        changed_at INTEGER NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_event_changes_changed_at ON event_changes (changed_at)")
@@ -0,0 +1,23 @@
+# File: ella_dbo/migrations/007_add_event_versions_and_reminder_content.py
+#
+# events.version is bumped by every update, so anything derived from an event
+# (pre-generated reminder text, for one) can tell when it has gone stale.
+# reminder_content holds that text per occurrence and reminder, tagged with the
+# event version it was written for.
+
+def migrate(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(events)").fetchall()]
+    if 'version' not in columns:
+        print("Adding version column to events table...")
+        conn.execute("ALTER TABLE events ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS reminder_content (
+        event_id TEXT NOT NULL,
+        occurrence_ts INTEGER NOT NULL,
+        reminder_key TEXT NOT NULL,
+        event_version INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        generated_at INTEGER NOT NULL,
+        PRIMARY KEY (event_id, occurrence_ts, reminder_key)
+    )""")
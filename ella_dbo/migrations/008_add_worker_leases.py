@@ -0,0 +1,38 @@
+# File: ella_dbo/migrations/008_add_worker_leases.py
+#
+# Shard leases for background pollers running in several processes. Each
+# worker heartbeats into worker_heartbeats and holds a lease per shard in
+# worker_leases; reminder_deliveries rows record their user's shard so a
+# worker only claims reminders for the shards it holds.
+
+import zlib
+
+SHARD_COUNT = 64  # must match db_manager.SHARD_COUNT
+
+
+def migrate(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS worker_leases (
+        service TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        owner TEXT,
+        expires_at INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (service, shard)
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS worker_heartbeats (
+        service TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        expires_at INTEGER NOT NULL,
+        PRIMARY KEY (service, owner)
+    )""")
+
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(reminder_deliveries)").fetchall()]
+    if 'shard' not in columns:
+        print("Adding shard column to reminder_deliveries table...")
+        conn.execute("ALTER TABLE reminder_deliveries ADD COLUMN shard INTEGER NOT NULL DEFAULT 0")
+        user_ids = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM reminder_deliveries").fetchall()]
+        conn.executemany(
+            "UPDATE reminder_deliveries SET shard = ? WHERE user_id = ?",
+            [(zlib.crc32(user_id.encode('utf-8')) % SHARD_COUNT, user_id) for user_id in user_ids]
+        )
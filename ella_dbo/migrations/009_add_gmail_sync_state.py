@@ -0,0 +1,15 @@
+# File: ella_dbo/migrations/009_add_gmail_sync_state.py
+#
+# The Gmail poller syncs incrementally from the mailbox historyId it last
+# caught up to; each worker keeps its own cursor, since it only handles the
+# senders in its shards.
+
+def migrate(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS gmail_sync_state (
+        mailbox TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        history_id TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (mailbox, owner)
+    )""")
@@ -0,0 +1,23 @@
+# File: ella_dbo/migrations/010_add_user_phone_digits.py
+#
+# Phone lookups match on the digits of the number, as the user cache does, so
+# '+1 (555) 010-0003' and '15550100003' find the same user whether or not the
+# row is cached. phone_digits is kept in step with phone by upsert_user.
+# idx_users_phone from migration 002 no longer serves any lookup, so it is
+# dropped to save its cost on every write.
+
+import re
+
+
+def migrate(conn):
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(users)").fetchall()]
+    if 'phone_digits' not in columns:
+        print("Adding phone_digits column to users table...")
+        conn.execute("ALTER TABLE users ADD COLUMN phone_digits TEXT")
+    rows = conn.execute("SELECT id, phone FROM users WHERE phone IS NOT NULL").fetchall()
+    conn.executemany(
+        "UPDATE users SET phone_digits = ? WHERE id = ?",
+        [(re.sub(r'\D', '', phone), user_id) for user_id, phone in rows]
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_phone_digits ON users (phone_digits)")
+    conn.execute("DROP INDEX IF EXISTS idx_users_phone")
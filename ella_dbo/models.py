@@ -11,6 +11,7 @@ class Event(BaseModel):
     reminders: Optional[Dict[str, Any]] = None
     recurrence: Optional[List[str]] = None
     local_timezone: Optional[str] = None
+    version: Optional[int] = None
 
 class ConflictInfo(BaseModel):
     message: str
@@ -26,6 +27,22 @@ class ScheduleEventRequest(BaseModel):
     user_id: str
     event: Event
 
+class BulkScheduleEventsRequest(BaseModel):
+    user_id: str
+    events: List[Event]
+
+class BulkEventResult(BaseModel):
+    index: int
+    success: bool
+    event_id: Optional[str] = None
+    message: Optional[str] = None
+
+class BulkEventsResponse(BaseModel):
+    success: bool
+    created: int
+    failed: int
+    results: List[BulkEventResult]
+
 class UpdateEventData(BaseModel):
     summary: Optional[str] = None
     start: Optional[Dict[str, Any]] = None
@@ -49,6 +66,7 @@ class ReminderRequest(BaseModel):
     event_description: Optional[str] = None
     reminder_type: str
     minutes_before: int
+    content: Optional[str] = None  # pre-generated reminder text; generated on demand when absent
 
 class EmailRequest(BaseModel):
     user_id: str = Field(..., description="The unique identifier of the user to whom the email will be sent")
@@ -0,0 +1,98 @@
+# ella_dbo/records.py
+"""Lightweight row types returned by db_manager's hot read paths.
+
+An EventRecord is built straight from the cursor (see EventRecord.from_row)
+with no per-row dict. The reminders/recurrence JSON columns are decoded on
+first access only, and to_event() produces the API's Event shape, so handlers
+can serialize records without building or validating intermediate models.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ella_dbo.recurrence import get_zone, is_recurring
+
+_UNSET = object()
+
+
+class EventRecord:
+    """One event (or one occurrence of a recurring event) as read from SQLite.
+
+    Column order matches db_manager.EVENT_COLUMNS. For recurring events,
+    start_ts/end_ts are the occurrence's own times and start_time/end_time
+    are derived from them in the event's local timezone.
+    """
+
+    __slots__ = ('id', 'user_id', 'summary', 'description', 'stored_start_time', 'stored_end_time',
+                 'location', 'reminders_json', 'recurrence_json', 'local_timezone', 'start_ts', 'end_ts',
+                 'version', '_reminders', '_recurrence')
+
+    def __init__(self, id, user_id, summary, description, start_time, end_time,
+                 location, reminders, recurrence, local_timezone, start_ts, end_ts, version=1):
+        self.id = id
+        self.user_id = user_id
+        self.summary = summary
+        self.description = description
+        self.stored_start_time = start_time
+        self.stored_end_time = end_time
+        self.location = location
+        self.reminders_json = reminders
+        self.recurrence_json = recurrence
+        self.local_timezone = local_timezone
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.version = version
+        self._reminders = _UNSET
+        self._recurrence = _UNSET
+
+    @classmethod
+    def from_row(cls, cursor, row) -> 'EventRecord':
+        """sqlite3 row_factory signature, so cursors yield records directly."""
+        return cls(*row)
+
+    def __repr__(self):
+        return f"EventRecord(id={self.id!r}, summary={self.summary!r}, start_ts={self.start_ts!r})"
+
+    @property
+    def reminders(self) -> Optional[Dict[str, Any]]:
+        if self._reminders is _UNSET:
+            self._reminders = json.loads(self.reminders_json) if self.reminders_json else None
+        return self._reminders
+
+    @property
+    def recurrence(self) -> Optional[List[str]]:
+        if self._recurrence is _UNSET:
+            self._recurrence = json.loads(self.recurrence_json) if self.recurrence_json else None
+        return self._recurrence
+
+    @property
+    def recurring(self) -> bool:
+        return bool(self.recurrence) and is_recurring(self.recurrence)
+
+    @property
+    def start_time(self) -> str:
+        if self.recurring and self.start_ts is not None:
+            return datetime.fromtimestamp(self.start_ts, get_zone(self.local_timezone)).isoformat()
+        return self.stored_start_time
+
+    @property
+    def end_time(self) -> str:
+        if self.recurring and self.end_ts is not None:
+            return datetime.fromtimestamp(self.end_ts, get_zone(self.local_timezone)).isoformat()
+        return self.stored_end_time
+
+    def to_event(self, time_zone: Optional[str] = None) -> Dict[str, Any]:
+        """Shape the record like the API's Event model, ready for JSON encoding."""
+        time_zone = time_zone or self.local_timezone
+        return {
+            'id': self.id,
+            'summary': self.summary,
+            'description': self.description,
+            'start': {'dateTime': self.start_time, 'timeZone': time_zone},
+            'end': {'dateTime': self.end_time, 'timeZone': time_zone},
+            'location': self.location,
+            'reminders': self.reminders,
+            'recurrence': self.recurrence,
+            'local_timezone': self.local_timezone,
+            'version': self.version
+        }
@@ -0,0 +1,125 @@
+# ella_dbo/recurrence.py
+"""RRULE expansion for recurring events.
+
+Rules are expanded on naive wall-clock times in the event's local timezone and
+then localized, so a 9am weekly meeting stays at 9am across DST changes.
+UTC (``Z``) and ``TZID`` values in the rule are converted to that same local
+wall clock first, which sidesteps dateutil's naive/aware comparison errors.
+"""
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil.rrule import rrulestr
+
+logger = logging.getLogger(__name__)
+
+# Safety cap on occurrences produced for one series in one expansion pass.
+MAX_OCCURRENCES_PER_EXPANSION = int(os.getenv("ELLA_MAX_OCCURRENCES_PER_EXPANSION", "2000"))
+
+RULE_PROPERTIES = ('RRULE', 'EXRULE', 'RDATE', 'EXDATE')
+
+_UNTIL_RE = re.compile(r'UNTIL=([0-9T]+Z?)')
+
+
+def get_zone(tz_name: Optional[str]):
+    """Return a tzinfo for tz_name, falling back to UTC when it is unknown."""
+    try:
+        return ZoneInfo(tz_name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {tz_name!r}, using UTC")
+        return timezone.utc
+
+
+def parse_recurrence(recurrence: Any) -> List[str]:
+    """Normalize a stored recurrence value (JSON text or list) to RFC 5545 lines."""
+    if not recurrence:
+        return []
+    if isinstance(recurrence, str):
+        try:
+            recurrence = json.loads(recurrence)
+        except json.JSONDecodeError:
+            recurrence = [recurrence]
+    if not isinstance(recurrence, list):
+        return []
+    return [line for line in recurrence if isinstance(line, str) and line.strip()]
+
+
+def is_recurring(recurrence: Any) -> bool:
+    return any(line.split(':', 1)[0].split(';', 1)[0].upper() in ('RRULE', 'RDATE')
+               for line in parse_recurrence(recurrence))
+
+
+def _to_local_naive(value: str, zone, source_zone=None) -> str:
+    """Rewrite an iCalendar date-time as a naive wall-clock time in zone."""
+    if len(value) == 8:  # DATE only
+        return value
+    if value.endswith('Z'):
+        dt = datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+    else:
+        dt = datetime.strptime(value, '%Y%m%dT%H%M%S')
+        if source_zone is None:
+            return value
+        dt = dt.replace(tzinfo=source_zone)
+    return dt.astimezone(zone).strftime('%Y%m%dT%H%M%S')
+
+
+def _localize_line(line: str, zone) -> Optional[str]:
+    name, _, value = line.partition(':')
+    params = name.split(';')
+    prop = params[0].upper()
+    if prop not in RULE_PROPERTIES:
+        return None
+    if prop in ('RRULE', 'EXRULE'):
+        return _UNTIL_RE.sub(lambda m: 'UNTIL=' + _to_local_naive(m.group(1), zone), line)
+
+    source_zone = None
+    for param in params[1:]:
+        key, _, param_value = param.partition('=')
+        if key.upper() == 'TZID':
+            source_zone = get_zone(param_value)
+    values = ','.join(_to_local_naive(v, zone, source_zone) for v in value.split(','))
+    return f"{prop}:{values}"
+
+
+def _series_start(start_time: str, zone) -> datetime:
+    dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(zone)
+    return dt.replace(tzinfo=None)
+
+
+def expand_occurrences(
+    start_time: str,
+    duration: int,
+    local_timezone: Optional[str],
+    recurrence: Any,
+    window_start_ts: int,
+    window_end_ts: int,
+    limit: int = MAX_OCCURRENCES_PER_EXPANSION,
+) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Expand a series into (start_ts, end_ts) pairs starting in [window_start_ts, window_end_ts).
+
+    Also returns the timestamp the next expansion pass should resume from:
+    window_end_ts normally, just past the last occurrence when the limit was
+    hit, or None once the series has no occurrences left.
+    """
+    zone = get_zone(local_timezone)
+    lines = [line for line in (_localize_line(l, zone) for l in parse_recurrence(recurrence)) if line]
+    rule_set = rrulestr('\n'.join(lines), dtstart=_series_start(start_time, zone), forceset=True)
+
+    after = datetime.fromtimestamp(window_start_ts, zone).replace(tzinfo=None)
+    occurrences = []
+    for local_start in rule_set.xafter(after, inc=True):
+        start_ts = int(local_start.replace(tzinfo=zone).timestamp())
+        if start_ts >= window_end_ts:
+            return occurrences, window_end_ts
+        if len(occurrences) >= limit:
+            logger.warning(f"Recurrence expansion capped at {limit} occurrences")
+            return occurrences, occurrences[-1][0] + 1
+        occurrences.append((start_ts, start_ts + duration))
+    return occurrences, None
@@ -0,0 +1,630 @@
+# ella_dbo/test_db_manager.py
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+# Add the project root to sys.path so ella_dbo resolves when run from anywhere
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from ella_dbo import db_manager, async_db_manager, event_feed
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_FILE", str(tmp_path / "test.db"))
+    db_manager.initialize_database()
+    db_manager.user_cache.clear()
+    yield db_manager
+    db_manager.user_cache.clear()
+    db_manager.close_all_connections()
+
+
+def make_event(summary="Standup", start="2024-08-15T10:00:00+00:00", end="2024-08-15T10:30:00+00:00"):
+    return {
+        "summary": summary,
+        "start": {"dateTime": start, "timeZone": "UTC"},
+        "end": {"dateTime": end, "timeZone": "UTC"},
+        "local_timezone": "UTC",
+    }
+
+
+def test_connection_is_reused_within_thread(db):
+    with db.get_db_connection() as first:
+        pass
+    with db.get_db_connection() as second:
+        pass
+    assert first is second
+
+
+def test_connection_pragmas(db):
+    with db.get_db_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        # synchronous=NORMAL is reported as 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_each_thread_gets_its_own_connection(db):
+    seen = []
+
+    def worker():
+        with db.get_db_connection() as conn:
+            seen.append(conn)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    with db.get_db_connection() as conn:
+        assert conn is not seen[0]
+
+
+def test_nested_blocks_share_one_transaction(db):
+    with pytest.raises(RuntimeError):
+        with db.get_db_connection() as conn:
+            db.upsert_user(conn, "auth0_user_id", "auth0|1", email="a@example.com")
+            with db.get_db_connection():
+                pass
+            raise RuntimeError("abort outer block")
+    assert db.get_user_data_by_field("auth0_user_id", "auth0|1") is None
+
+
+def test_event_roundtrip(db):
+    event_id = db.add_event("user-1", make_event())
+    assert event_id
+    events = db.get_events("user-1", "2024-08-15T00:00:00+00:00", "2024-08-16T00:00:00+00:00")
+    assert [event.id for event in events] == [event_id]
+    assert db.delete_event(event_id)
+    assert db.get_event(event_id) is None
+
+
+def test_close_all_connections_reopens_on_next_use(db):
+    with db.get_db_connection() as before:
+        pass
+    db.close_all_connections()
+    with db.get_db_connection() as after:
+        assert after is not before
+        after.execute("SELECT 1")
+
+
+def explain(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def assert_indexed(plan, allow_sort=False):
+    for detail in plan:
+        # Scanning a json_each parameter list (e.g. the caller's shards) is fine
+        if "VIRTUAL TABLE" in detail:
+            continue
+        assert not detail.startswith("SCAN"), f"query falls back to a table scan: {plan}"
+        if not allow_sort:
+            assert "TEMP B-TREE" not in detail, f"query sorts without an index: {plan}"
+
+
+@pytest.mark.parametrize("field_name", db_manager.USER_LOOKUP_FIELDS)
+def test_user_lookup_uses_index(db, field_name):
+    with db.get_db_connection() as conn:
+        column, value = db.user_lookup(field_name, "x")
+        assert_indexed(explain(conn, f"SELECT * FROM users WHERE {column} = ?", (value,)))
+
+
+# The overlap query can only range-scan one bound, so sorting its (small)
+# result by start time is expected.
+@pytest.mark.parametrize("sql, params, allow_sort", [
+    (db_manager.GET_EVENTS_SQL, ("user-1", 1723680000, 1723766400), True),
+    (db_manager.GET_OCCURRENCES_SQL, ("user-1", 1723680000, 1723766400), True),
+    (db_manager.GET_EVENT_SQL, ("event-1",), False),
+    (db_manager.CLAIM_DUE_REMINDERS_SQL, ("worker", 1723680000, 1723680300, 1723679700, "[0, 1]"), False),
+    (db_manager.CLAIM_USER_REMINDERS_SQL, ("worker", 1723680000, '["user-1"]', 1723680300, 1723679700), False),
+])
+def test_event_queries_use_index(db, sql, params, allow_sort):
+    with db.get_db_connection() as conn:
+        plan = explain(conn, sql, params)
+        assert_indexed(plan, allow_sort=allow_sort)
+        assert any("USING INDEX" in detail or "PRIMARY KEY" in detail for detail in plan)
+
+
+@pytest.mark.asyncio
+async def test_async_event_roundtrip(db):
+    event_id = await async_db_manager.add_event("user-1", make_event())
+    assert await async_db_manager.update_event(event_id, {"summary": "Retro"})
+    event = await async_db_manager.get_event(event_id)
+    assert event["summary"] == "Retro"
+    events = await async_db_manager.get_events("user-1", "2024-08-15T00:00:00+00:00", "2024-08-16T00:00:00+00:00")
+    assert [e.id for e in events] == [event_id]
+    assert await async_db_manager.delete_event(event_id)
+
+
+@pytest.mark.asyncio
+async def test_async_upsert_and_get_user(db):
+    await async_db_manager.upsert_user("auth0_user_id", "auth0|2", memgpt_user_id="m-2", email="b@example.com")
+    user = await async_db_manager.get_user("m-2")
+    assert user["email"] == "b@example.com"
+    assert (await async_db_manager.get_user_data_by_field("email", "b@example.com"))["memgpt_user_id"] == "m-2"
+    assert [u["memgpt_user_id"] for u in await async_db_manager.get_active_users()] == ["m-2"]
+
+
+def seed_user(db, **fields):
+    values = {"memgpt_user_id": "m-3", "email": "c@example.com", "phone": "+1 (555) 010-0003"}
+    values.update(fields)
+    with db.get_db_connection() as conn:
+        db.upsert_user(conn, "auth0_user_id", "auth0|3", **values)
+
+
+def test_string_time_index_is_dropped(db):
+    with db.get_db_connection() as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_events_user_end_start" in indexes
+    assert "idx_events_user_start_end" not in indexes
+
+
+def test_user_cache_serves_primary_and_secondary_lookups(db):
+    seed_user(db)
+    db.get_user_data_by_field("memgpt_user_id", "m-3")
+    before = db.get_user_cache_stats()
+    assert db.get_user_data_by_field("email", "c@example.com")["memgpt_user_id"] == "m-3"
+    assert db.get_user_data_by_field("phone", "15550100003")["memgpt_user_id"] == "m-3"
+    assert db.get_user_data_by_field("auth0_user_id", "auth0|3")["memgpt_user_id"] == "m-3"
+    after = db.get_user_cache_stats()
+    assert after["hits"] - before["hits"] == 3
+    assert after["misses"] == before["misses"]
+
+
+def test_phone_lookup_matches_digits_with_or_without_cache(db):
+    seed_user(db)
+    assert db.get_user_data_by_field("phone", "15550100003")["memgpt_user_id"] == "m-3"
+    db.user_cache.clear()
+    assert db.get_user_data_by_field("phone", "+1 555-010-0003")["memgpt_user_id"] == "m-3"
+    db.user_cache.clear()
+    assert db.get_user_data_by_field("phone", "15550100004") is None
+
+
+def test_phone_digits_migration_backfills_existing_users(db):
+    seed_user(db)
+    with db.get_db_connection() as conn:
+        conn.execute("UPDATE users SET phone_digits = NULL")
+        db._load_migration("010_add_user_phone_digits.py").migrate(conn)
+        assert conn.execute("SELECT phone_digits FROM users").fetchone()[0] == "15550100003"
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_users_phone_digits" in indexes
+    assert "idx_users_phone" not in indexes
+
+
+def test_upsert_invalidates_cached_user(db):
+    seed_user(db)
+    assert db.get_user_data_by_field("memgpt_user_id", "m-3")["email"] == "c@example.com"
+    seed_user(db, email="new@example.com")
+    assert db.get_user_data_by_field("memgpt_user_id", "m-3")["email"] == "new@example.com"
+    assert db.get_user_data_by_field("email", "c@example.com") is None
+
+
+def test_upsert_invalidates_again_after_commit(db):
+    seed_user(db)
+    with db.get_db_connection() as conn:
+        db.upsert_user(conn, "auth0_user_id", "auth0|3", email="new@example.com")
+        # A reader on another connection still sees, and caches, the old row
+        reader = threading.Thread(target=db.get_user_data_by_field, args=("memgpt_user_id", "m-3"))
+        reader.start()
+        reader.join()
+        assert db.user_cache.get("memgpt_user_id", "m-3")["email"] == "c@example.com"
+    assert db.get_user_data_by_field("memgpt_user_id", "m-3")["email"] == "new@example.com"
+
+
+def test_user_cache_returns_copies(db):
+    seed_user(db)
+    db.get_user_data_by_field("memgpt_user_id", "m-3")["email"] = "mutated"
+    assert db.get_user_data_by_field("memgpt_user_id", "m-3")["email"] == "c@example.com"
+
+
+def test_user_cache_ttl_and_size_bounds():
+    cache = db_manager.UserCache(max_size=2, ttl=60)
+    for n in range(3):
+        cache.put({"memgpt_user_id": f"m-{n}", "email": f"{n}@example.com"})
+    assert cache.get("memgpt_user_id", "m-0") is None
+    assert cache.get("email", "0@example.com") is None
+    assert cache.get("email", "2@example.com")["memgpt_user_id"] == "m-2"
+    assert cache.stats()["evictions"] == 1
+
+    expired = db_manager.UserCache(max_size=2, ttl=-1)
+    expired.put({"memgpt_user_id": "m-0"})
+    assert expired.get("memgpt_user_id", "m-0") is None
+
+
+def test_get_events_uses_overlap_across_offsets(db):
+    straddling = db.add_event("user-1", make_event("Straddles", "2024-08-14T23:30:00+00:00", "2024-08-15T00:30:00+00:00"))
+    # 17:00 in Los Angeles is 00:00 UTC the next day, which sorts before
+    # "2024-08-15T10" as a string but is inside the window numerically.
+    offset = db.add_event("user-1", make_event("Offset", "2024-08-15T17:00:00-07:00", "2024-08-15T18:00:00-07:00"))
+    db.add_event("user-1", make_event("Outside", "2024-08-14T10:00:00+00:00", "2024-08-14T11:00:00+00:00"))
+    events = db.get_events("user-1", "2024-08-15T00:00:00+00:00", "2024-08-16T00:30:00+00:00")
+    assert [event.id for event in events] == [straddling, offset]
+    assert events[1].start_ts == db.to_utc_timestamp("2024-08-16T00:00:00+00:00")
+
+
+def test_update_event_refreshes_utc_columns(db):
+    event_id = db.add_event("user-1", make_event())
+    db.update_event(event_id, {"start_time": "2024-08-20T09:00:00", "end_time": "2024-08-20T10:00:00",
+                               "local_timezone": "America/Los_Angeles"})
+    events = db.get_events("user-1", "2024-08-20T16:00:00+00:00", "2024-08-20T17:00:00+00:00")
+    assert [event.id for event in events] == [event_id]
+
+
+def test_update_event_keeps_stored_timezone_and_only_rematerializes_on_real_changes(db):
+    event_id = db.add_event("user-1", dict(make_event(start="2024-08-15T09:00:00", end="2024-08-15T10:00:00"),
+                                           local_timezone="America/Los_Angeles"))
+    db.schedule_reminders([make_reminder(event_id=event_id, occurrence_ts=db.to_utc_timestamp("2024-08-15T16:00:00Z"))])
+
+    def pending():
+        with db.get_db_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM reminder_deliveries WHERE status = 'pending'").fetchone()[0]
+
+    # The API resends the unchanged timezone with every update
+    assert db.update_event(event_id, {"summary": "Retro", "local_timezone": "America/Los_Angeles"})
+    assert pending() == 1
+
+    assert db.update_event(event_id, {"start_time": "2024-08-15T09:30:00"})
+    event = db.get_events("user-1", "2024-08-15T16:00:00Z", "2024-08-15T17:00:00Z")[0]
+    assert event.start_ts == db.to_utc_timestamp("2024-08-15T16:30:00Z")
+    assert event.end_ts == db.to_utc_timestamp("2024-08-15T17:00:00Z")
+    assert pending() == 0
+    assert not db.update_event("missing", {"summary": "Nothing"})
+
+
+def test_timestamp_migration_backfills_existing_rows(db):
+    with db.get_db_connection() as conn:
+        conn.execute(
+            "INSERT INTO events (id, user_id, summary, start_time, end_time, local_timezone) VALUES (?, ?, ?, ?, ?, ?)",
+            ("legacy", "user-1", "Legacy", "2024-08-15T09:00:00", "2024-08-15T10:00:00", "America/Los_Angeles"))
+        db._load_migration("003_add_event_utc_timestamps.py").migrate(conn)
+    db.extend_occurrences()
+    event = db.get_events("user-1", "2024-08-15T16:00:00Z", "2024-08-15T16:30:00Z")[0]
+    assert event.id == "legacy"
+    assert event.end_ts - event.start_ts == 3600
+
+
+def test_add_events_bulk_reports_per_item_results(db):
+    events = [
+        make_event("One", "2024-08-15T09:00:00+00:00", "2024-08-15T10:00:00+00:00"),
+        {"summary": "Missing times"},
+        make_event("Two", "2024-08-15T11:00:00+00:00", "2024-08-15T12:00:00+00:00"),
+    ]
+    results = db.add_events_bulk("user-1", events)
+    assert [result["success"] for result in results] == [True, False, True]
+    assert results[1]["event_id"] is None and "start" in results[1]["message"]
+    stored = db.get_events("user-1", "2024-08-15T00:00:00+00:00", "2024-08-16T00:00:00+00:00")
+    assert [event.id for event in stored] == [results[0]["event_id"], results[2]["event_id"]]
+
+
+def test_iter_events_streams_in_batches(db):
+    db.add_events_bulk("user-1", [
+        make_event(f"Event {n}", f"2024-08-{10 + n}T09:00:00+00:00", f"2024-08-{10 + n}T10:00:00+00:00")
+        for n in range(5)
+    ])
+    exported = list(db.iter_events("user-1", batch_size=2))
+    assert [event.summary for event in exported] == [f"Event {n}" for n in range(5)]
+    assert exported[0].to_event()["start"] == {"dateTime": "2024-08-10T09:00:00+00:00", "timeZone": "UTC"}
+    windowed = db.iter_events("user-1", db.to_utc_timestamp("2024-08-12T00:00:00Z"), db.to_utc_timestamp("2024-08-13T00:00:00Z"))
+    assert [event.summary for event in windowed] == ["Event 2"]
+
+
+def test_event_records_decode_json_lazily(db):
+    event = make_event()
+    event["reminders"] = {"useDefault": False, "overrides": [{"method": "email", "minutes": 10}]}
+    db.add_event("user-1", event)
+    [record] = db.get_events("user-1", "2024-08-15T00:00:00+00:00", "2024-08-16T00:00:00+00:00")
+    assert isinstance(record, db.EventRecord)
+    assert record.reminders["overrides"][0]["minutes"] == 10
+    assert record.reminders is record.reminders
+    assert record.to_event("America/New_York") == {
+        "id": record.id,
+        "summary": "Standup",
+        "description": "",
+        "start": {"dateTime": "2024-08-15T10:00:00+00:00", "timeZone": "America/New_York"},
+        "end": {"dateTime": "2024-08-15T10:30:00+00:00", "timeZone": "America/New_York"},
+        "location": "",
+        "reminders": event["reminders"],
+        "recurrence": [],
+        "local_timezone": "UTC",
+        "version": 1,
+    }
+
+
+def make_series(rule, start="2024-08-15T09:00:00-07:00", end="2024-08-15T10:00:00-07:00"):
+    event = make_event("Weekly sync", start, end)
+    event["local_timezone"] = "America/Los_Angeles"
+    event["start"]["timeZone"] = event["end"]["timeZone"] = "America/Los_Angeles"
+    event["recurrence"] = [rule]
+    return event
+
+
+def test_recurring_event_returns_each_occurrence(db, monkeypatch):
+    monkeypatch.setattr(db.time, "time", lambda: db.to_utc_timestamp("2024-08-01T00:00:00Z"))
+    event_id = db.add_event("user-1", make_series("RRULE:FREQ=WEEKLY;COUNT=4"))
+    events = db.get_events("user-1", "2024-08-20T00:00:00Z", "2024-09-30T00:00:00Z")
+    assert [event.id for event in events] == [event_id] * 3
+    assert [event.start_time for event in events] == [
+        "2024-08-22T09:00:00-07:00", "2024-08-29T09:00:00-07:00", "2024-09-05T09:00:00-07:00"]
+    assert all(event.recurring for event in events)
+
+
+def test_updating_series_rematerializes_occurrences(db, monkeypatch):
+    monkeypatch.setattr(db.time, "time", lambda: db.to_utc_timestamp("2024-08-01T00:00:00Z"))
+    event_id = db.add_event("user-1", make_series("RRULE:FREQ=WEEKLY;COUNT=4"))
+    db.update_event(event_id, {"recurrence": '["RRULE:FREQ=WEEKLY;COUNT=2"]'})
+    events = db.get_events("user-1", "2024-08-01T00:00:00Z", "2024-12-31T00:00:00Z")
+    assert len(events) == 2
+    db.delete_event(event_id)
+    assert db.get_events("user-1", "2024-08-01T00:00:00Z", "2024-12-31T00:00:00Z") == []
+
+
+def test_extend_occurrences_only_touches_series_near_horizon(db, monkeypatch):
+    now = db.to_utc_timestamp("2024-08-01T00:00:00Z")
+    monkeypatch.setattr(db.time, "time", lambda: now)
+    db.add_event("user-1", make_series("RRULE:FREQ=DAILY"))
+    db.add_event("user-1", make_event("One-off", "2024-08-02T09:00:00+00:00", "2024-08-02T10:00:00+00:00"))
+    assert db.extend_occurrences(now) == 0
+
+    later = now + 30 * 86400
+    assert db.extend_occurrences(later) == 1
+    horizon_end = later + db.OCCURRENCE_HORIZON
+    events = db.get_events_overlapping("user-1", horizon_end - 2 * 86400, horizon_end)
+    assert len(events) == 2
+
+
+def test_migrations_are_recorded_and_skipped_when_current(db, monkeypatch):
+    with db.get_db_connection() as conn:
+        versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, _ in db._discover_migrations()]
+
+    def fail_if_loaded(filename):
+        raise AssertionError(f"{filename} should not run again")
+
+    monkeypatch.setattr(db, "_load_migration", fail_if_loaded)
+    assert db.run_migrations() == 0
+
+
+def test_failed_migration_rolls_back(db, monkeypatch, tmp_path):
+    migrations_dir = tmp_path / "migrations"
+    migrations_dir.mkdir()
+    (migrations_dir / "999_broken.py").write_text(
+        "def migrate(conn):\n"
+        "    conn.execute('CREATE TABLE half_done (id INTEGER)')\n"
+        "    raise RuntimeError('boom')\n"
+    )
+    monkeypatch.setattr(db, "MIGRATIONS_DIR", str(migrations_dir))
+    with pytest.raises(RuntimeError):
+        db.run_migrations()
+    with db.get_db_connection() as conn:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+        assert db.get_schema_version(conn) < 999
+
+
+def test_unique_index_migration_names_duplicate_users(db):
+    with db.get_db_connection() as conn:
+        conn.execute("DROP INDEX idx_users_auth0_user_id")
+        for _ in range(2):
+            conn.execute("INSERT INTO users (auth0_user_id, memgpt_user_id) VALUES ('auth0|dup', NULL)")
+        with pytest.raises(RuntimeError, match=r"auth0_user_id='auth0\|dup' \(users.id 1,2\)"):
+            db._load_migration("002_add_lookup_indexes.py").migrate(conn)
+        conn.rollback()
+
+
+def make_reminder(event_id="event-1", occurrence_ts=1723716000, reminder_key="send_email_15", fire_ts=None):
+    return {
+        "event_id": event_id,
+        "occurrence_ts": occurrence_ts,
+        "reminder_key": reminder_key,
+        "user_id": "user-1",
+        "fire_ts": occurrence_ts - 900 if fire_ts is None else fire_ts,
+    }
+
+
+def test_schedule_reminders_is_idempotent(db):
+    reminders = [make_reminder(), make_reminder(reminder_key="send_sms_15")]
+    assert db.schedule_reminders(reminders) == 2
+    assert db.schedule_reminders(reminders) == 0
+    pending = db.get_pending_reminders(reminders[0]["fire_ts"])
+    assert sorted(r["reminder_key"] for r in pending) == ["send_email_15", "send_sms_15"]
+    assert db.get_pending_reminders(reminders[0]["fire_ts"] - 1) == []
+
+
+def test_claim_due_reminders_hands_out_each_reminder_once(db):
+    due, later = make_reminder(), make_reminder(occurrence_ts=1723730000)
+    db.schedule_reminders([due, later])
+    cutoff = due["fire_ts"] + 60
+
+    claimed = db.claim_due_reminders("worker-a", cutoff, now_ts=due["fire_ts"])
+    assert [(r["event_id"], r["occurrence_ts"]) for r in claimed] == [("event-1", due["occurrence_ts"])]
+    assert db.claim_due_reminders("worker-b", cutoff, now_ts=due["fire_ts"]) == []
+
+    assert db.complete_reminder("event-1", due["occurrence_ts"], "send_email_15", success=True)
+    db.schedule_reminders([due])
+    assert db.claim_due_reminders("worker-b", cutoff, now_ts=due["fire_ts"] + db.REMINDER_CLAIM_TIMEOUT + 1) == []
+
+
+def test_abandoned_claims_and_failures_are_retried(db):
+    reminder = make_reminder()
+    db.schedule_reminders([reminder])
+    now = reminder["fire_ts"]
+    assert db.claim_due_reminders("worker-a", now, now_ts=now)
+
+    stale = now + db.REMINDER_CLAIM_TIMEOUT + 1
+    [reclaimed] = db.claim_due_reminders("worker-b", stale, now_ts=stale)
+    assert reclaimed["attempts"] == 2
+
+    assert db.complete_reminder("event-1", reminder["occurrence_ts"], "send_email_15", success=False, error="timeout")
+    [retried] = db.claim_due_reminders("worker-b", stale, now_ts=stale)
+    assert retried["attempts"] == db.REMINDER_MAX_ATTEMPTS
+    db.complete_reminder("event-1", reminder["occurrence_ts"], "send_email_15", success=False, error="timeout")
+    assert db.claim_due_reminders("worker-b", stale, now_ts=stale) == []
+    with db.get_db_connection() as conn:
+        assert conn.execute("SELECT status FROM reminder_deliveries").fetchone()[0] == "failed"
+
+
+def test_concurrent_claims_never_overlap(db):
+    db.schedule_reminders([make_reminder(occurrence_ts=1723716000 + i * 60) for i in range(200)])
+    claims = {}
+
+    def worker(name):
+        claims[name] = db.claim_due_reminders(name, 1723716000 + 200 * 60, now_ts=1723716000)
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    claimed = [r["occurrence_ts"] for rows in claims.values() for r in rows]
+    assert len(claimed) == len(set(claimed)) == 200
+
+
+def test_moving_or_deleting_event_drops_pending_reminders(db):
+    event_id = db.add_event("user-1", make_event())
+    db.schedule_reminders([make_reminder(event_id=event_id, reminder_key=key) for key in ("send_email_15", "send_sms_15")])
+    db.claim_due_reminders("worker-a", 1723715100, now_ts=1723715100)
+
+    db.update_event(event_id, {"start_time": "2024-08-15T11:00:00+00:00", "end_time": "2024-08-15T11:30:00+00:00"})
+    with db.get_db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM reminder_deliveries").fetchone()[0] == 2
+    db.complete_reminder(event_id, 1723716000, "send_email_15", success=True)
+    db.schedule_reminders([make_reminder(event_id=event_id, occurrence_ts=1723719600)])
+    db.delete_event(event_id)
+    with db.get_db_connection() as conn:
+        statuses = [row[0] for row in conn.execute("SELECT status FROM reminder_deliveries ORDER BY status")]
+    # Only the new pending reminder goes; claimed and sent rows are history.
+    assert statuses == ["claimed", "sent"]
+
+
+def test_claim_user_reminders_takes_only_that_users_upcoming_reminders(db):
+    mine = [make_reminder(occurrence_ts=1723716000 + i * 120) for i in range(3)]
+    theirs = dict(make_reminder(event_id="event-2"), user_id="user-2")
+    db.schedule_reminders(mine + [theirs])
+    now = mine[0]["fire_ts"]
+
+    claimed = db.claim_user_reminders("worker-a", ["user-1"], now + 300, now_ts=now)
+    assert [r["occurrence_ts"] for r in claimed] == [1723716000, 1723716120, 1723716240]
+    assert db.claim_user_reminders("worker-b", ["user-1"], now + 300, now_ts=now) == []
+    assert [r["user_id"] for r in db.claim_due_reminders("worker-b", now, now_ts=now)] == ["user-2"]
+
+
+def test_settle_missed_reminders_replays_a_capped_set_of_upcoming_ones(db):
+    now = 1723716000
+    started = make_reminder(event_id="started", occurrence_ts=now - 60)
+    upcoming = [make_reminder(event_id=f"event-{i}", occurrence_ts=now + 600 + i * 60, fire_ts=now - 1800)
+                for i in range(4)]
+    recent = make_reminder(event_id="recent", occurrence_ts=now + 900, fire_ts=now - 30)
+    db.schedule_reminders([started, recent] + upcoming)
+
+    outcome = db.settle_missed_reminders(now_ts=now, per_user_cap=3)
+    assert outcome == {"replay": 3, "stale": 1, "capped": 1}
+    with db.get_db_connection() as conn:
+        rows = dict(conn.execute("SELECT event_id, status FROM reminder_deliveries").fetchall())
+    assert rows == {"started": "missed", "event-0": "pending", "event-1": "pending", "event-2": "pending",
+                    "event-3": "missed", "recent": "pending"}
+
+    # Replays are claimed like any due reminder; a second pass finds nothing new
+    assert len(db.claim_due_reminders("worker-a", now, now_ts=now)) == 4
+    assert db.settle_missed_reminders(now_ts=now, per_user_cap=3) == {"replay": 0, "stale": 0, "capped": 0}
+
+
+def test_claims_are_limited_to_the_callers_shards(db):
+    users = ["user-1", "user-2"]
+    assert db.shard_for(users[0]) != db.shard_for(users[1])
+    db.schedule_reminders([dict(make_reminder(event_id=f"event-{user}"), user_id=user) for user in users])
+    now = make_reminder()["fire_ts"]
+
+    assert [r["user_id"] for r in db.get_pending_reminders(now, [db.shard_for("user-2")])] == ["user-2"]
+    [claimed] = db.claim_due_reminders("worker-a", now, now_ts=now, shards=[db.shard_for("user-1")])
+    assert claimed["user_id"] == "user-1"
+    assert db.claim_due_reminders("worker-b", now, now_ts=now, shards=[]) == []
+    assert [r["user_id"] for r in db.claim_due_reminders("worker-b", now, now_ts=now)] == ["user-2"]
+
+
+def test_shard_leases_are_shared_and_taken_over(db):
+    now = 1723716000
+    first = db.acquire_shard_leases("reminders", "worker-a", ttl=60, now_ts=now)
+    assert first == list(range(db.SHARD_COUNT))
+
+    # A second worker gets nothing until the first hands back its excess
+    assert db.acquire_shard_leases("reminders", "worker-b", ttl=60, now_ts=now + 1) == []
+    assert len(db.acquire_shard_leases("reminders", "worker-a", ttl=60, now_ts=now + 2)) == db.SHARD_COUNT // 2
+    second = db.acquire_shard_leases("reminders", "worker-b", ttl=60, now_ts=now + 3)
+    assert len(second) == db.SHARD_COUNT // 2
+    assert db.acquire_shard_leases("gmail", "worker-b", ttl=60, now_ts=now + 3) == list(range(db.SHARD_COUNT))
+
+    # worker-a stops renewing; once its leases expire worker-b takes everything
+    assert db.acquire_shard_leases("reminders", "worker-b", ttl=60, now_ts=now + 30) == second
+    assert db.acquire_shard_leases("reminders", "worker-b", ttl=60, now_ts=now + 63) == list(range(db.SHARD_COUNT))
+
+    assert db.release_shard_leases("reminders", "worker-b") == db.SHARD_COUNT
+    assert db.acquire_shard_leases("reminders", "worker-a", ttl=60, now_ts=now + 64) == list(range(db.SHARD_COUNT))
+
+
+def test_concurrent_lease_acquisition_never_overlaps(db):
+    held = {}
+
+    def worker(name):
+        held[name] = db.acquire_shard_leases("reminders", name, ttl=60, now_ts=1723716000)
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    shards = [shard for owned in held.values() for shard in owned]
+    assert len(shards) == len(set(shards)) == db.SHARD_COUNT
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("durable", [True, False])
+async def test_event_feed_delivers_published_changes(db, durable):
+    feed = event_feed.EventChangeFeed(durable=durable, poll_interval=30)
+    subscription = feed.subscribe()
+    first = asyncio.ensure_future(subscription.__anext__())
+    await asyncio.sleep(0.05)  # let the subscriber register before publishing
+
+    await feed.publish_change("event-1", "user-1", event_feed.CREATED)
+    batch = await asyncio.wait_for(first, 5)
+    assert [(c["event_id"], c["op"]) for c in batch] == [("event-1", "created")]
+    await subscription.aclose()
+
+    with db.get_db_connection() as conn:
+        logged = conn.execute("SELECT COUNT(*) FROM event_changes").fetchone()[0]
+    assert logged == (1 if durable else 0)
+
+
+def test_event_change_log_reads_after_cursor_and_prunes(db):
+    first = db.record_event_changes([{"event_id": "e1", "user_id": "u1", "op": "created"}])
+    db.record_event_changes([{"event_id": "e2", "user_id": "u1", "op": "deleted"}])
+    assert [c["event_id"] for c in db.get_event_changes(first)] == ["e2"]
+    assert db.get_latest_event_change_seq() == first + 1
+    assert db.prune_event_changes(before_ts=db.time.time() + 1) == 2
+    # Sequence numbers are never reused, so cursors stay valid after pruning
+    assert db.record_event_changes([{"event_id": "e3", "user_id": "u1", "op": "updated"}]) == first + 2
+
+
+def test_reminder_content_is_tied_to_event_version(db):
+    event_id = db.add_event("user-1", make_event())
+    occurrence_ts = db.to_utc_timestamp("2024-08-15T10:00:00+00:00")
+    assert db.get_event(event_id)["version"] == 1
+    assert db.store_reminder_content(event_id, occurrence_ts, "send_email_15", 1, "See you at standup")
+    assert db.get_reminder_content(event_id, occurrence_ts, "send_email_15", 1) == "See you at standup"
+
+    db.update_event(event_id, {"description": "Moved to the big room"})
+    assert db.get_event(event_id)["version"] == 2
+    assert db.get_reminder_content(event_id, occurrence_ts, "send_email_15", 2) is None
+
+    assert db.prune_reminder_content(before_ts=occurrence_ts + 1) == 1
+
+
+def test_gmail_history_cursor_is_kept_per_worker(db):
+    assert db.get_gmail_history_id("ella@example.com", "worker-a") is None
+    assert db.set_gmail_history_id("ella@example.com", "worker-a", 1234)
+    db.set_gmail_history_id("ella@example.com", "worker-b", "999")
+    assert db.get_gmail_history_id("ella@example.com", "worker-a") == "1234"
+
+    db.set_gmail_history_id("ella@example.com", "worker-a", None)
+    assert db.get_gmail_history_id("ella@example.com", "worker-a") is None
+    assert db.get_gmail_history_id("ella@example.com", "worker-b") == "999"
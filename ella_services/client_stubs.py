@@ -0,0 +1,111 @@
+# client_stubs.py
+"""Stand-ins for the Google, MemGPT and VAPI client libraries, for tests.
+
+gmail_service and reminder_service import these clients (and read their
+settings) at module level. install() puts a minimal module in sys.modules
+for each library that is not installed and fills in unset settings, so the
+services import without credentials; installed libraries are left alone.
+Tests replace every call that would reach a real client.
+"""
+import importlib
+import os
+import sys
+import tempfile
+import types
+
+
+class HttpError(Exception):
+    """googleapiclient.errors.HttpError: resp carries the HTTP status."""
+
+    def __init__(self, resp, content, uri=None):
+        self.resp = resp
+        self.content = content
+        self.uri = uri
+        super().__init__(f"<HttpError {resp.status}>")
+
+    @property
+    def status_code(self):
+        return self.resp.status
+
+
+class Response(dict):
+    """httplib2.Response: the response headers, with status and reason."""
+
+    def __init__(self, info):
+        super().__init__(info)
+        self.status = int(info.get("status", 200))
+        self.reason = "Ok"
+
+
+class Credentials:
+    @classmethod
+    def from_authorized_user_file(cls, *args, **kwargs):
+        raise FileNotFoundError("no stored credentials in tests")
+
+
+class RESTClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def build(*args, **kwargs):
+    raise RuntimeError("Google API clients are not available in tests")
+
+
+def _placeholder(name):
+    return type(name, (), {})
+
+
+STUBS = {
+    "google": {},
+    "google.auth": {},
+    "google.auth.exceptions": {"RefreshError": type("RefreshError", (Exception,), {})},
+    "google.auth.transport": {},
+    "google.auth.transport.requests": {"Request": _placeholder("Request")},
+    "google.oauth2": {},
+    "google.oauth2.credentials": {"Credentials": Credentials},
+    "google_auth_oauthlib": {},
+    "google_auth_oauthlib.flow": {"Flow": _placeholder("Flow"), "InstalledAppFlow": _placeholder("InstalledAppFlow")},
+    "googleapiclient": {},
+    "googleapiclient.discovery": {"build": build},
+    "googleapiclient.errors": {"HttpError": HttpError},
+    "httplib2": {"Response": Response},
+    "memgpt": {},
+    "memgpt.client": {},
+    "memgpt.client.client": {"RESTClient": RESTClient, "UserMessageResponse": _placeholder("UserMessageResponse")},
+    "jwt": {},
+    "phonenumbers": {"NumberParseException": type("NumberParseException", (Exception,), {})},
+}
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+SETTINGS = {
+    "MEMGPT_TOOLS_PATH": os.path.join(ROOT, "ella_memgpt", "tools"),
+    "VAPI_TOOLS_PATH": os.path.join(ROOT, "ella_vapi"),
+    "CREDENTIALS_PATH": tempfile.gettempdir(),
+    "VAPI_ORG_ID": "test-org",
+    "VAPI_PRIVATE_KEY": "00000000-0000-0000-0000-000000000000",
+}
+
+
+def _stub(name, attrs):
+    try:
+        importlib.import_module(name)
+        return
+    except ImportError:
+        pass
+    module = types.ModuleType(name)
+    module.__path__ = []  # lets the stubs below it be imported as submodules
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+
+
+def install():
+    """Stub the client libraries that are missing and default the unset settings."""
+    for name, attrs in STUBS.items():
+        _stub(name, attrs)
+    for key, value in SETTINGS.items():
+        os.environ.setdefault(key, value)
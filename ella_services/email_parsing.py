@@ -0,0 +1,89 @@
+# email_parsing.py
+"""Headers and text body of Gmail API messages.
+
+parse_email_headers works on format="metadata" messages, which carry only
+the headers asked for in GMAIL_METADATA_HEADERS and are enough to filter
+and route. extract_body walks the MIME tree of a format="full" message at
+any depth (multipart/mixed > multipart/alternative > text/plain and the
+like), skips attachments and decodes at most EMAIL_BODY_LIMIT bytes of the
+chosen part, so a large message costs no more than a small one.
+"""
+import base64
+import html
+import os
+import re
+from typing import Any, Dict, Iterator, Optional
+
+GMAIL_METADATA_HEADERS = ["From", "To", "Subject"]
+
+EMAIL_BODY_LIMIT = int(os.getenv("ELLA_EMAIL_BODY_LIMIT", "20000"))
+
+# Deeper nesting than this is not real mail; the rest of the tree is ignored.
+MAX_MIME_DEPTH = 16
+
+
+def parse_email_headers(message: dict) -> Optional[Dict[str, str]]:
+    """Subject, From and To of a message (metadata or full); None without headers."""
+    if 'payload' not in message or 'headers' not in message['payload']:
+        return None
+
+    headers = message['payload']['headers']
+    subject = next((header['value'] for header in headers if header['name'].lower() == 'subject'), 'No Subject')
+    from_header = next((header['value'] for header in headers if header['name'].lower() == 'from'), 'Unknown Sender')
+    to_header = next((header['value'] for header in headers if header['name'].lower() == 'to'), 'Unknown Recipient')
+    return {
+        'subject': subject,
+        'from': from_header,
+        'to': to_header
+    }
+
+
+def iter_parts(part: Dict[str, Any], depth: int = 0) -> Iterator[Dict[str, Any]]:
+    """Leaf parts of a MIME tree, depth-first in document order, without attachments."""
+    if depth > MAX_MIME_DEPTH:
+        return
+    if part.get('parts'):
+        for child in part['parts']:
+            yield from iter_parts(child, depth + 1)
+    elif not part.get('filename') and 'attachmentId' not in part.get('body', {}):
+        yield part
+
+
+def decode_body_data(data: str, limit: int = EMAIL_BODY_LIMIT) -> str:
+    """Decode the first limit bytes of a base64url part body."""
+    chunk = (limit + 2) // 3 * 4
+    if len(data) > chunk:
+        data = data[:chunk]
+    else:
+        data += '=' * (-len(data) % 4)
+    return base64.urlsafe_b64decode(data)[:limit].decode('utf-8', errors='ignore')
+
+
+def html_to_text(markup: str) -> str:
+    markup = re.sub(r'(?is)<(script|style)\b.*?</\1>', '', markup)
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', markup))
+    return re.sub(r'[ \t]+', ' ', text).strip()
+
+
+def extract_body(payload: Dict[str, Any], limit: int = EMAIL_BODY_LIMIT) -> str:
+    """Text of the first text/plain part, or of the first text/html part if there is none."""
+    html_part = None
+    for part in iter_parts(payload):
+        if not part.get('body', {}).get('data'):
+            continue
+        mime_type = part.get('mimeType', '')
+        if mime_type == 'text/plain':
+            return decode_body_data(part['body']['data'], limit)
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+    if html_part is not None:
+        return html_to_text(decode_body_data(html_part['body']['data'], limit))
+    return ''
+
+
+def parse_email_message(message: dict, limit: int = EMAIL_BODY_LIMIT) -> Optional[Dict[str, str]]:
+    """Headers and body text of a format="full" message; None without headers."""
+    parsed = parse_email_headers(message)
+    if parsed is not None:
+        parsed['body'] = extract_body(message['payload'], limit)
+    return parsed
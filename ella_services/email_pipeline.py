@@ -0,0 +1,291 @@
+# email_pipeline.py
+"""Staged, concurrent processing of incoming mail.
+
+MailPipeline moves message ids through fetch -> parse/route -> generate ->
+send -> ack. Fetch and ack take batches, parse/route is one task on the
+event loop, and generate and send each run on a KeyedWorkerPool, so mail
+from one sender is answered in arrival order while different senders are
+handled in parallel. Every hand-off is bounded, so when replies fall behind
+the poller blocks in submit() instead of piling up messages.
+
+BatchedLookup lets concurrent workers share batched calls, e.g. to fetch
+the bodies of the messages they are answering.
+
+The stages themselves are injected (see gmail_service), which keeps this
+module free of Gmail and MemGPT specifics.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+    """Workers that handle items of one key strictly in submission order.
+
+    Each key has a FIFO lane; a lane is picked up by at most one worker at a
+    time and goes to the back of the ready queue after each item, so busy
+    keys cannot starve the others. At most capacity items may be waiting or
+    in progress; submit() blocks beyond that.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], workers: int, capacity: int, name: str = "pool"):
+        self._handler = handler
+        self._workers = workers
+        self._name = name
+        self._capacity = asyncio.Semaphore(capacity)
+        self._lanes: Dict[Hashable, Deque[Any]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def submit(self, key: Hashable, item: Any) -> None:
+        await self._capacity.acquire()
+        self._pending += 1
+        self._idle.clear()
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            lane.append(item)
+
+    async def join(self) -> None:
+        """Wait until every submitted item has been handled."""
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            item = lane.popleft()
+            try:
+                await self._handler(item)
+            except Exception as e:
+                logger.error(f"Error in {self._name} handling an item for {key}: {str(e)}", exc_info=True)
+            finally:
+                self._capacity.release()
+                self._pending -= 1
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                if not self._pending:
+                    self._idle.set()
+
+
+class BatchedLookup:
+    """Coalesces single-key lookups made concurrently into batched calls.
+
+    get(key) waits for the key's value; keys requested while a batch is in
+    flight, or from other tasks in the same loop iteration, go out together
+    in the next fetch call of at most batch_size keys. Missing keys resolve
+    to None; a failed fetch raises in every waiting get().
+    """
+
+    def __init__(self, fetch: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]], batch_size: int = 50):
+        self._fetch = fetch
+        self._batch_size = batch_size
+        self._waiting: Dict[Hashable, List[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, key: Hashable) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(key, []).append(future)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        await asyncio.sleep(0)  # let the other callers of this iteration join the batch
+        try:
+            while self._waiting:
+                keys = list(self._waiting)[:self._batch_size]
+                batch = {key: self._waiting.pop(key) for key in keys}
+                try:
+                    values = await self._fetch(keys)
+                except Exception as e:
+                    for futures in batch.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(e)
+                    continue
+                for key, futures in batch.items():
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(values.get(key))
+        finally:
+            self._task = None
+
+
+# route(message) returns None to leave the message alone (unread), or
+# (key, job): job None marks it read without a reply, otherwise the job is
+# generated and sent in order with the other jobs of the same key.
+Fetch = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+Route = Callable[[Any], Awaitable[Optional[Tuple[Hashable, Any]]]]
+Generate = Callable[[Any], Awaitable[Any]]
+Send = Callable[[Any], Awaitable[None]]
+Ack = Callable[[List[str]], Awaitable[None]]
+Checkpoint = Callable[[Any], Awaitable[None]]
+
+
+class MailPipeline:
+    """fetch -> parse/route -> generate -> send -> ack, with per-key ordering.
+
+    submit() takes the message ids found by one sync and the mailbox position
+    (e.g. a Gmail historyId) they were found up to. on_checkpoint is called
+    with a position once every message submitted with it, and with every
+    earlier position, has been acked or dropped, so a stored position never
+    skips mail still in the pipeline. on_failure is called with the ids that
+    could not be fetched, routed or answered; they are dropped unacked, so
+    they stay unread for a later sync. Only a route or generate result that
+    deliberately means "no reply" marks a message read without one.
+    """
+
+    def __init__(self, fetch: Fetch, route: Route, generate: Generate, send: Send, ack: Ack,
+                 on_checkpoint: Optional[Checkpoint] = None,
+                 on_failure: Optional[Callable[[List[str]], None]] = None,
+                 generate_workers: int = 4, send_workers: int = 4, queue_size: int = 100,
+                 fetch_batch: int = 50, ack_batch: int = 1000):
+        self._fetch = fetch
+        self._route = route
+        self._generate = generate
+        self._send = send
+        self._ack = ack
+        self._on_checkpoint = on_checkpoint
+        self._on_failure = on_failure
+        self._fetch_batch = fetch_batch
+        self._ack_batch = ack_batch
+        self._fetch_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self._route_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self._ack_queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self._generators = KeyedWorkerPool(self._generate_stage, generate_workers, queue_size, "generate")
+        self._senders = KeyedWorkerPool(self._send_stage, send_workers, queue_size, "send")
+        self._checkpoints: Deque[list] = deque()
+        self.in_flight: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._generators.start()
+        self._senders.start()
+        self._tasks = [asyncio.create_task(stage()) for stage in (self._fetch_stage, self._route_stage, self._ack_stage)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._generators.close()
+        await self._senders.close()
+
+    async def submit(self, message_ids: Iterable[str], position: Any = None) -> int:
+        """Queue newly found messages (skipping ones already in flight); returns how many were queued."""
+        new_ids = []
+        for message_id in message_ids:
+            if message_id not in self.in_flight:
+                self.in_flight.add(message_id)
+                new_ids.append(message_id)
+        self._checkpoints.append([position, set(new_ids)])
+        for start in range(0, len(new_ids), self._fetch_batch):
+            await self._fetch_queue.put(new_ids[start:start + self._fetch_batch])
+        await self._advance_checkpoints()
+        return len(new_ids)
+
+    async def _finish(self, message_ids: Iterable[str]) -> None:
+        for message_id in message_ids:
+            self.in_flight.discard(message_id)
+            for checkpoint in self._checkpoints:
+                checkpoint[1].discard(message_id)
+        await self._advance_checkpoints()
+
+    async def _fail(self, message_ids: List[str]) -> None:
+        """Drop messages without acking them, leaving them unread."""
+        if self._on_failure:
+            self._on_failure(message_ids)
+        await self._finish(message_ids)
+
+    async def _advance_checkpoints(self) -> None:
+        position = None
+        while self._checkpoints and not self._checkpoints[0][1]:
+            position = self._checkpoints.popleft()[0] or position
+        if position is not None and self._on_checkpoint:
+            try:
+                await self._on_checkpoint(position)
+            except Exception as e:
+                logger.error(f"Error storing mail checkpoint {position}: {str(e)}", exc_info=True)
+
+    async def _fetch_stage(self) -> None:
+        while True:
+            message_ids = await self._fetch_queue.get()
+            try:
+                messages = await self._fetch(message_ids)
+            except Exception as e:
+                logger.error(f"Error fetching {len(message_ids)} message(s): {str(e)}", exc_info=True)
+                messages = {}
+            failed = [message_id for message_id in message_ids if message_id not in messages]
+            for message_id in message_ids:
+                if message_id in messages:
+                    await self._route_queue.put((message_id, messages[message_id]))
+            if failed:
+                await self._fail(failed)
+
+    async def _route_stage(self) -> None:
+        while True:
+            message_id, message = await self._route_queue.get()
+            try:
+                routed = await self._route(message)
+            except Exception as e:
+                logger.error(f"Error routing message {message_id}: {str(e)}", exc_info=True)
+                await self._fail([message_id])
+                continue
+            if routed is None:
+                await self._finish([message_id])
+            elif routed[1] is None:
+                await self._ack_queue.put(message_id)
+            else:
+                key, job = routed
+                await self._generators.submit(key, (key, message_id, job))
+
+    async def _generate_stage(self, item) -> None:
+        key, message_id, job = item
+        try:
+            reply = await self._generate(job)
+        except Exception as e:
+            logger.error(f"Error generating a reply to message {message_id}: {str(e)}", exc_info=True)
+            await self._fail([message_id])
+            return
+        if reply is None:
+            await self._ack_queue.put(message_id)
+        else:
+            await self._senders.submit(key, (message_id, reply))
+
+    async def _send_stage(self, item) -> None:
+        message_id, reply = item
+        try:
+            await self._send(reply)
+        finally:
+            await self._ack_queue.put(message_id)
+
+    async def _ack_stage(self) -> None:
+        while True:
+            message_ids = [await self._ack_queue.get()]
+            while len(message_ids) < self._ack_batch and not self._ack_queue.empty():
+                message_ids.append(self._ack_queue.get_nowait())
+            try:
+                await self._ack(message_ids)
+            except Exception as e:
+                logger.error(f"Error marking {len(message_ids)} message(s) read: {str(e)}", exc_info=True)
+            await self._finish(message_ids)
@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import os
+
+import aiohttp
+from dotenv import load_dotenv
+from gmail_service import build_push_envelope
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Logging configuration
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stands in for the Pub/Sub push subscription: posts the envelope Gmail's
+# notifications arrive in to a running services app, which should start a sync.
+SERVICES_URL = os.getenv("SERVICES_URL", "http://localhost:9090")
+PUSH_TOKEN = os.getenv("ELLA_GMAIL_PUSH_TOKEN")
+MAILBOX = os.getenv("TEST_GMAIL_ADDRESS", "me@example.com")
+
+async def main():
+    envelope = build_push_envelope(MAILBOX, int(os.getenv("TEST_GMAIL_HISTORY_ID", "1")))
+    params = {"token": PUSH_TOKEN} if PUSH_TOKEN else None
+    logger.info(f"Posting Gmail push notification for {MAILBOX} to {SERVICES_URL}/gmail/push")
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{SERVICES_URL}/gmail/push", json=envelope, params=params) as response:
+            logger.info(f"Push endpoint answered {response.status}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
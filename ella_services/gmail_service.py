@@ -1,18 +1,28 @@
 # # #gmail_service.py
 import os
 import asyncio
+import functools
 import logging
 import base64
+import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from fastapi import HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from email.utils import parseaddr
 from google_utils import GoogleEmailUtils
 from memgpt_email_router import MemGPTEmailRouter
-from ella_dbo.db_manager import get_user_data_by_field
+from email_pipeline import BatchedLookup, MailPipeline
+from email_parsing import GMAIL_METADATA_HEADERS, extract_body, parse_email_headers
+from ella_dbo import async_db_manager
+from ella_dbo.leases import ShardLeases
 from google_service_manager import google_service_manager
 
 # Load environment variables from .env file
@@ -28,39 +38,288 @@ logger = logging.getLogger(__name__)
 # Initialize the MemGPTEmailRouter
 email_router = MemGPTEmailRouter()
 
+# With several workers polling the same inbox, each handles only the senders
+# in the shards it holds a lease on and leaves other mail unread for its owner.
+gmail_leases = ShardLeases("gmail")
+
+# New mail is found incrementally: each worker stores the mailbox historyId it
+# has caught up to and asks users().history().list for messages added since.
+# Without a usable cursor (first run, expired history, newly held shards) it
+# resyncs from the unread list, at most GMAIL_RESYNC_LIMIT messages.
+# ELLA_GMAIL_SYNC=unread always lists unread mail instead.
+GMAIL_SYNC_MODE = os.getenv("ELLA_GMAIL_SYNC", "history")
+GMAIL_RESYNC_LIMIT = int(os.getenv("ELLA_GMAIL_RESYNC_LIMIT", "500"))
+GMAIL_POLL_INTERVAL = int(os.getenv("ELLA_GMAIL_POLL_INTERVAL", "60"))
+# Messages are fetched GMAIL_BATCH_SIZE per batch HTTP request (Gmail allows
+# 100, but throttles large batches) and marked read with one batchModify per
+# GMAIL_MODIFY_LIMIT ids. The batches fetch format="metadata" (From, To and
+# Subject only) to filter and route; just the messages that get a reply are
+# then fetched in full by the generate workers, whose concurrent fetches are
+# coalesced into batches, and their body is read by email_parsing.extract_body.
+GMAIL_BATCH_SIZE = int(os.getenv("ELLA_GMAIL_BATCH_SIZE", "50"))
+GMAIL_MODIFY_LIMIT = 1000
+# Push: with ELLA_GMAIL_PUSH_TOPIC set the poller asks Gmail to publish inbox
+# changes to that Pub/Sub topic (users().watch, renewed daily), and a push
+# subscription delivers them to POST /gmail/push, which starts a sync right
+# away. Polling every GMAIL_POLL_INTERVAL seconds stays as the safety net,
+# and is what wakes workers other than the one Pub/Sub pushed to. Set
+# ELLA_GMAIL_PUSH_TOKEN and add ?token=... to the push endpoint URL to reject
+# posts that did not come from the subscription.
+GMAIL_PUSH_TOPIC = os.getenv("ELLA_GMAIL_PUSH_TOPIC")
+GMAIL_PUSH_TOKEN = os.getenv("ELLA_GMAIL_PUSH_TOKEN")
+GMAIL_WATCH_RENEW_INTERVAL = 86400
+# New mail goes through an email_pipeline.MailPipeline: replies are generated
+# by GMAIL_GENERATE_WORKERS workers, in order per sender, with at most
+# GMAIL_QUEUE_SIZE messages waiting at each stage. Replies are sent one at a
+# time because the router's Gmail client, like the poller's, is not thread-safe.
+GMAIL_GENERATE_WORKERS = int(os.getenv("ELLA_GMAIL_GENERATE_WORKERS", "4"))
+GMAIL_SEND_WORKERS = 1
+GMAIL_QUEUE_SIZE = int(os.getenv("ELLA_GMAIL_QUEUE_SIZE", "100"))
+
+# The poller's blocking execute() calls run on this thread, one at a time, so
+# they neither block the event loop nor share the httplib2 client across threads.
+gmail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gmail")
+
+gmail_app = FastAPI()
+sync_requested = asyncio.Event()
+watched_mailbox: Optional[str] = None
+
 async def decode_email_content(raw_message: str) -> str:
     try:
         return base64.urlsafe_b64decode(raw_message).decode('utf-8')
     except UnicodeDecodeError:
         return base64.urlsafe_b64decode(raw_message).decode('ISO-8859-1')
 
-def parse_email_message(message: dict) -> dict:
-    if 'payload' not in message or 'headers' not in message['payload']:
-        return None
+def list_unread_message_ids(service, limit: int) -> List[str]:
+    """Ids of up to limit unread messages, newest first."""
+    message_ids, page_token = [], None
+    while len(message_ids) < limit:
+        result = service.users().messages().list(
+            userId="me", q="is:unread", maxResults=min(500, limit - len(message_ids)), pageToken=page_token
+        ).execute()
+        message_ids.extend(message["id"] for message in result.get("messages", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            break
+    return message_ids
+
+def list_added_message_ids(service, start_history_id: str) -> Tuple[List[str], str]:
+    """Unread inbox messages added since start_history_id, oldest first, and the mailbox's current historyId.
+
+    Raises HttpError 404 once start_history_id is too old for Gmail to answer.
+    """
+    message_ids, seen, page_token = [], set(), None
+    history_id = start_history_id
+    while True:
+        result = service.users().history().list(
+            userId="me", startHistoryId=start_history_id, historyTypes=["messageAdded"],
+            labelId="INBOX", pageToken=page_token
+        ).execute()
+        for record in result.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added["message"]
+                labels = message.get("labelIds", [])
+                if message["id"] not in seen and "UNREAD" in labels and "SENT" not in labels:
+                    seen.add(message["id"])
+                    message_ids.append(message["id"])
+        history_id = result.get("historyId", history_id)
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return message_ids, history_id
+
+def find_new_messages(service, history_id: Optional[str]) -> Tuple[List[str], Optional[str]]:
+    """Message ids to process this tick, and the historyId to store once they are handled."""
+    if GMAIL_SYNC_MODE == "history" and history_id:
+        try:
+            return list_added_message_ids(service, history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            logger.warning(f"Gmail history {history_id} has expired; resyncing from unread mail")
+    # Read the cursor before listing so nothing that arrives meanwhile is skipped
+    current_history_id = None
+    if GMAIL_SYNC_MODE == "history":
+        current_history_id = service.users().getProfile(userId="me").execute().get("historyId")
+    return list_unread_message_ids(service, GMAIL_RESYNC_LIMIT)[::-1], current_history_id
+
+def fetch_messages(service, message_ids: List[str], format: str = "full",
+                   metadata_headers: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Fetch messages through batch HTTP requests of GMAIL_BATCH_SIZE; failures are logged per message.
+
+    With format="metadata", only the metadata_headers are returned and no body.
+    """
+    messages: Dict[str, dict] = {}
+    options = {"format": format}
+    if metadata_headers:
+        options["metadataHeaders"] = metadata_headers
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            logger.error(f"Failed to fetch message {request_id}: {exception}")
+        else:
+            messages[request_id] = response
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in message_ids[start:start + GMAIL_BATCH_SIZE]:
+            batch.add(service.users().messages().get(userId="me", id=message_id, **options), request_id=message_id)
+        batch.execute()
+    return messages
+
+def mark_read(service, message_ids: List[str]) -> List[str]:
+    """Remove UNREAD from messages with one batchModify per GMAIL_MODIFY_LIMIT ids; returns the ids that failed.
+
+    batchModify is all-or-nothing, so when a call fails its ids are retried
+    one by one to find and report the messages that really failed.
+    """
+    failed = []
+    for start in range(0, len(message_ids), GMAIL_MODIFY_LIMIT):
+        chunk = message_ids[start:start + GMAIL_MODIFY_LIMIT]
+        try:
+            service.users().messages().batchModify(
+                userId="me", body={"ids": chunk, "removeLabelIds": ["UNREAD"]}).execute()
+            continue
+        except HttpError as e:
+            logger.warning(f"batchModify of {len(chunk)} message(s) failed ({e}); marking them read one by one")
+        for message_id in chunk:
+            try:
+                service.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["UNREAD"]}).execute()
+            except HttpError as e:
+                logger.error(f"Failed to mark message {message_id} read: {e}")
+                failed.append(message_id)
+    return failed
+
+async def gmail_call(func, *args, **kwargs):
+    """Run a blocking Gmail API helper on the Gmail thread."""
+    return await asyncio.get_running_loop().run_in_executor(gmail_executor, functools.partial(func, *args, **kwargs))
+
+async def route_message(msg: dict) -> Optional[Tuple[str, Optional[dict]]]:
+    """Filter and route a format="metadata" message (the pipeline's route stage).
+
+    Returns None to leave it unread (already handled, or another worker's
+    sender), (sender, None) to mark it read without a reply, or (sender,
+    reply job) to answer it in order with the sender's other mail. The body
+    is fetched later, by generate_reply.
+    """
+    message_id = msg["id"]
+    if "UNREAD" not in msg.get("labelIds", ["UNREAD"]):
+        return None  # already handled, e.g. replayed from an older history cursor
+    parsed_email = parse_email_headers(msg)
+    if not parsed_email:
+        return message_id, None
+    sender = extract_email_address(parsed_email['from']).lower()
+    if not gmail_leases.owns(sender):
+        return None  # another worker's sender; leave it unread for them
+    logger.info(f"New Email - From: {parsed_email['from']}, To: {parsed_email['to']}, "
+                f"Subject: {parsed_email['subject']}")
+    if parsed_email['from'].endswith('@google.com'):
+        return sender, None
+    from_email = parsed_email['from'].split('<')[-1].split('>')[0]
+    try:
+        user_data = await read_user_by_email(from_email)
+    except HTTPException:
+        user_data = None
+    if not (user_data and user_data.get("default_agent_key")):
+        logger.warning(f"User not found or default agent key missing for email: {from_email}")
+        return sender, None
+    return sender, {
+        "message_id": message_id,
+        "to_email": from_email,
+        "subject": f"Re: {parsed_email['subject']}",
+        "context": {
+            "message_id": message_id,
+            "subject": parsed_email['subject'],
+            "from": from_email
+        },
+        "memgpt_user_api_key": user_data['memgpt_user_api_key'],
+        "agent_key": user_data['default_agent_key']
+    }
 
-    headers = message['payload']['headers']
-    subject = next((header['value'] for header in headers if header['name'].lower() == 'subject'), 'No Subject')
-    from_header = next((header['value'] for header in headers if header['name'].lower() == 'from'), 'Unknown Sender')
-    to_header = next((header['value'] for header in headers if header['name'].lower() == 'to'), 'Unknown Recipient')
+async def generate_reply(job: dict, full_messages: BatchedLookup) -> Optional[dict]:
+    """Fetch the body and have the user's agent write the reply (generate stage); None if it produced nothing.
 
-    body = message['payload'].get('body', {}).get('data', '')
-    if body:
-        body = base64.urlsafe_b64decode(body).decode('utf-8', errors='ignore')
-    else:
-        parts = message['payload'].get('parts', [])
-        for part in parts:
-            if part['mimeType'] == 'text/plain':
-                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                break
+    Raises if the message cannot be fetched, which leaves it unread for the resync.
+    """
+    message_id = job["message_id"]
+    full_message = await full_messages.get(message_id)
+    if full_message is None:
+        raise RuntimeError(f"Could not fetch message {message_id} in full")
+    body = extract_body(full_message.get("payload", {}))
+    logger.info(f"Email {message_id} body: {body[:100]}...")
+    context = dict(job["context"], body=body)
+    content = await email_router.generate_reply(context, job["memgpt_user_api_key"], job["agent_key"])
+    if not content:
+        logger.error(f"Failed to generate a reply to message {job['message_id']}")
+        return None
+    return dict(job, body=content)
 
+async def send_reply(reply: dict) -> None:
+    """Send a generated reply (send stage)."""
+    result = await email_router.send_email(
+        to_email=reply["to_email"], subject=reply["subject"], body=reply["body"], message_id=reply["message_id"])
+    logger.info(f"Email sending result: {result}")
+
+def build_push_envelope(email_address: str, history_id: int, message_id: str = "local") -> dict:
+    """A Pub/Sub push envelope carrying a Gmail notification, as posted to /gmail/push."""
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id}).encode("utf-8")
     return {
-        'subject': subject,
-        'from': from_header,
-        'to': to_header,
-        'body': body
+        "message": {"data": base64.b64encode(data).decode("ascii"), "messageId": message_id},
+        "subscription": "local"
     }
 
+def parse_push_envelope(envelope: dict) -> Optional[dict]:
+    """The Gmail notification ({"emailAddress", "historyId"}) in a push envelope, or None if malformed."""
+    try:
+        notification = json.loads(base64.b64decode(envelope["message"]["data"]))
+        return notification if "emailAddress" in notification else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+@gmail_app.post("/push", status_code=204)
+async def gmail_push(request: Request, token: Optional[str] = None):
+    """Pub/Sub push endpoint for Gmail notifications: wakes the poller for an immediate sync.
+
+    Every accepted post is acknowledged with 204, malformed ones included, so
+    Pub/Sub does not redeliver them; the sync itself finds the new mail.
+    """
+    if GMAIL_PUSH_TOKEN and token != GMAIL_PUSH_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    try:
+        notification = parse_push_envelope(await request.json())
+    except ValueError:
+        notification = None
+    if notification is None:
+        logger.warning("Ignoring malformed Gmail push notification")
+    elif watched_mailbox and notification["emailAddress"].lower() != watched_mailbox.lower():
+        logger.warning(f"Ignoring Gmail push notification for unwatched mailbox {notification['emailAddress']}")
+    else:
+        logger.info(f"Gmail push for {notification['emailAddress']} at history {notification.get('historyId')}")
+        sync_requested.set()
+    return Response(status_code=204)
+
+def watch_mailbox(service) -> None:
+    """Ask Gmail to publish inbox changes to GMAIL_PUSH_TOPIC (a watch lasts 7 days)."""
+    response = service.users().watch(
+        userId="me", body={"topicName": GMAIL_PUSH_TOPIC, "labelIds": ["INBOX"], "labelFilterBehavior": "include"}
+    ).execute()
+    logger.info(f"Watching mailbox via {GMAIL_PUSH_TOPIC} until {response.get('expiration')}")
+
+@asynccontextmanager
+async def gmail_app_lifespan(app: FastAPI):
+    # The poller itself is started by the hosting app (see services.py)
+    logger.info("Gmail app startup tasks")
+    yield
+    logger.info("Gmail app shutdown tasks")
+
+async def request_resync(gained: set, lost: set) -> None:
+    """gmail_leases callback: senders in newly held shards may have unread mail this worker's cursor skipped."""
+    if gained:
+        resync_requested.set()
+
+resync_requested = asyncio.Event()
+
 async def poll_gmail_notifications() -> None:
+    global watched_mailbox
     logger.info("Starting Gmail polling task")
     
     try:
@@ -69,62 +328,90 @@ async def poll_gmail_notifications() -> None:
             logger.error("Gmail service is not available. Exiting...")
             return
 
-        user_profile = service.users().getProfile(userId="me").execute()
+        user_profile = await gmail_call(service.users().getProfile(userId="me").execute)
         email_address = user_profile.get("emailAddress")
+        watched_mailbox = email_address
         logger.info(f"Authenticated Gmail account: {email_address}")
+        next_watch = 0.0
 
-        while True:
-            try:
-                logger.info("Checking for new emails...")
-                messages_result = service.users().messages().list(userId="me", q="is:unread", maxResults=25).execute()
-                messages = messages_result.get("messages", [])
-                for message in messages:
-                    message_id = message["id"]
-                    msg = service.users().messages().get(userId="me", id=message_id, format="full").execute()
-                    parsed_email = parse_email_message(msg)
-                    if parsed_email:
-                        logger.info(f"New Email - From: {parsed_email['from']}, To: {parsed_email['to']}, "
-                                    f"Subject: {parsed_email['subject']}, Body: {parsed_email['body'][:100]}...")
-                        if not parsed_email['from'].endswith('@google.com'):
-                            try:
-                                from_email = parsed_email['from'].split('<')[-1].split('>')[0]
-                                user_data = await read_user_by_email(from_email)
-                                if user_data and user_data.get("default_agent_key"):
-                                    default_agent_key = user_data['default_agent_key']
-                                    memgpt_user_api_key = user_data['memgpt_user_api_key']
-                                    context = {
-                                        "message_id": message_id,
-                                        "subject": parsed_email['subject'],
-                                        "from": from_email,
-                                        "body": parsed_email['body']
-                                    }
-                                    await email_router.generate_and_send_email(
-                                        to_email=from_email,
-                                        subject=f"Re: {parsed_email['subject']}",
-                                        context=context,
-                                        memgpt_user_api_key=memgpt_user_api_key,
-                                        agent_key=default_agent_key,
-                                        message_id=message_id,
-                                        api_key=API_KEY  # Add API key here
-                                    )
-                                else:
-                                    logger.warning(f"User not found or default agent key missing for email: {from_email}")
-                            except Exception as e:
-                                logger.error(f"Error processing email: {str(e)}")
-
-                    service.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["UNREAD"]}).execute()
-
-            except RefreshError as e:
-                logger.error(f"Token refresh error: {e}. Reinitializing Gmail service...")
-                service = google_service_manager.get_gmail_service()
-            except Exception as e:
-                logger.error(f"Error during email processing: {str(e)}")
-
-            logger.info("Finished checking for new emails. Waiting for 60 seconds before the next check.")
-            await asyncio.sleep(60)
+        # The stages look service up when called, so a reinitialized service is picked up
+        async def fetch(message_ids):
+            return await gmail_call(fetch_messages, service, message_ids,
+                                    format="metadata", metadata_headers=GMAIL_METADATA_HEADERS)
+
+        async def fetch_full(message_ids):
+            return await gmail_call(fetch_messages, service, message_ids)
+
+        full_messages = BatchedLookup(fetch_full, GMAIL_BATCH_SIZE)
+
+        async def generate(job):
+            return await generate_reply(job, full_messages)
+
+        async def ack(message_ids):
+            failed = await gmail_call(mark_read, service, message_ids)
+            logger.info(f"Marked {len(message_ids) - len(failed)} email(s) read")
+
+        async def store_cursor(history_id):
+            await async_db_manager.set_gmail_history_id(email_address, gmail_leases.owner, history_id)
+
+        def on_failure(message_ids):
+            # They are still unread, so the next sync's resync picks them up again
+            logger.warning(f"{len(message_ids)} message(s) failed; resyncing on the next check")
+            resync_requested.set()
+
+        pipeline = MailPipeline(
+            fetch, route_message, generate, send_reply, ack,
+            on_checkpoint=store_cursor if GMAIL_SYNC_MODE == "history" else None,
+            on_failure=on_failure,
+            generate_workers=GMAIL_GENERATE_WORKERS, send_workers=GMAIL_SEND_WORKERS,
+            queue_size=GMAIL_QUEUE_SIZE, fetch_batch=GMAIL_BATCH_SIZE, ack_batch=GMAIL_MODIFY_LIMIT
+        )
+
+        await gmail_leases.renew()
+        lease_task = asyncio.create_task(gmail_leases.run(request_resync))
+        history_id = await async_db_manager.get_gmail_history_id(email_address, gmail_leases.owner)
+        pipeline.start()
+        try:
+            while True:
+                # Pushes that arrive during this sync trigger another one
+                sync_requested.clear()
+                try:
+                    if GMAIL_PUSH_TOPIC and time.monotonic() >= next_watch:
+                        try:
+                            await gmail_call(watch_mailbox, service)
+                            next_watch = time.monotonic() + GMAIL_WATCH_RENEW_INTERVAL
+                        except HttpError as e:
+                            logger.error(f"Could not watch mailbox via {GMAIL_PUSH_TOPIC}: {e}")
+                    logger.info("Checking for new emails...")
+                    if resync_requested.is_set():
+                        resync_requested.clear()
+                        history_id = None
+                    message_ids, next_history_id = await gmail_call(find_new_messages, service, history_id)
+                    # Blocks while the pipeline is full; the cursor is stored once these are acked
+                    queued = await pipeline.submit(message_ids, next_history_id)
+                    history_id = next_history_id or history_id
+                    logger.info(f"Queued {queued} of {len(message_ids)} new email(s); {len(pipeline.in_flight)} in flight")
+
+                except RefreshError as e:
+                    logger.error(f"Token refresh error: {e}. Reinitializing Gmail service...")
+                    service = google_service_manager.get_gmail_service()
+                except Exception as e:
+                    logger.error(f"Error during email processing: {str(e)}")
+
+                logger.info(f"Finished checking for new emails. Waiting up to {GMAIL_POLL_INTERVAL} seconds for the next check.")
+                try:
+                    await asyncio.wait_for(sync_requested.wait(), GMAIL_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Messages still in the pipeline stay unread, ahead of the stored cursor
+            await pipeline.close()
+            lease_task.cancel()
+            await gmail_leases.release()
     except Exception as e:
         logger.error(f"Error during Gmail polling: {str(e)}")
         await asyncio.sleep(60)
+
 def extract_email_address(from_field: str) -> str:
     _, email_address = parseaddr(from_field)
     if not email_address:
@@ -147,10 +434,10 @@ async def read_user_by_email(email: str) -> dict:
     HTTPException: If user is not found or if a database error occurs.
     """
     logging.info(f"Attempting to read user by email: {email}")
-    
-    def db_operation():
+
+    async def db_operation():
         try:
-            user_data = get_user_data_by_field("email", email)
+            user_data = await async_db_manager.get_user_data_by_field("email", email)
             if user_data:
                 logging.info(f"User data retrieved successfully: {user_data}")
                 return user_data
@@ -162,7 +449,7 @@ async def read_user_by_email(email: str) -> dict:
             raise
 
     try:
-        user_data = await asyncio.get_event_loop().run_in_executor(None, db_operation)
+        user_data = await db_operation()
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
         return user_data
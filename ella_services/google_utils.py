@@ -18,7 +18,7 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 # Import modules after updating sys.path
-from ella_dbo.db_manager import get_db_connection, get_user_data_by_field
+from ella_dbo.db_manager import get_user_data_by_field
 from google_service_manager import google_service_manager
 from memgpt_email_router import email_router
 
@@ -44,10 +44,9 @@ class UserDataManager:
     def get_user_data(memgpt_user_id: str) -> dict:
         """Retrieve all data for a given user."""
         try:
-            with get_db_connection() as conn:
-                logging.info(f"Attempting to retrieve data for user_id: {memgpt_user_id}")
-                user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-                return user_data if user_data else {}
+            logging.info(f"Attempting to retrieve data for user_id: {memgpt_user_id}")
+            user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+            return user_data if user_data else {}
         except Exception as e:
             logging.error(f"Error retrieving user data: {str(e)}", exc_info=True)
             return {}
@@ -56,13 +55,12 @@ class UserDataManager:
     def get_user_timezone(memgpt_user_id: str) -> str:
         """Retrieve the timezone for a given user."""
         try:
-            with get_db_connection() as conn:
-                logging.info(f"Attempting to retrieve timezone for user_id: {memgpt_user_id}")
-                user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-                if user_data and 'local_timezone' in user_data:
-                    return user_data['local_timezone']
-                logging.warning(f"No timezone found for user {memgpt_user_id}. Using default: America/Los_Angeles")
-                return 'America/Los_Angeles'
+            logging.info(f"Attempting to retrieve timezone for user_id: {memgpt_user_id}")
+            user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+            if user_data and 'local_timezone' in user_data:
+                return user_data['local_timezone']
+            logging.warning(f"No timezone found for user {memgpt_user_id}. Using default: America/Los_Angeles")
+            return 'America/Los_Angeles'
         except Exception as e:
             logging.error(f"Error retrieving user timezone: {str(e)}", exc_info=True)
             return 'America/Los_Angeles'
@@ -71,15 +69,14 @@ class UserDataManager:
     def get_user_email(memgpt_user_id: str) -> Optional[str]:
         """Retrieve the email for a given user."""
         try:
-            with get_db_connection() as conn:
-                logging.info(f"Attempting to retrieve email for user_id: {memgpt_user_id}")
-                user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-                if user_data and 'email' in user_data:
-                    return user_data['email']
-                logging.warning(f"No email found for user {memgpt_user_id} in user_data: {user_data}")
-                default_email = "default@example.com"
-                logging.warning(f"Using default email {default_email} for user_id: {memgpt_user_id}")
-                return default_email
+            logging.info(f"Attempting to retrieve email for user_id: {memgpt_user_id}")
+            user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+            if user_data and 'email' in user_data:
+                return user_data['email']
+            logging.warning(f"No email found for user {memgpt_user_id} in user_data: {user_data}")
+            default_email = "default@example.com"
+            logging.warning(f"Using default email {default_email} for user_id: {memgpt_user_id}")
+            return default_email
         except Exception as e:
             logging.error(f"Error retrieving user email: {str(e)}", exc_info=True)
             return None
@@ -88,14 +85,13 @@ class UserDataManager:
     def get_user_reminder_prefs(memgpt_user_id: str) -> Dict[str, Union[int, str]]:
         """Retrieve the default reminder preferences for a given user."""
         try:
-            with get_db_connection() as conn:
-                user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-                if user_data:
-                    return {
-                        'default_reminder_time': user_data.get('default_reminder_time', 15),
-                        'reminder_method': user_data.get('reminder_method', 'email,sms')
-                    }
-                return {'default_reminder_time': 15, 'reminder_method': 'email,sms'}
+            user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+            if user_data:
+                return {
+                    'default_reminder_time': user_data.get('default_reminder_time', 15),
+                    'reminder_method': user_data.get('reminder_method', 'email,sms')
+                }
+            return {'default_reminder_time': 15, 'reminder_method': 'email,sms'}
         except Exception as e:
             logging.error(f"Error retrieving user reminder preferences: {str(e)}", exc_info=True)
             return {'default_reminder_time': 15, 'reminder_method': 'email,sms'}
@@ -104,13 +100,12 @@ class UserDataManager:
     def get_user_phone(memgpt_user_id: str) -> Optional[str]:
         """Retrieve the phone number for a given user."""
         try:
-            with get_db_connection() as conn:
-                logging.info(f"Attempting to retrieve phone number for user_id: {memgpt_user_id}")
-                user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-                if user_data and 'phone' in user_data:
-                    return user_data['phone']
-                logging.warning(f"No phone number found for user {memgpt_user_id}")
-                return None
+            logging.info(f"Attempting to retrieve phone number for user_id: {memgpt_user_id}")
+            user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+            if user_data and 'phone' in user_data:
+                return user_data['phone']
+            logging.warning(f"No phone number found for user {memgpt_user_id}")
+            return None
         except Exception as e:
             logging.error(f"Error retrieving user phone number: {str(e)}", exc_info=True)
             return None
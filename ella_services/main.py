@@ -4,7 +4,7 @@ import os
 import sys
 import logging
 from fastapi import FastAPI, HTTPException, Depends, Header, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Any, Dict, List, Optional
 from datetime import datetime
@@ -25,7 +25,8 @@ if parent_dir not in sys.path:
 
 # Import modules
 from utils import UserDataManager, EventManagementUtils
-from ella_dbo.models import Event, ConflictInfo, EventResponse, ScheduleEventRequest, UpdateEventData, UpdateEventRequest, ReminderRequest, EmailRequest
+from ella_dbo.db_manager import get_user_cache_stats
+from ella_dbo.models import Event, ConflictInfo, EventResponse, ScheduleEventRequest, UpdateEventData, UpdateEventRequest, ReminderRequest, EmailRequest, BulkScheduleEventsRequest, BulkEventsResponse
 from memgpt_email_router import email_router
 
 # Set up logging
@@ -70,7 +71,7 @@ async def schedule_event(request: ScheduleEventRequest, api_key: str = Depends(g
     try:
         logger.info(f"Scheduling event for user {request.user_id}: {request.event.summary}")
         
-        user_data = UserDataManager.get_user_data(request.user_id)
+        user_data = await UserDataManager.get_user_data_async(request.user_id)
         if not user_data:
             logger.error(f"User not found: {request.user_id}")
             raise HTTPException(status_code=404, detail=f"User not found: {request.user_id}")
@@ -106,7 +107,9 @@ async def schedule_event(request: ScheduleEventRequest, api_key: str = Depends(g
         logger.error(f"Unexpected error scheduling event: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-@app.get("/events", response_model=List[Event])
+# Records are returned as-is (see below), so the Event schema is only
+# documented, not applied through response_model.
+@app.get("/events", responses={200: {"model": List[Event]}})
 async def fetch_events(
     user_id: str,
     max_results: int = 10,
@@ -116,7 +119,7 @@ async def fetch_events(
     api_key: str = Depends(get_api_key)
 ):
     try:
-        user_data = UserDataManager.get_user_data(user_id)
+        user_data = await UserDataManager.get_user_data_async(user_id)
         if not user_data:
             raise HTTPException(status_code=404, detail=f"User not found: {user_id}")
 
@@ -129,13 +132,56 @@ async def fetch_events(
         )
 
         if result["success"]:
-            return [Event(**event) for event in result["events"]]
+            # Records come from our own database in the Event shape already;
+            # serialize them as-is instead of validating each one again.
+            return JSONResponse(content=result["events"])
         else:
             raise HTTPException(status_code=400, detail=result["message"])
     except Exception as e:
         logger.error(f"Unexpected error fetching events: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.post("/events/bulk", response_model=BulkEventsResponse)
+async def schedule_events_bulk(request: BulkScheduleEventsRequest, api_key: str = Depends(get_api_key)):
+    logger.info(f"Bulk importing {len(request.events)} events for user {request.user_id}")
+    try:
+        user_data = await UserDataManager.get_user_data_async(request.user_id)
+        if not user_data:
+            raise HTTPException(status_code=404, detail=f"User not found: {request.user_id}")
+
+        events = [event.model_dump(exclude_unset=True) for event in request.events]
+        result = await EventManagementUtils.schedule_events_bulk(request.user_id, events, user_data)
+
+        if "results" not in result:
+            raise HTTPException(status_code=400, detail=result["message"])
+        logger.info(f"Bulk import for user {request.user_id}: {result['created']} created, {result['failed']} failed")
+        return BulkEventsResponse(**result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error bulk importing events: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@app.get("/events/export")
+async def export_events(
+    user_id: str,
+    time_min: Optional[str] = None,
+    time_max: Optional[str] = None,
+    api_key: str = Depends(get_api_key)
+):
+    user_data = await UserDataManager.get_user_data_async(user_id)
+    if not user_data:
+        raise HTTPException(status_code=404, detail=f"User not found: {user_id}")
+    try:
+        start_ts, end_ts = EventManagementUtils.export_bounds(time_min, time_max)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time range: {str(e)}")
+
+    return StreamingResponse(
+        EventManagementUtils.export_events(user_id, start_ts, end_ts),
+        media_type="application/x-ndjson"
+    )
+
 @app.delete("/events/{event_id}")
 async def delete_event(
     event_id: str,
@@ -144,7 +190,7 @@ async def delete_event(
     api_key: str = Depends(get_api_key)
 ):
     try:
-        user_data = UserDataManager.get_user_data(user_id)
+        user_data = await UserDataManager.get_user_data_async(user_id)
         if not user_data:
             raise HTTPException(status_code=404, detail=f"User not found: {user_id}")
 
@@ -169,7 +215,7 @@ async def update_event(
     api_key: str = Depends(get_api_key)
 ):
     try:
-        user_data = UserDataManager.get_user_data(request.user_id)
+        user_data = await UserDataManager.get_user_data_async(request.user_id)
         if not user_data:
             raise HTTPException(status_code=404, detail=f"User not found: {request.user_id}")
 
@@ -210,7 +256,7 @@ async def send_email(request: EmailRequest, api_key: str = Depends(get_api_key))
     logger.info(f"Received request to send email for user: {request.user_id}")
     try:
         # Fetch user data
-        user_data = UserDataManager.get_user_data(request.user_id)
+        user_data = await UserDataManager.get_user_data_async(request.user_id)
         if not user_data:
             logger.error(f"User not found: {request.user_id}")
             raise HTTPException(status_code=404, detail=f"User not found: {request.user_id}")
@@ -248,7 +294,7 @@ async def send_email(request: EmailRequest, api_key: str = Depends(get_api_key))
 async def send_reminder(reminder: ReminderRequest, api_key: str = Depends(get_api_key)):
     logger.info(f"Received reminder request: {reminder}")
     try:
-        user_data = UserDataManager.get_user_data(reminder.user_id)
+        user_data = await UserDataManager.get_user_data_async(reminder.user_id)
         if not user_data:
             logger.error(f"User not found: {reminder.user_id}")
             raise HTTPException(status_code=404, detail=f"User not found: {reminder.user_id}")
@@ -269,14 +315,19 @@ async def send_reminder(reminder: ReminderRequest, api_key: str = Depends(get_ap
             "minutes_before": reminder.minutes_before
         }
 
-        result = await email_router.generate_and_send_email(
-            to_email=to_email,
-            subject=f"Reminder: {reminder.event_summary}",
-            context=context,
-            memgpt_user_api_key=memgpt_user_api_key,
-            agent_key=agent_key,
-            is_reply=False
-        )
+        subject = f"Reminder: {reminder.event_summary}"
+        if reminder.content:
+            # Text was pre-generated by the reminder service; just send it
+            result = await email_router.send_direct_email(to_email, subject, reminder.content)
+        else:
+            result = await email_router.generate_and_send_email(
+                to_email=to_email,
+                subject=subject,
+                context=context,
+                memgpt_user_api_key=memgpt_user_api_key,
+                agent_key=agent_key,
+                is_reminder=True
+            )
 
         if result['status'] == 'success':
             return {
@@ -293,12 +344,16 @@ async def send_reminder(reminder: ReminderRequest, api_key: str = Depends(get_ap
 
 @app.get("/debug/user/{user_id}")
 async def debug_user_data(user_id: str, api_key: str = Depends(get_api_key)):
-    user_data = UserDataManager.get_user_data(user_id)
+    user_data = await UserDataManager.get_user_data_async(user_id)
     if user_data:
         return {"user_found": True, "user_data": user_data}
     else:
         return {"user_found": False}
 
+@app.get("/debug/user_cache")
+async def debug_user_cache(api_key: str = Depends(get_api_key)):
+    return get_user_cache_stats()
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     logger.info(f"Received request: {request.method} {request.url}")
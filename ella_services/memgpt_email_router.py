@@ -130,6 +130,30 @@ class MemGPTEmailRouter:
             logger.error(f"Error in generate_and_send_email: {str(e)}", exc_info=True)
             return {"status": "failed", "message": str(e), "to_email": to_email}
 
+    async def generate_reply(self, context: Dict[str, Any], memgpt_user_api_key: str, agent_key: str) -> Optional[str]:
+        """Have the user's agent write a reply to the email described by context, without sending it.
+
+        Raises if the agent cannot be reached or returns no text.
+        """
+        return await self._generate_content(context, memgpt_user_api_key, agent_key, is_reminder=False)
+
+    async def generate_reminder(self, context: Dict[str, Any], memgpt_user_api_key: str, agent_key: str) -> Optional[str]:
+        """Have the user's agent write a reminder email for one event, without sending it.
+
+        context needs event_summary, event_start, event_end and minutes_before
+        (event_description is optional). Raises like generate_reply.
+        """
+        return await self._generate_content(context, memgpt_user_api_key, agent_key, is_reminder=True)
+
+    async def send_email(self, to_email: str, subject: str, body: str, message_id: Optional[str] = None,
+                         html_content: Optional[str] = None, attachments: Optional[List[str]] = None) -> Dict[str, str]:
+        """Send an email, threaded as a reply when message_id is given.
+
+        Returns {"status": "success" | "failed", ...} and does not raise.
+        """
+        return await self._send_email(to_email=to_email, subject=subject, body=body, message_id=message_id,
+                                      html_content=html_content, attachments=attachments)
+
     @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
     async def _call_memgpt_api(self, client, agent_key, instruction):
         logger.info(f"Calling MemGPT API with agent_key: {agent_key}")
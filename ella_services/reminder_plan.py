@@ -0,0 +1,164 @@
+# reminder_plan.py
+"""Compiled reminder plans, cached per event version and user preferences.
+
+A ReminderPlan is everything process_reminders used to work out on every
+poll: the occurrence's start as a UTC timestamp and each alert's absolute
+fire time and channel, from the event's customReminders, its reminder
+overrides or the user's defaults. Plans are cached under
+(event id, event version, start, timezone, reminder preferences), so an
+event update, a different occurrence or a change to the user's
+default_reminder_time / reminder_method compiles a fresh plan and the old
+one ages out of the LRU.
+"""
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+
+from ella_dbo.db_manager import to_utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_SIZE = int(os.getenv("ELLA_REMINDER_PLAN_CACHE_SIZE", "10000"))
+
+# Fallback reminder for events with no alerts left: at most this many minutes ahead.
+# Its ledger key does not depend on when it was planned, so re-plans find the
+# row of the first plan (and its fire time) instead of adding another popup.
+IMMEDIATE_REMINDER_MINUTES = 5
+IMMEDIATE_REMINDER_KEY = 'send_popup_immediate'
+
+# Same as the users table column defaults, for rows that predate them or hold NULL.
+DEFAULT_REMINDER_TIME = 15
+DEFAULT_REMINDER_METHOD = 'email,sms'
+
+
+def reminder_prefs(user_data: Dict[str, Any]) -> Tuple[int, str]:
+    """The user's (default_reminder_time, reminder_method)."""
+    minutes = user_data.get('default_reminder_time')
+    method = user_data.get('reminder_method')
+    return (DEFAULT_REMINDER_TIME if minutes is None else int(minutes)), (method or DEFAULT_REMINDER_METHOD)
+
+
+class ReminderPlan:
+    """Alerts of one event occurrence as (alert_ts, channel, minutes), in configuration order."""
+
+    __slots__ = ('start_ts', 'alerts')
+
+    def __init__(self, start_ts: int, alerts: Tuple[Tuple[int, str, int], ...]):
+        self.start_ts = start_ts
+        self.alerts = alerts
+
+    def __repr__(self):
+        return f"ReminderPlan(start_ts={self.start_ts!r}, alerts={self.alerts!r})"
+
+    def reminders_after(self, now_ts: float, user_timezone: str) -> List[Dict[str, Any]]:
+        """Reminders still to fire after now_ts, shaped like process_reminders' output.
+
+        When every configured alert has passed but the event has not started,
+        a popup reminder is added up to IMMEDIATE_REMINDER_MINUTES before it,
+        under the fixed IMMEDIATE_REMINDER_KEY.
+        """
+        zone = pytz.timezone(user_timezone)
+        reminders = [
+            {
+                'alert_time': datetime.fromtimestamp(alert_ts, zone),
+                'alert_type': f"send_{channel}",
+                'minutes': minutes
+            }
+            for alert_ts, channel, minutes in self.alerts if alert_ts > now_ts
+        ]
+        if not reminders and self.start_ts > now_ts:
+            minutes = int(min(IMMEDIATE_REMINDER_MINUTES, (self.start_ts - now_ts) // 60))
+            reminders.append({
+                'alert_time': datetime.fromtimestamp(self.start_ts - minutes * 60, zone),
+                'alert_type': 'send_popup',
+                'minutes': minutes,
+                'reminder_key': IMMEDIATE_REMINDER_KEY
+            })
+        return reminders
+
+
+def reminder_key(reminder: Dict[str, Any]) -> str:
+    """Ledger key of a reminder: its channel and lead time, or the fixed key of the fallback popup."""
+    return reminder.get('reminder_key') or f"{reminder['alert_type']}_{reminder['minutes']}"
+
+
+def compile_plan(event: Dict[str, Any], user_timezone: str, user_data: Dict[str, Any]) -> ReminderPlan:
+    """Work out an event occurrence's alerts from the event and the user's reminder defaults."""
+    start_ts = to_utc_timestamp(event['start'].get('dateTime', event['start'].get('date')), user_timezone)
+    alerts = []
+
+    def add_alert(minutes: int, channel: str):
+        alerts.append((start_ts - minutes * 60, channel, minutes))
+
+    if 'extendedProperties' in event and 'private' in event['extendedProperties']:
+        custom_reminders_str = event['extendedProperties']['private'].get('customReminders')
+        if custom_reminders_str:
+            try:
+                for reminder in json.loads(custom_reminders_str):
+                    add_alert(reminder['minutes'], reminder['type'])
+            except json.JSONDecodeError:
+                logger.warning(f"Invalid JSON in customReminders for event {event['id']}")
+
+    event_reminders = event.get('reminders') or {}
+    if event_reminders.get('useDefault', True):
+        default_reminder_time, reminder_method = reminder_prefs(user_data)
+        for channel in reminder_method.split(','):
+            add_alert(default_reminder_time, channel.strip())
+    else:
+        for reminder in event_reminders.get('overrides', []):
+            add_alert(reminder['minutes'], reminder['method'])
+
+    return ReminderPlan(start_ts, tuple(alerts))
+
+
+class ReminderPlanCache:
+    """LRU of compiled plans; a changed event or preference simply misses."""
+
+    def __init__(self, max_size: int = PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._plans: "OrderedDict[tuple, ReminderPlan]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._plans)
+
+    @staticmethod
+    def key(event: Dict[str, Any], user_timezone: str, user_data: Dict[str, Any]) -> tuple:
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        return event['id'], event.get('version'), start, user_timezone, reminder_prefs(user_data)
+
+    def get(self, event: Dict[str, Any], user_timezone: str, user_data: Dict[str, Any]) -> ReminderPlan:
+        key = self.key(event, user_timezone, user_data)
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+            self.hits += 1
+            return plan
+        self.misses += 1
+        plan = compile_plan(event, user_timezone, user_data)
+        if event.get('version') is None:
+            # Without a version an edit could not be told apart; don't cache
+            return plan
+        self._plans[key] = plan
+        if len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, event_id: str) -> int:
+        """Drop every cached plan of an event (e.g. once it is deleted)."""
+        keys = [key for key in self._plans if key[0] == event_id]
+        for key in keys:
+            del self._plans[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._plans.clear()
+
+
+reminder_plans = ReminderPlanCache()
@@ -0,0 +1,135 @@
+# reminder_scheduler.py
+"""In-memory priority queue of reminder fire times.
+
+The scheduler only decides *when* to wake up. Each entry is keyed by its
+delivery ledger key (event_id, occurrence_ts, reminder_key) and sits in a heap
+ordered by fire time; the run loop sleeps until the earliest entry is due (or
+until a newly scheduled entry is earlier) and hands every due entry to the
+fire callback. Entries are replaced or removed by key, and superseded heap
+items are skipped lazily when they reach the top.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+FireCallback = Callable[[List[Tuple[Hashable, Any]]], Awaitable[None]]
+
+
+class ReminderScheduler:
+    def __init__(self, fire: FireCallback, clock: Callable[[], float] = time.time):
+        self._fire = fire
+        self._clock = clock
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._entries: Dict[Hashable, Tuple[float, int, Any, Optional[Hashable]]] = {}
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key: Hashable, fire_ts: float, payload: Any = None, group: Optional[Hashable] = None) -> None:
+        """Add or move the entry for key; wakes the run loop if it is now the earliest."""
+        current = self._entries.get(key)
+        if current is not None and current[0] == fire_ts and current[3] == group:
+            self._entries[key] = (fire_ts, current[1], payload, group)
+            return
+        self.unschedule(key)
+        self._counter += 1
+        self._entries[key] = (fire_ts, self._counter, payload, group)
+        if group is not None:
+            self._groups.setdefault(group, set()).add(key)
+        heapq.heappush(self._heap, (fire_ts, self._counter, key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+
+    def unschedule(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        group = entry[3]
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+        return True
+
+    def replace_group(self, group: Hashable, entries: Iterable[Tuple[Hashable, float, Any]]) -> None:
+        """Make (key, fire_ts, payload) entries the complete schedule for group.
+
+        Entries of the group that are not in the new set are dropped, and
+        entries whose fire time did not change keep their heap position.
+        """
+        entries = list(entries)
+        keep = {key for key, _, _ in entries}
+        for key in self._groups.get(group, set()) - keep:
+            self.unschedule(key)
+        for key, fire_ts, payload in entries:
+            self.schedule(key, fire_ts, payload, group)
+
+    def groups(self) -> List[Hashable]:
+        """Groups that currently have entries."""
+        return list(self._groups)
+
+    def next_fire_ts(self) -> Optional[float]:
+        """Earliest live fire time, discarding superseded heap items on the way."""
+        while self._heap:
+            fire_ts, counter, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == counter:
+                return fire_ts
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[Hashable, Any]]:
+        """Remove and return (key, payload) for every entry due at or before now."""
+        now = self._clock() if now is None else now
+        due = []
+        while True:
+            fire_ts = self.next_fire_ts()
+            if fire_ts is None or fire_ts > now:
+                return due
+            _, _, key = heapq.heappop(self._heap)
+            payload = self._entries[key][2]
+            self.unschedule(key)
+            due.append((key, payload))
+
+    async def run(self) -> None:
+        """Sleep until the next entry is due, fire it, repeat. Idle when empty."""
+        while True:
+            self._wakeup.clear()
+            next_ts = self.next_fire_ts()
+            delay = None if next_ts is None else max(0.0, next_ts - self._clock())
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue  # schedule changed; recompute the next wake-up
+                except asyncio.TimeoutError:
+                    pass
+            due = self.pop_due()
+            if due:
+                # Fire in the background so a slow send never delays the next wake-up
+                task = asyncio.create_task(self._fire_safely(due))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _fire_safely(self, due: List[Tuple[Hashable, Any]]) -> None:
+        try:
+            await self._fire(due)
+        except Exception as e:
+            logger.error(f"Error firing {len(due)} reminder(s): {str(e)}", exc_info=True)
+
+    async def close(self) -> None:
+        """Wait for in-flight fire callbacks to finish."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
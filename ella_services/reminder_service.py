@@ -3,6 +3,8 @@ import json
 import logging
 import os
 import sys
+import time
+import zlib
 import asyncio
 import aiohttp
 from datetime import datetime, timedelta
@@ -61,130 +63,571 @@ reminder_app = FastAPI()
 #calendar_utils = GoogleCalendarUtils(google_service_manager.get_calendar_service())
 calendar_utils = EventManagementUtils()
 
-from ella_dbo.db_manager import get_user_data_by_field, get_active_users, get_db_connection
+from ella_dbo import async_db_manager
+from ella_dbo.db_manager import REMINDER_MAX_ATTEMPTS, shard_for
+from ella_dbo.event_feed import event_feed, DELETED
+from ella_dbo.leases import ShardLeases, WORKER_ID
+from reminder_scheduler import ReminderScheduler
+from reminder_plan import IMMEDIATE_REMINDER_KEY, reminder_key, reminder_plans
+
+# Reminders are planned from each user's next PLAN_HORIZON seconds of events,
+# when their events change and every PLAN_INTERVAL seconds, and fired at
+# their exact times by reminder_scheduler. Failed sends are retried after RETRY_DELAY seconds.
+PLAN_INTERVAL = int(os.getenv("ELLA_REMINDER_PLAN_INTERVAL", "900"))
+PLAN_HORIZON = 24 * 60 * 60
+RETRY_DELAY = 60
+# Where upcoming events are read from: "direct" goes through the repository
+# layer (ella_dbo), "http" calls the services API's /events endpoint for
+# deployments where the reminder service has no access to the database file.
+REMINDER_EVENT_SOURCE = os.getenv("ELLA_REMINDER_EVENT_SOURCE", "direct")
+HTTP_MAX_EVENTS = int(os.getenv("ELLA_REMINDER_HTTP_MAX_EVENTS", "500"))
+# Reminder text is generated up to PREGEN_LEAD seconds before the fire time,
+# spread over PREGEN_SPREAD seconds so top-of-the-hour meetings don't all hit
+# MemGPT at once, with at most PREGEN_CONCURRENCY generations in flight.
+PREGEN_LEAD = int(os.getenv("ELLA_REMINDER_PREGEN_LEAD", "1800"))
+PREGEN_SPREAD = max(1, PREGEN_LEAD // 2)
+PREGEN_CONCURRENCY = int(os.getenv("ELLA_REMINDER_PREGEN_CONCURRENCY", "4"))
+# Reminders for one user that fall due within COALESCE_WINDOW seconds of each
+# other go out together: one generated text and one send per channel. Later
+# reminders in the window are sent early by at most that much; 0 disables it.
+COALESCE_WINDOW = int(os.getenv("ELLA_REMINDER_COALESCE_WINDOW", "300"))
+# Fan-out limit and per-user / per-send time budgets.
+POLL_CONCURRENCY = int(os.getenv("ELLA_REMINDER_POLL_CONCURRENCY", "10"))
+USER_POLL_TIMEOUT = float(os.getenv("ELLA_REMINDER_USER_TIMEOUT", "20"))
+SEND_TIMEOUT = float(os.getenv("ELLA_REMINDER_SEND_TIMEOUT", "120"))
+
+# With several reminder workers each plans, claims and sends only the users
+# in the shards it holds a lease on.
+reminder_leases = ShardLeases("reminders")
+
+# One keep-alive session for all calls back to the services API, opened and
+# closed by reminder_app_lifespan.
+HTTP_POOL_SIZE = int(os.getenv("ELLA_REMINDER_HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("ELLA_REMINDER_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TOTAL_TIMEOUT = float(os.getenv("ELLA_REMINDER_HTTP_TIMEOUT", "120"))
+
+http_session: Optional[aiohttp.ClientSession] = None
+
+async def get_http_session() -> aiohttp.ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            headers={"X-API-Key": API_KEY}
+        )
+    return http_session
+
+async def close_http_session() -> None:
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+
+def reminder_delivery(memgpt_user_id: str, event: Dict[str, Any], reminder: Dict[str, Any]) -> Dict[str, Any]:
+    """Ledger row for one reminder of one event occurrence."""
+    fire_ts = int(reminder['alert_time'].timestamp())
+    return {
+        'event_id': event['id'],
+        'occurrence_ts': fire_ts + reminder['minutes'] * 60,
+        'reminder_key': reminder_key(reminder),
+        'user_id': memgpt_user_id,
+        'fire_ts': fire_ts,
+    }
+
+async def collect_user_reminders(user: Dict[str, Any]) -> List[tuple]:
+    """Fetch one user's upcoming events and return (delivery, context) pairs for their reminders."""
+    memgpt_user_id = user['memgpt_user_id']
+    user_data = await UserDataManager.get_user_data_async(memgpt_user_id)
+    if not user_data:
+        logger.warning(f"No user data found for ID: {memgpt_user_id}")
+        return []
+
+    user_timezone = user_data.get('local_timezone', 'UTC')
+    if not is_valid_timezone(user_timezone):
+        logger.warning(f"Invalid timezone for user {memgpt_user_id}: {user_timezone}. Using default.")
+        user_timezone = 'America/Los_Angeles'
+    
+    events_result = await fetch_upcoming_events_for_user(memgpt_user_id, user_timezone)
+    if not events_result.get('success'):
+        logger.error(f"Failed to fetch events for user {memgpt_user_id}: {events_result.get('message', 'Unknown error')}")
+        return []
+
+    collected = []
+    current_time = datetime.now(pytz.timezone(user_timezone))
+    for event in events_result.get('events', []):
+        event_summary = format_event_summary(event, user_timezone, current_time, user_data)
+        logger.info(f"Processing event: {event_summary}")
+        
+        for reminder in process_reminders(event, user_timezone, current_time, user_data):
+            collected.append((reminder_delivery(memgpt_user_id, event, reminder), (event, reminder, user_timezone)))
+    return collected
+
+async def _bounded(semaphore: asyncio.Semaphore, timeout: float, coro):
+    async with semaphore:
+        return await asyncio.wait_for(coro, timeout)
+
+async def fire_due_reminders(due: List[tuple]) -> None:
+    """reminder_scheduler callback: claim every due reminder from the ledger and send it.
+
+    The ledger, not the heap, decides what is sent, so reminders left pending
+    by a failed attempt or a previous run go out here too. Only reminders in
+    the shards this worker holds are claimed. Each user's reminders, plus any
+    of theirs due within COALESCE_WINDOW, are sent together.
+    """
+    shards = reminder_leases.shards
+    if not shards:
+        return
+    context = {key: payload for key, payload in due if payload is not None}
+    now = int(time.time())
+    claimed = await async_db_manager.claim_due_reminders(WORKER_ID, now, shards)
+    if claimed and COALESCE_WINDOW > 0:
+        # Bring forward these users' reminders that would fire within the window
+        user_ids = list({delivery['user_id'] for delivery in claimed})
+        claimed += await async_db_manager.claim_user_reminders(WORKER_ID, user_ids, now + COALESCE_WINDOW)
+
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for delivery in claimed:
+        reminder_scheduler.unschedule(delivery_key(delivery))
+        by_user.setdefault(delivery['user_id'], []).append(delivery)
+    sends = await asyncio.gather(
+        *(deliver_user_reminders(user_id, deliveries, context, send_semaphore) for user_id, deliveries in by_user.items()),
+        return_exceptions=True
+    )
+    for user_id, result in zip(by_user, sends):
+        if isinstance(result, Exception):
+            logger.error(f"Error delivering reminders for user {user_id}: {str(result)}", exc_info=result)
+
+def delivery_key(delivery: Dict[str, Any]) -> tuple:
+    return (delivery['event_id'], delivery['occurrence_ts'], delivery['reminder_key'])
+
+def reminder_context(event: Dict[str, Any], reminder: Dict[str, Any]) -> Dict[str, Any]:
+    """Event details the reminder text is written from."""
+    return {
+        "event_summary": event['summary'],
+        "event_start": event['start'].get('dateTime', event['start'].get('date')),
+        "event_end": event['end'].get('dateTime', event['end'].get('date')),
+        "event_description": event.get('description', ''),
+        "minutes_before": reminder['minutes']
+    }
+
+def reminder_text_key(key: tuple) -> tuple:
+    """(event_id, occurrence_ts, minutes): reminders sharing it get the same text on every channel."""
+    return key[0], key[1], key[2].rsplit('_', 1)[1]
+
+def pregen_time(key: tuple, fire_ts: int) -> int:
+    """When to generate a reminder's text: a stable offset inside the lead window, shared across channels."""
+    return fire_ts - PREGEN_LEAD + zlib.crc32(repr(reminder_text_key(key)).encode()) % PREGEN_SPREAD
+
+async def pregenerate_reminders(due: List[tuple]) -> None:
+    """pregen_scheduler callback: write reminder text for due entries that have none for their event version.
+
+    The text is generated once per occurrence and lead time and stored under
+    every channel's reminder key.
+    """
+    groups: Dict[tuple, list] = {}
+    for key, payload in due:
+        if payload is not None:
+            groups.setdefault(reminder_text_key(key), []).append((key, payload))
+
+    async def pregenerate(entries):
+        memgpt_user_id, event, reminder = entries[0][1]
+        version = event.get('version') or 1
+        missing = [key for key, _ in entries if not await async_db_manager.get_reminder_content(*key, version)]
+        if not missing:
+            return
+        async with pregen_semaphore:
+            user = await async_db_manager.get_user(memgpt_user_id)
+            if not user:
+                return
+            content = await email_router.generate_reminder(
+                reminder_context(event, reminder), user['memgpt_user_api_key'], user['default_agent_key'])
+        if content:
+            for key in missing:
+                await async_db_manager.store_reminder_content(*key, version, content)
+            logger.info(f"Pre-generated {len(missing)} reminder(s) for event {event['id']} (version {version})")
+
+    results = await asyncio.gather(*(pregenerate(entries) for entries in groups.values()), return_exceptions=True)
+    for text_key, result in zip(groups, results):
+        if isinstance(result, Exception):
+            # Not fatal: the text is generated at send time instead
+            logger.warning(f"Could not pre-generate reminders for event {text_key[0]}: {str(result)}")
+
+send_semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+pregen_semaphore = asyncio.Semaphore(PREGEN_CONCURRENCY)
+reminder_scheduler = ReminderScheduler(fire_due_reminders)
+pregen_scheduler = ReminderScheduler(pregenerate_reminders)
+
+async def plan_users(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Plan the given users' upcoming reminders and return their ledger rows.
+
+    Users are fetched concurrently, at most POLL_CONCURRENCY at a time and
+    each within USER_POLL_TIMEOUT; a user that fails keeps their previous
+    plan. Each user's reminders replace their entries in reminder_scheduler,
+    so only reminders that actually moved change position in the heap. The
+    ledger rows are written first, so an entry that comes due right away
+    always finds its row to claim.
+    """
+    semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_bounded(semaphore, USER_POLL_TIMEOUT, collect_user_reminders(user)) for user in users),
+        return_exceptions=True
+    )
+
+    deliveries = []
+    groups = []
+    for user, result in zip(users, results):
+        memgpt_user_id = user['memgpt_user_id']
+        if isinstance(result, asyncio.TimeoutError):
+            logger.error(f"Timed out polling events for user {memgpt_user_id} after {USER_POLL_TIMEOUT}s")
+            continue
+        if isinstance(result, Exception):
+            logger.error(f"Error polling events for user {memgpt_user_id}: {str(result)}", exc_info=result)
+            continue
+        entries = []
+        pregen_entries = []
+        for delivery, delivery_context in result:
+            deliveries.append(delivery)
+            key = (delivery['event_id'], delivery['occurrence_ts'], delivery['reminder_key'])
+            entries.append((key, delivery['fire_ts'], delivery_context))
+            event, reminder, _ = delivery_context
+            pregen_entries.append((key, pregen_time(key, delivery['fire_ts']), (memgpt_user_id, event, reminder)))
+        groups.append((memgpt_user_id, entries, pregen_entries))
+
+    await async_db_manager.schedule_reminders(deliveries)
+    for memgpt_user_id, entries, pregen_entries in groups:
+        reminder_scheduler.replace_group(memgpt_user_id, entries)
+        pregen_scheduler.replace_group(memgpt_user_id, pregen_entries)
+    return deliveries
+
+async def run_plan_cycle() -> Dict[str, int]:
+    """Plan the upcoming reminders of every active user in this worker's shards.
+
+    Returns counters for the cycle log. With event changes arriving through
+    event_feed this is a safety net that also rolls the planning horizon forward.
+    """
+    # Keep recurring series materialized ahead of the planning horizon
+    await async_db_manager.extend_occurrences()
+    replay = await replay_missed_reminders()
+    active_users = [user for user in await async_db_manager.get_active_users()
+                    if reminder_leases.owns(user['memgpt_user_id'])]
+    deliveries = await plan_users(active_users)
+
+    # Pick up pending reminders this process did not plan itself
+    # (retries, a restart, shards taken over from another worker).
+    for row in await async_db_manager.get_pending_reminders(int(time.time()) + PLAN_HORIZON,
+                                                            reminder_leases.shards):
+        key = (row['event_id'], row['occurrence_ts'], row['reminder_key'])
+        if key not in reminder_scheduler:
+            reminder_scheduler.schedule(key, row['fire_ts'])
+    await async_db_manager.prune_reminder_deliveries()
+    await async_db_manager.prune_reminder_content()
+    await async_db_manager.prune_event_changes()
+    return {'users': len(active_users), 'reminders': len(deliveries), 'scheduled': len(reminder_scheduler),
+            'replayed': replay['replay']}
+
+async def replay_missed_reminders() -> Dict[str, int]:
+    """Send reminders that fell due while no worker was firing them (downtime, a deploy, a takeover).
+
+    The ledger decides what is worth replaying (see
+    db_manager.settle_missed_reminders); the replays are then claimed and
+    sent in parallel, grouped per user, by fire_due_reminders.
+    """
+    shards = reminder_leases.shards
+    if not shards:
+        return {'replay': 0, 'stale': 0, 'capped': 0}
+    outcome = await async_db_manager.settle_missed_reminders(shards)
+    if outcome['stale'] or outcome['capped']:
+        logger.warning(f"Recorded {outcome['stale'] + outcome['capped']} missed reminder(s): {outcome['stale']} for events "
+                       f"already started, {outcome['capped']} over the per-user catch-up limit")
+    if outcome['replay']:
+        logger.info(f"Replaying {outcome['replay']} overdue reminder(s)")
+        await fire_due_reminders([])
+    return outcome
+
+async def follow_event_changes():
+    """Re-plan just the users whose events changed, as changes are published."""
+    logger.info("Following event changes")
+    async for changes in event_feed.subscribe():
+        for change in changes:
+            if change['op'] == DELETED:
+                reminder_plans.invalidate(change['event_id'])
+        user_ids = {change['user_id'] for change in changes if reminder_leases.owns(change['user_id'])}
+        if not user_ids:
+            continue
+        try:
+            users = [user for user in await asyncio.gather(*(async_db_manager.get_user(uid) for uid in user_ids)) if user]
+            deliveries = await plan_users(users)
+            logger.info(f"Re-planned {len(users)} user(s) after {len(changes)} event change(s): {len(deliveries)} upcoming reminders")
+        except Exception as e:
+            logger.error(f"Error applying event changes: {str(e)}", exc_info=True)
+
+async def rebalance_shards(gained: set, lost: set) -> None:
+    """reminder_leases callback: drop users whose shards moved away and plan the ones that arrived."""
+    for memgpt_user_id in reminder_scheduler.groups() + pregen_scheduler.groups():
+        if not reminder_leases.owns(memgpt_user_id):
+            reminder_scheduler.replace_group(memgpt_user_id, [])
+            pregen_scheduler.replace_group(memgpt_user_id, [])
+    if gained:
+        await replay_missed_reminders()
+        users = [user for user in await async_db_manager.get_active_users()
+                 if shard_for(user['memgpt_user_id']) in gained]
+        deliveries = await plan_users(users)
+        logger.info(f"Planned {len(users)} user(s) from {len(gained)} newly held shard(s): {len(deliveries)} upcoming reminders")
 
 async def poll_calendar_for_events():
     logger.info("Starting Calendar polling task")
     
     while True:
-        logger.info("Polling for upcoming events...")
+        logger.info("Planning upcoming reminders...")
+        started = time.monotonic()
         try:
-            active_users = get_active_users()
-            for user in active_users:
-                memgpt_user_id = user['memgpt_user_id']
-                user_data = UserDataManager.get_user_data(memgpt_user_id)
-                if not user_data:
-                    logger.warning(f"No user data found for ID: {memgpt_user_id}")
-                    continue
-
-                user_timezone = user_data.get('local_timezone', 'UTC')
-                if not is_valid_timezone(user_timezone):
-                    logger.warning(f"Invalid timezone for user {memgpt_user_id}: {user_timezone}. Using default.")
-                    user_timezone = 'America/Los_Angeles'
-                
-                events_result = await fetch_upcoming_events_for_user(memgpt_user_id, user_timezone)
-                
-                if events_result.get('success'):
-                    events = events_result.get('events', [])
-                    current_time = datetime.now(pytz.timezone(user_timezone))
-                    
-                    for event in events:
-                        event_summary = format_event_summary(event, user_timezone, current_time, user_data)
-                        logger.info(f"Processing event: {event_summary}")
-                        
-                        reminders = process_reminders(event, user_timezone, current_time, user_data)
-                        for reminder in reminders:
-                            alert_time = reminder['alert_time']
-                            if current_time <= alert_time <= (current_time + timedelta(minutes=5)):
-                                reminder_key = f"{reminder['alert_type']}_{reminder['minutes']}"
-                                
-                                if not EventManagementUtils.check_reminder_status(memgpt_user_id, event['id'], reminder_key):
-                                    result = await send_reminder_via_api(memgpt_user_id, event, reminder, user_timezone)
-                                    if result and result.get('success'):
-                                        if EventManagementUtils.update_reminder_status(memgpt_user_id, event['id'], reminder_key):
-                                            logger.info(f"Sent and recorded reminder: {reminder_key} for event {event['id']}")
-                                        else:
-                                            logger.warning(f"Sent reminder but failed to record status: {reminder_key} for event {event['id']}")
-                                    else:
-                                        logger.error(f"Failed to send reminder via API for event {event['id']}")
-                                else:
-                                    logger.info(f"Reminder already sent: {reminder_key} for event {event['id']}")
-                else:
-                    logger.error(f"Failed to fetch events for user {memgpt_user_id}: {events_result.get('message', 'Unknown error')}")
-        
+            stats = await run_plan_cycle()
+            elapsed = time.monotonic() - started
+            logger.info(f"Planning cycle took {elapsed:.2f}s: {stats['users']} users, "
+                        f"{stats['reminders']} upcoming reminders, {stats['scheduled']} scheduled, "
+                        f"{stats['replayed']} replayed")
         except Exception as e:
-            logger.error(f"Error during polling: {str(e)}", exc_info=True)
-        
-        logger.info("Finished checking for upcoming events. Waiting for 1 minute before the next check.")
-        await asyncio.sleep(60)  # Check every 1 minute
+            elapsed = time.monotonic() - started
+            logger.error(f"Error during planning after {elapsed:.2f}s: {str(e)}", exc_info=True)
+
+        if elapsed > PLAN_INTERVAL:
+            logger.warning(f"Planning cycle overran the {PLAN_INTERVAL}s interval by {elapsed - PLAN_INTERVAL:.2f}s")
+        # Keep a steady cadence: the next cycle starts PLAN_INTERVAL after this one started
+        await asyncio.sleep(max(0, PLAN_INTERVAL - elapsed))
+
+async def load_delivery_context(delivery: Dict[str, Any], context: Dict[tuple, tuple]) -> Optional[tuple]:
+    """(event, reminder, user_timezone) for a claimed reminder, or None if its event is gone.
+
+    Reminders planned elsewhere (an earlier run, a retry, or a worker that
+    died holding the claim) have no context here, so their event is reloaded.
+    """
+    key = delivery_key(delivery)
+    if key in context:
+        return context[key]
+    event = await async_db_manager.get_event(delivery['event_id'])
+    if not event:
+        return None
+    user_timezone = event.get('local_timezone') or 'UTC'
+    duration = parse_datetime(event['end']['dateTime'], user_timezone) - parse_datetime(event['start']['dateTime'], user_timezone)
+    occurrence_start = datetime.fromtimestamp(delivery['occurrence_ts'], pytz.timezone(user_timezone))
+    event['start'] = {'dateTime': occurrence_start.isoformat(), 'timeZone': user_timezone}
+    event['end'] = {'dateTime': (occurrence_start + duration).isoformat(), 'timeZone': user_timezone}
+    if delivery['reminder_key'] == IMMEDIATE_REMINDER_KEY:
+        alert_type, minutes = 'send_popup', (delivery['occurrence_ts'] - delivery['fire_ts']) // 60
+    else:
+        alert_type, minutes = delivery['reminder_key'].rsplit('_', 1)
+    reminder = {
+        'alert_time': datetime.fromtimestamp(delivery['fire_ts'], pytz.timezone(user_timezone)),
+        'alert_type': alert_type,
+        'minutes': int(minutes),
+        'reminder_key': delivery['reminder_key'],
+    }
+    return event, reminder, user_timezone
+
+async def send_and_record(memgpt_user_id: str, deliveries: List[Dict[str, Any]], entry: tuple,
+                          content: Optional[str], semaphore: asyncio.Semaphore) -> None:
+    """Send one reminder request on behalf of deliveries and record the outcome for each of them.
+
+    Failed sends that have attempts left are rescheduled.
+    """
+    event, reminder, user_timezone = entry
+    label = f"{reminder['alert_type']} reminder for event {event['id']}"
+    try:
+        result = await _bounded(semaphore, SEND_TIMEOUT,
+                                send_reminder_via_api(memgpt_user_id, event, reminder, user_timezone, content))
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out sending {label} after {SEND_TIMEOUT}s")
+        result = None
+    except Exception as e:
+        logger.error(f"Error sending {label}: {str(e)}", exc_info=True)
+        result = None
+    success = bool(result and result.get('success'))
+    for delivery in deliveries:
+        key = delivery_key(delivery)
+        await async_db_manager.complete_reminder(*key, success=success,
+                                                 error=None if success else "Reminder API call failed")
+        if not success and delivery['attempts'] < REMINDER_MAX_ATTEMPTS:
+            reminder_scheduler.schedule(key, time.time() + RETRY_DELAY, entry if len(deliveries) == 1 else None)
+    if success:
+        logger.info(f"Sent and recorded {label} ({len(deliveries)} reminder(s))")
+    else:
+        logger.error(f"Failed to send {label} via API")
+
+async def deliver_claimed_reminder(delivery: Dict[str, Any], context: Dict[tuple, tuple],
+                                   semaphore: asyncio.Semaphore) -> None:
+    """Send one claimed reminder, using its pre-generated text if there is any."""
+    key = delivery_key(delivery)
+    entry = await load_delivery_context(delivery, context)
+    if entry is None:
+        await async_db_manager.complete_reminder(*key, success=False, error="Event no longer exists")
+        return
+    content = await async_db_manager.get_reminder_content(*key, entry[0].get('version') or 1)
+    if not content:
+        logger.info(f"No pre-generated text for reminder {key[2]} of event {key[0]}; generating at send time")
+    await send_and_record(delivery['user_id'], [delivery], entry, content, semaphore)
+
+DIGEST_INSTRUCTION = (
+    "Generate one reminder message covering these upcoming events, in start order:\n"
+    "{events}\n\n"
+    "Write a single friendly and informative reminder that mentions every event with its time."
+)
+
+def digest_event(entries: List[tuple]) -> Dict[str, Any]:
+    """Stand-in event for a digest send: all summaries, first start to last end."""
+    events = [event for event, _, _ in entries]
+    return {
+        'id': events[0]['id'],
+        'summary': "; ".join(event['summary'] for event in events),
+        'start': events[0]['start'],
+        'end': max((event['end'] for event in events), key=lambda end: end.get('dateTime', end.get('date'))),
+        'description': '',
+    }
+
+async def generate_coalesced_content(memgpt_user_id: str, entries: List[tuple],
+                                     keys: List[tuple]) -> Optional[str]:
+    """One text for all of a user's coalesced reminders: the cached text for a single
+    occurrence, otherwise one agent call (a digest when several events are due)."""
+    event, reminder, _ = entries[0]
+    if len(entries) == 1:
+        for key in keys:
+            content = await async_db_manager.get_reminder_content(*key, event.get('version') or 1)
+            if content:
+                return content
+    user = await async_db_manager.get_user(memgpt_user_id)
+    if not user:
+        return None
+    if len(entries) == 1:
+        return await email_router.generate_reminder(
+            reminder_context(event, reminder), user['memgpt_user_api_key'], user['default_agent_key'])
+    lines = []
+    for event, reminder, _ in entries:
+        context = reminder_context(event, reminder)
+        lines.append(f"- {context['event_summary']}: {context['event_start']} to {context['event_end']}"
+                     + (f" ({context['event_description']})" if context['event_description'] else ""))
+    return await email_router.generate_reminder_content(
+        {"events": "\n".join(lines)}, user['memgpt_user_api_key'], user['default_agent_key'], DIGEST_INSTRUCTION)
+
+async def deliver_user_reminders(memgpt_user_id: str, deliveries: List[Dict[str, Any]],
+                                 context: Dict[tuple, tuple], semaphore: asyncio.Semaphore) -> None:
+    """Send a user's claimed reminders as one text per channel.
+
+    Reminders for the same occurrence share its text; several occurrences are
+    summarized in one digest. If the text cannot be generated here, each
+    reminder is sent on its own instead.
+    """
+    if len(deliveries) == 1:
+        await deliver_claimed_reminder(deliveries[0], context, semaphore)
+        return
+
+    occurrences: Dict[tuple, tuple] = {}
+    channels: Dict[str, List[Dict[str, Any]]] = {}
+    resolved = []
+    for delivery in deliveries:
+        entry = await load_delivery_context(delivery, context)
+        if entry is None:
+            await async_db_manager.complete_reminder(*delivery_key(delivery), success=False, error="Event no longer exists")
+            continue
+        resolved.append((delivery, entry))
+        occurrences.setdefault((delivery['event_id'], delivery['occurrence_ts']), entry)
+        channels.setdefault(entry[1]['alert_type'], []).append(delivery)
+    if not resolved:
+        return
+
+    entries = sorted(occurrences.values(), key=lambda entry: entry[1]['alert_time'] + timedelta(minutes=entry[1]['minutes']))
+    try:
+        content = await generate_coalesced_content(memgpt_user_id, entries, [delivery_key(d) for d, _ in resolved])
+    except Exception as e:
+        logger.warning(f"Could not generate coalesced reminder for user {memgpt_user_id}: {str(e)}")
+        content = None
+    if not content:
+        await asyncio.gather(*(send_and_record(memgpt_user_id, [delivery], entry, None, semaphore)
+                               for delivery, entry in resolved))
+        return
+
+    event = entries[0][0] if len(entries) == 1 else digest_event(entries)
+    user_timezone = entries[0][2]
+    logger.info(f"Coalesced {len(resolved)} reminder(s) for {len(entries)} event(s) of user {memgpt_user_id} "
+                f"into {len(channels)} send(s)")
+    await asyncio.gather(*(
+        send_and_record(memgpt_user_id, channel_deliveries,
+                        (event, dict(entries[0][1], alert_type=alert_type), user_timezone), content, semaphore)
+        for alert_type, channel_deliveries in channels.items()
+    ))
 
 async def fetch_upcoming_events_for_user(user_id: str, user_timezone: str) -> dict:
+    """Return the user's events in the next PLAN_HORIZON, via the repository or the services API."""
+    if REMINDER_EVENT_SOURCE == 'http':
+        return await fetch_upcoming_events_via_api(user_id, user_timezone)
+
+    now_ts = int(time.time())
+    events = await async_db_manager.get_events_overlapping(user_id, now_ts, now_ts + PLAN_HORIZON)
+    logger.info(f"Fetched {len(events)} events for user {user_id}")
+    return {"success": True, "events": [event.to_event(user_timezone) for event in events]}
+
+async def fetch_upcoming_events_via_api(user_id: str, user_timezone: str) -> dict:
     time_min = datetime.now(pytz.timezone(user_timezone)).isoformat()
-    time_max = (datetime.now(pytz.timezone(user_timezone)) + timedelta(days=1)).isoformat()
+    time_max = (datetime.now(pytz.timezone(user_timezone)) + timedelta(seconds=PLAN_HORIZON)).isoformat()
     logger.info(f"Fetching events for user {user_id} between {time_min} and {time_max}")
     
     url = f"{API_BASE_URL}/events"
     params = {
         "user_id": user_id,
-        "max_results": 10,
+        "max_results": HTTP_MAX_EVENTS,
         "time_min": time_min,
         "time_max": time_max,
         "local_timezone": user_timezone
     }
-    headers = {"X-API-Key": API_KEY}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params, headers=headers) as response:
-            if response.status == 200:
-                events = await response.json()
-                logger.info(f"Fetched events for user {user_id}")
-                return {"success": True, "events": events}
-            else:
-                error_text = await response.text()
-                logger.error(f"Failed to fetch events. Status: {response.status}, Error: {error_text}")
-                return {"success": False, "message": f"Failed to fetch events: {error_text}"}
-
-async def send_reminder_via_api(user_id: str, event: dict, reminder: dict, user_timezone: str):
+    session = await get_http_session()
+    async with session.get(url, params=params) as response:
+        if response.status == 200:
+            events = await response.json()
+            logger.info(f"Fetched events for user {user_id}")
+            if len(events) >= HTTP_MAX_EVENTS:
+                logger.warning(f"User {user_id} has at least {HTTP_MAX_EVENTS} upcoming events; later ones are not planned")
+            return {"success": True, "events": events}
+        else:
+            error_text = await response.text()
+            logger.error(f"Failed to fetch events. Status: {response.status}, Error: {error_text}")
+            return {"success": False, "message": f"Failed to fetch events: {error_text}"}
+
+async def send_reminder_via_api(user_id: str, event: dict, reminder: dict, user_timezone: str,
+                                content: Optional[str] = None):
     url = f"{API_BASE_URL}/send_reminder"
-    headers = {
-        "X-API-Key": API_KEY,
-        "Content-Type": "application/json"
-    }
-    
+    context = reminder_context(event, reminder)
     payload = {
         "user_id": user_id,
         "event_id": event['id'],
-        "event_summary": event['summary'],
-        "event_start": event['start'].get('dateTime', event['start'].get('date')),
-        "event_end": event['end'].get('dateTime', event['end'].get('date')),
-        "event_description": event.get('description', ''),
+        "event_summary": context['event_summary'],
+        "event_start": context['event_start'],
+        "event_end": context['event_end'],
+        "event_description": context['event_description'],
         "reminder_type": reminder['alert_type'],
-        "minutes_before": reminder['minutes']
+        "minutes_before": reminder['minutes'],
+        "content": content
     }
 
     logger.debug(f"Sending reminder payload: {payload}")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                result = await response.json()
-                logger.info(f"Reminder sent successfully for event {event['id']}")
-                return result
-            else:
-                error_text = await response.text()
-                logger.error(f"Failed to send reminder. Status: {response.status}, Error: {error_text}")
-                return None
+    session = await get_http_session()
+    async with session.post(url, json=payload) as response:
+        if response.status == 200:
+            result = await response.json()
+            logger.info(f"Reminder sent successfully for event {event['id']}")
+            return result
+        else:
+            error_text = await response.text()
+            logger.error(f"Failed to send reminder. Status: {response.status}, Error: {error_text}")
+            return None
 
 async def debug_user_data(user_id: str):
     url = f"{API_BASE_URL}/debug/user/{user_id}"
-    headers = {"X-API-Key": API_KEY}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                return None
+    session = await get_http_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            return await response.json()
+        else:
+            return None
 
 def convert_to_utc_time(local_time_str, timezone='America/Los_Angeles'):
     return parse_datetime(local_time_str, timezone).astimezone(pytz.UTC)
@@ -193,44 +636,8 @@ def convert_to_local_time(utc_time_str, timezone='America/Los_Angeles'):
     return parse_datetime(utc_time_str, 'UTC').astimezone(pytz.timezone(timezone))
 
 def process_reminders(event: Dict[str, Any], user_timezone: str, current_time: datetime, user_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    processed_reminders = []
-    start_time = parse_datetime(event['start'].get('dateTime', event['start'].get('date')), user_timezone)
-    time_until_event = start_time - current_time
-
-    def add_reminder(minutes: int, reminder_type: str):
-        alert_time = start_time - timedelta(minutes=minutes)
-        if alert_time > current_time:
-            processed_reminders.append({
-                'alert_time': alert_time,
-                'alert_type': f"send_{reminder_type}",
-                'minutes': minutes
-            })
-
-    if 'extendedProperties' in event and 'private' in event['extendedProperties']:
-        custom_reminders_str = event['extendedProperties']['private'].get('customReminders')
-        if custom_reminders_str:
-            try:
-                custom_reminders = json.loads(custom_reminders_str)
-                for reminder in custom_reminders:
-                    add_reminder(reminder['minutes'], reminder['type'])
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON in customReminders for event {event['id']}")
-
-    if event['reminders'].get('useDefault', True):
-        default_reminder_time = user_data.get('default_reminder_time', 30)
-        default_methods = user_data.get('reminder_method', 'popup').split(',')
-        
-        for method in default_methods:
-            add_reminder(default_reminder_time, method)
-    else:
-        for reminder in event['reminders'].get('overrides', []):
-            add_reminder(reminder['minutes'], reminder['method'])
-
-    if not processed_reminders and time_until_event > timedelta(0):
-        immediate_reminder_minutes = min(5, max(0, time_until_event.total_seconds() // 60))
-        add_reminder(int(immediate_reminder_minutes), 'popup')
-
-    return processed_reminders
+    """Reminders still to fire for an event, read from its compiled plan (see reminder_plan)."""
+    return reminder_plans.get(event, user_timezone, user_data).reminders_after(current_time.timestamp(), user_timezone)
 
 async def send_alert_to_llm(
     event: Dict[str, Any], 
@@ -268,7 +675,7 @@ async def send_alert_to_llm(
             "reminder_type": reminder['alert_type']
         }
 
-        user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
+        user_data = await async_db_manager.get_user(memgpt_user_id)
         reminder_content = await generate_reminder_content(context, user_data['memgpt_user_api_key'], user_data['default_agent_key'], instruction_template)
         
         if not reminder_content:
@@ -371,12 +778,26 @@ def format_event_summary(event: Dict[str, Any], user_timezone: str, current_time
 @asynccontextmanager
 async def reminder_app_lifespan(app: FastAPI):
     logger.info("Reminder app startup tasks")
-    task = asyncio.create_task(poll_calendar_for_events())
+    await get_http_session()
+    # Hold shards before the first planning cycle so it has users to plan
+    await reminder_leases.renew()
+    tasks = [
+        asyncio.create_task(reminder_leases.run(rebalance_shards)),
+        asyncio.create_task(reminder_scheduler.run()),
+        asyncio.create_task(pregen_scheduler.run()),
+        asyncio.create_task(follow_event_changes()),
+        asyncio.create_task(poll_calendar_for_events()),
+    ]
     try:
         yield
     finally:
-        task.cancel()
-        await task
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await reminder_scheduler.close()
+        await pregen_scheduler.close()
+        await reminder_leases.release()
+        await close_http_session()
         await voice_call_manager.close()
 
 reminder_app.router.lifespan_context = reminder_app_lifespan
@@ -0,0 +1,58 @@
+import base64
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from email_parsing import decode_body_data, extract_body, parse_email_headers, parse_email_message
+
+HEADERS = [
+    {"name": "From", "value": "Ann <ann@example.com>"},
+    {"name": "To", "value": "ella@example.com"},
+    {"name": "Subject", "value": "Lunch"},
+]
+
+
+def encode(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def part(mime_type, text=None, **extra):
+    body = {"data": encode(text)} if text is not None else {}
+    body.update(extra.pop("body", {}))
+    return dict(mimeType=mime_type, body=body, **extra)
+
+
+def test_metadata_message_has_headers_but_no_body():
+    message = {"id": "m1", "payload": {"mimeType": "multipart/alternative", "headers": HEADERS}}
+    assert parse_email_headers(message) == {"subject": "Lunch", "from": "Ann <ann@example.com>", "to": "ella@example.com"}
+    assert parse_email_message(message)["body"] == ""
+    assert parse_email_headers({"id": "m2"}) is None
+
+
+def test_walker_finds_nested_plain_text_and_skips_attachments():
+    payload = {
+        "mimeType": "multipart/mixed",
+        "headers": HEADERS,
+        "parts": [
+            part("text/plain", "not the body", filename="notes.txt"),
+            {"mimeType": "multipart/related", "parts": [
+                {"mimeType": "multipart/alternative", "parts": [
+                    part("text/html", "<p>Hi &amp; <b>bye</b></p>"),
+                    part("text/plain", "Hi & bye"),
+                ]},
+            ]},
+            part("application/pdf", filename="big.pdf", body={"attachmentId": "a1", "size": 10 ** 7}),
+        ],
+    }
+    assert parse_email_message({"payload": payload})["body"] == "Hi & bye"
+
+    html_only = {"mimeType": "multipart/alternative", "parts": [part("text/html", "<style>p{}</style><p>Hi &amp; bye</p>")]}
+    assert extract_body(html_only) == "Hi & bye"
+
+
+def test_body_is_capped_before_decoding():
+    text = "héllo " * 10000
+    assert decode_body_data(encode(text), limit=10) == text.encode("utf-8")[:10].decode("utf-8", errors="ignore")
+    assert extract_body(part("text/plain", "short"), limit=1000) == "short"
+    assert len(extract_body(part("text/plain", text), limit=1000).encode("utf-8")) <= 1000
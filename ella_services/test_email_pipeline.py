@@ -0,0 +1,188 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from email_pipeline import BatchedLookup, KeyedWorkerPool, MailPipeline
+
+
+def test_pool_keeps_order_per_key_and_runs_keys_in_parallel():
+    async def scenario():
+        handled, running, peak = [], set(), [0]
+
+        async def handler(item):
+            key, n = item
+            assert key not in running  # never two items of one key at once
+            running.add(key)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01 if key == "slow" else 0)
+            running.discard(key)
+            handled.append(item)
+
+        pool = KeyedWorkerPool(handler, workers=3, capacity=10)
+        pool.start()
+        for n in range(3):
+            for key in ("slow", "a", "b"):
+                await pool.submit(key, (key, n))
+        await pool.join()
+        await pool.close()
+        return handled, peak[0]
+
+    handled, peak = asyncio.run(scenario())
+    for key in ("slow", "a", "b"):
+        assert [n for k, n in handled if k == key] == [0, 1, 2]
+    assert peak > 1
+    # The slow sender does not hold up the others
+    assert handled.index(("b", 2)) < handled.index(("slow", 2))
+
+
+def test_pool_submit_blocks_at_capacity_and_survives_handler_errors():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(item):
+            await release.wait()
+            if item == 0:
+                raise RuntimeError("boom")
+            handled.append(item)
+
+        pool = KeyedWorkerPool(handler, workers=1, capacity=2)
+        pool.start()
+        await pool.submit("k", 0)
+        await pool.submit("k", 1)
+        third = asyncio.create_task(pool.submit("k", 2))
+        await asyncio.sleep(0.01)
+        blocked = not third.done()
+        release.set()
+        await third
+        await pool.join()
+        await pool.close()
+        return blocked, handled
+
+    blocked, handled = asyncio.run(scenario())
+    assert blocked
+    assert handled == [1, 2]
+
+
+def test_mail_pipeline_routes_replies_acks_and_checkpoints_in_order():
+    async def scenario():
+        mailbox = {
+            "m1": {"from": "ann", "text": "slow"},
+            "m2": {"from": "bob", "text": "hi"},
+            "m3": {"from": "ann", "text": "again"},
+            "m4": {"from": "spam", "text": "ad"},
+            "m5": {"from": "other", "text": "not ours"},
+        }
+        sent, acked, checkpoints, failed = [], [], [], []
+
+        async def fetch(ids):
+            return {i: dict(mailbox[i], id=i) for i in ids if i != "gone"}
+
+        async def route(message):
+            if message["from"] == "other":
+                return None
+            if message["from"] == "spam":
+                return message["from"], None
+            return message["from"], message
+
+        async def generate(message):
+            await asyncio.sleep(0.02 if message["text"] == "slow" else 0)
+            return f"re {message['id']}"
+
+        async def send(reply):
+            sent.append(reply)
+
+        async def ack(ids):
+            acked.extend(ids)
+
+        async def checkpoint(position):
+            checkpoints.append(position)
+
+        pipeline = MailPipeline(fetch, route, generate, send, ack, on_checkpoint=checkpoint,
+                                on_failure=failed.extend, generate_workers=2, send_workers=1,
+                                queue_size=4, fetch_batch=2)
+        pipeline.start()
+        assert await pipeline.submit(["m1", "m2"], 10) == 2
+        assert await pipeline.submit(["m2", "m3", "m4", "m5", "gone"], 20) == 4  # m2 is already in flight
+        while pipeline.in_flight:
+            await asyncio.sleep(0.005)
+        await pipeline.close()
+        return sent, acked, checkpoints, failed
+
+    sent, acked, checkpoints, failed = asyncio.run(scenario())
+    # bob is answered while ann's first reply is still being written; ann's stay in order
+    assert sent.index("re m2") < sent.index("re m1") < sent.index("re m3")
+    assert sorted(acked) == ["m1", "m2", "m3", "m4"]  # m5 stays unread for its owner
+    assert failed == ["gone"]
+    assert checkpoints[-1] == 20 and checkpoints == sorted(checkpoints)
+
+
+def test_mail_pipeline_leaves_messages_unread_when_route_or_generate_raises():
+    async def scenario():
+        acked, failed, checkpoints = [], [], []
+
+        async def fetch(ids):
+            return {i: {"id": i} for i in ids}
+
+        async def route(message):
+            if message["id"] == "route-error":
+                raise RuntimeError("user lookup failed")
+            if message["id"] == "no-reply":
+                return "k", None
+            return "k", message
+
+        async def generate(message):
+            if message["id"] == "generate-error":
+                raise RuntimeError("agent unavailable")
+            return None  # the agent had nothing to say
+
+        async def send(reply):
+            raise AssertionError("nothing is sent")
+
+        async def ack(ids):
+            acked.extend(ids)
+
+        async def checkpoint(position):
+            checkpoints.append(position)
+
+        pipeline = MailPipeline(fetch, route, generate, send, ack, on_checkpoint=checkpoint,
+                                on_failure=failed.extend)
+        pipeline.start()
+        await pipeline.submit(["route-error", "generate-error", "no-reply", "silent"], 10)
+        while pipeline.in_flight:
+            await asyncio.sleep(0.005)
+        await pipeline.close()
+        return acked, failed, checkpoints
+
+    acked, failed, checkpoints = asyncio.run(scenario())
+    assert sorted(acked) == ["no-reply", "silent"]
+    assert sorted(failed) == ["generate-error", "route-error"]
+    assert checkpoints == [10]
+
+
+def test_batched_lookup_coalesces_concurrent_gets():
+    async def scenario():
+        calls = []
+
+        async def fetch(keys):
+            calls.append(list(keys))
+            await asyncio.sleep(0.01)
+            if "boom" in keys:
+                raise RuntimeError("batch failed")
+            return {key: key.upper() for key in keys if key != "gone"}
+
+        lookup = BatchedLookup(fetch, batch_size=3)
+        first = await asyncio.gather(*(lookup.get(key) for key in ("a", "b", "a", "gone", "c")))
+        # Requests made while a batch is in flight go out together in the next one
+        pending = [asyncio.create_task(lookup.get("d"))]
+        await asyncio.sleep(0.005)
+        pending += [asyncio.create_task(lookup.get(key)) for key in ("e", "boom")]
+        second = await asyncio.gather(*pending, return_exceptions=True)
+        return calls, first, second
+
+    calls, first, second = asyncio.run(scenario())
+    assert first == ["A", "B", "A", None, "C"]
+    assert calls == [["a", "b", "gone"], ["c"], ["d"], ["e", "boom"]]
+    assert second[0] == "D" and all(isinstance(result, RuntimeError) for result in second[1:])
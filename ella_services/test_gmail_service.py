@@ -0,0 +1,265 @@
+import asyncio
+import base64
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import client_stubs
+
+# gmail_service imports the Google and MemGPT clients at module level
+client_stubs.install()
+
+import httplib2
+from fastapi.testclient import TestClient
+from googleapiclient.errors import HttpError
+
+import gmail_service
+from email_pipeline import BatchedLookup
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+class Request:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return self.run()
+
+
+class FakeGmail:
+    """Stand-in for the Gmail API service: serves pages of results and records every call."""
+
+    def __init__(self, history_pages=(), unread=(), history_id="900", mailbox=None):
+        self.history_pages = list(history_pages)
+        self.unread = list(unread)
+        self.history_id = history_id
+        self.mailbox = mailbox or {}
+        self.calls = []
+        self.history_error = None
+        self.batch_modify_error = None
+        self.modify_errors = set()
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, pageToken=None, **kwargs):
+        if "startHistoryId" in kwargs:
+            self.calls.append(("history.list", kwargs["startHistoryId"], pageToken))
+            return Request(lambda: self.history_page(pageToken))
+        self.calls.append(("messages.list", kwargs["q"], kwargs["maxResults"], pageToken))
+        return Request(lambda: self.unread_page(kwargs["maxResults"], pageToken))
+
+    def history_page(self, page_token):
+        if self.history_error is not None:
+            raise self.history_error
+        return self.history_pages[int(page_token or 0)]
+
+    def unread_page(self, max_results, page_token):
+        start = int(page_token or 0)
+        page = {"messages": [{"id": i} for i in self.unread[start:start + max_results]]}
+        if start + max_results < len(self.unread):
+            page["nextPageToken"] = str(start + max_results)
+        return page
+
+    def get(self, userId, id, **options):
+        self.calls.append(("messages.get", id, options))
+
+        def run():
+            if id not in self.mailbox:
+                raise http_error(404)
+            return self.mailbox[id]
+        return Request(run)
+
+    def new_batch_http_request(self, callback):
+        return Batch(self, callback)
+
+    def batchModify(self, userId, body):
+        self.calls.append(("batchModify", body["ids"]))
+
+        def run():
+            if self.batch_modify_error is not None:
+                raise self.batch_modify_error
+            return {}
+        return Request(run)
+
+    def modify(self, userId, id, body):
+        self.calls.append(("modify", id))
+
+        def run():
+            if id in self.modify_errors:
+                raise http_error(400)
+            return {"id": id}
+        return Request(run)
+
+    def getProfile(self, userId):
+        self.calls.append(("getProfile",))
+        return Request(lambda: {"historyId": self.history_id})
+
+
+class Batch:
+    """Runs its requests in order and reports each result or error to the callback, like BatchHttpRequest."""
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.calls.append(("batch", [request_id for request_id, _ in self.requests]))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+def added(message_id, *labels):
+    return {"messagesAdded": [{"message": {"id": message_id, "labelIds": list(labels)}}]}
+
+
+def test_history_read_returns_new_unread_inbox_mail_oldest_first(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_SYNC_MODE", "history")
+    service = FakeGmail(history_pages=[
+        {"history": [added("m1", "INBOX", "UNREAD"), added("sent", "SENT", "UNREAD")],
+         "nextPageToken": "1", "historyId": "120"},
+        {"history": [added("read", "INBOX"), added("m1", "INBOX", "UNREAD"), added("m2", "INBOX", "UNREAD")],
+         "historyId": "130"},
+    ])
+    assert gmail_service.find_new_messages(service, "100") == (["m1", "m2"], "130")
+    assert [call[0] for call in service.calls] == ["history.list", "history.list"]
+
+
+def test_expired_history_falls_back_to_a_bounded_resync(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_SYNC_MODE", "history")
+    monkeypatch.setattr(gmail_service, "GMAIL_RESYNC_LIMIT", 3)
+    service = FakeGmail(unread=["m9", "m8", "m7", "m6"], history_id="900")
+    service.history_error = http_error(404)
+
+    assert gmail_service.find_new_messages(service, "100") == (["m7", "m8", "m9"], "900")
+    # The new cursor is read before the unread list, so nothing arriving meanwhile is skipped
+    assert [call[0] for call in service.calls] == ["history.list", "getProfile", "messages.list"]
+
+
+def test_other_history_errors_are_not_treated_as_expiry(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_SYNC_MODE", "history")
+    service = FakeGmail(unread=["m1"])
+    service.history_error = http_error(500)
+    with pytest.raises(HttpError):
+        gmail_service.find_new_messages(service, "100")
+    assert ("getProfile",) not in service.calls
+
+
+def test_fetch_messages_batches_requests_and_keeps_partial_results(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_BATCH_SIZE", 2)
+    service = FakeGmail(mailbox={i: {"id": i} for i in ("m1", "m2", "m4", "m5")})
+
+    messages = gmail_service.fetch_messages(service, ["m1", "m2", "gone", "m4", "m5"],
+                                            format="metadata", metadata_headers=["From", "Subject"])
+    assert messages == {i: {"id": i} for i in ("m1", "m2", "m4", "m5")}
+    assert [call[1] for call in service.calls if call[0] == "batch"] == [["m1", "m2"], ["gone", "m4"], ["m5"]]
+    assert all(call[2] == {"format": "metadata", "metadataHeaders": ["From", "Subject"]}
+               for call in service.calls if call[0] == "messages.get")
+
+
+def test_mark_read_uses_one_batch_modify_per_chunk(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_MODIFY_LIMIT", 2)
+    service = FakeGmail()
+    assert gmail_service.mark_read(service, ["m1", "m2", "m3"]) == []
+    assert service.calls == [("batchModify", ["m1", "m2"]), ("batchModify", ["m3"])]
+
+
+def test_failed_batch_modify_falls_back_to_per_message_modify():
+    service = FakeGmail()
+    service.batch_modify_error = http_error(400)
+    service.modify_errors = {"m2"}
+    assert gmail_service.mark_read(service, ["m1", "m2", "m3"]) == ["m2"]
+    assert service.calls == [("batchModify", ["m1", "m2", "m3"]),
+                             ("modify", "m1"), ("modify", "m2"), ("modify", "m3")]
+
+
+def metadata(message_id, sender):
+    headers = [{"name": "From", "value": sender}, {"name": "To", "value": "ella@example.com"},
+               {"name": "Subject", "value": "Lunch"}]
+    return {"id": message_id, "labelIds": ["INBOX", "UNREAD"], "payload": {"headers": headers}}
+
+
+def full(message_id, text):
+    data = base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+    return {"id": message_id, "payload": {"mimeType": "text/plain", "body": {"data": data}}}
+
+
+def test_replies_fetch_bodies_in_shared_batches_off_the_route_stage(monkeypatch):
+    async def user(email):
+        return {"memgpt_user_api_key": "key", "default_agent_key": "agent"}
+
+    prompts = []
+
+    async def write(context, memgpt_user_api_key, agent_key):
+        prompts.append(context["body"])
+        return f"re {context['message_id']}"
+
+    monkeypatch.setattr(gmail_service.gmail_leases, "owns", lambda key: True)
+    monkeypatch.setattr(gmail_service, "read_user_by_email", user)
+    monkeypatch.setattr(gmail_service.email_router, "generate_reply", write)
+    service = FakeGmail(mailbox={"m1": full("m1", "one"), "m2": full("m2", "two")})
+
+    async def scenario():
+        jobs = [await gmail_service.route_message(metadata(i, f"{i}@example.com")) for i in ("m1", "m2", "gone")]
+        assert service.calls == []  # routing reads headers only
+
+        lookup = BatchedLookup(lambda ids: asyncio.to_thread(gmail_service.fetch_messages, service, ids))
+        return await asyncio.gather(*(gmail_service.generate_reply(job, lookup) for _, job in jobs),
+                                    return_exceptions=True)
+
+    replies = asyncio.run(scenario())
+    assert [reply["body"] for reply in replies[:2]] == ["re m1", "re m2"]
+    assert isinstance(replies[2], RuntimeError)  # left unread for the resync
+    assert sorted(prompts) == ["one", "two"]
+    assert [call[1] for call in service.calls if call[0] == "batch"] == [["m1", "m2", "gone"]]
+
+
+@pytest.fixture
+def push_client(monkeypatch):
+    monkeypatch.setattr(gmail_service, "GMAIL_PUSH_TOKEN", "secret")
+    monkeypatch.setattr(gmail_service, "watched_mailbox", "ella@example.com")
+    gmail_service.sync_requested.clear()
+    yield TestClient(gmail_service.gmail_app)
+    gmail_service.sync_requested.clear()
+
+
+def test_push_with_a_valid_token_triggers_a_sync(push_client):
+    envelope = gmail_service.build_push_envelope("Ella@example.com", 1234)
+    assert push_client.post("/push?token=secret", json=envelope).status_code == 204
+    assert gmail_service.sync_requested.is_set()
+
+
+def test_push_with_a_bad_token_is_rejected(push_client):
+    envelope = gmail_service.build_push_envelope("ella@example.com", 1234)
+    assert push_client.post("/push?token=wrong", json=envelope).status_code == 403
+    assert push_client.post("/push", json=envelope).status_code == 403
+    assert not gmail_service.sync_requested.is_set()
+
+
+def test_malformed_or_foreign_pushes_are_acknowledged_without_a_sync(push_client):
+    malformed = {"message": {"data": "not-base64!", "messageId": "1"}, "subscription": "local"}
+    assert push_client.post("/push?token=secret", json=malformed).status_code == 204
+    assert push_client.post("/push?token=secret", content=b"not json").status_code == 204
+    foreign = gmail_service.build_push_envelope("someone@example.com", 1234)
+    assert push_client.post("/push?token=secret", json=foreign).status_code == 204
+    assert not gmail_service.sync_requested.is_set()
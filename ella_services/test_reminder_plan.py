@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from reminder_plan import IMMEDIATE_REMINDER_KEY, ReminderPlanCache, compile_plan, reminder_key
+
+START_TS = 1723716000  # 2024-08-15T10:00:00Z
+USER = {"default_reminder_time": 15, "reminder_method": "email,sms"}
+
+
+def make_event(**fields):
+    event = {
+        "id": "event-1",
+        "version": 1,
+        "summary": "Standup",
+        "start": {"dateTime": "2024-08-15T10:00:00+00:00", "timeZone": "UTC"},
+        "end": {"dateTime": "2024-08-15T10:30:00+00:00", "timeZone": "UTC"},
+    }
+    event.update(fields)
+    return event
+
+
+def test_plan_holds_absolute_alert_times_per_channel():
+    event = make_event(
+        extendedProperties={"private": {"customReminders": json.dumps([{"minutes": 60, "type": "voice"}])}})
+    plan = compile_plan(event, "UTC", USER)
+    assert plan.start_ts == START_TS
+    assert plan.alerts == ((START_TS - 3600, "voice", 60), (START_TS - 900, "email", 15), (START_TS - 900, "sms", 15))
+
+    overrides = make_event(reminders={"useDefault": False, "overrides": [{"minutes": 10, "method": "email"}]})
+    assert compile_plan(overrides, "UTC", USER).alerts == ((START_TS - 600, "email", 10),)
+
+
+def test_reminders_after_drops_past_alerts_and_falls_back_to_a_popup():
+    plan = compile_plan(make_event(), "America/Los_Angeles", USER)
+    reminders = plan.reminders_after(START_TS - 3600, "America/Los_Angeles")
+    assert [(r["alert_type"], r["minutes"]) for r in reminders] == [("send_email", 15), ("send_sms", 15)]
+    assert reminders[0]["alert_time"].isoformat() == "2024-08-15T02:45:00-07:00"
+
+    # Both alerts have passed: one popup up to five minutes before the start
+    [popup] = plan.reminders_after(START_TS - 150, "UTC")
+    assert (popup["alert_type"], popup["minutes"]) == ("send_popup", 2)
+    assert plan.reminders_after(START_TS, "UTC") == []
+
+
+def test_cache_compiles_once_per_event_version_and_preferences():
+    cache = ReminderPlanCache(max_size=2)
+    first = cache.get(make_event(), "UTC", USER)
+    assert cache.get(make_event(), "UTC", USER) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A new event version or new reminder defaults compile a new plan
+    assert cache.get(make_event(version=2), "UTC", USER) is not first
+    assert cache.get(make_event(), "UTC", dict(USER, default_reminder_time=30)).alerts[0][2] == 30
+    assert len(cache) == 2  # LRU bound
+
+    cache.get(make_event(version=2), "UTC", USER)
+    assert cache.invalidate("event-1") == 2
+    assert len(cache) == 0
+
+
+def test_plans_follow_the_users_stored_reminder_prefs(tmp_path, monkeypatch):
+    from ella_dbo import db_manager
+    monkeypatch.setattr(db_manager, "DB_FILE", str(tmp_path / "test.db"))
+    db_manager.initialize_database()
+    db_manager.user_cache.clear()
+    try:
+        with db_manager.get_db_connection() as conn:
+            db_manager.upsert_user(conn, "auth0_user_id", "auth0|1", memgpt_user_id="m-1", email="a@example.com")
+        cache = ReminderPlanCache()
+        # Column defaults, not a hardcoded fallback
+        row = db_manager.get_user_data_by_field("memgpt_user_id", "m-1")
+        assert cache.get(make_event(), "UTC", row).alerts == ((START_TS - 900, "email", 15), (START_TS - 900, "sms", 15))
+
+        with db_manager.get_db_connection() as conn:
+            db_manager.upsert_user(conn, "memgpt_user_id", "m-1", default_reminder_time=45, reminder_method="voice")
+        row = db_manager.get_user_data_by_field("memgpt_user_id", "m-1")
+        assert cache.get(make_event(), "UTC", row).alerts == ((START_TS - 2700, "voice", 45),)
+        assert cache.misses == 2
+    finally:
+        db_manager.user_cache.clear()
+        db_manager.close_all_connections()
+
+
+def test_fallback_popup_keeps_one_ledger_key_across_replans(tmp_path, monkeypatch):
+    from ella_dbo import db_manager
+    monkeypatch.setattr(db_manager, "DB_FILE", str(tmp_path / "test.db"))
+    db_manager.initialize_database()
+    plan = compile_plan(make_event(), "UTC", USER)
+    try:
+        rows = []
+        for now_ts in (START_TS - 270, START_TS - 210):  # re-planned a minute later
+            [popup] = plan.reminders_after(now_ts, "UTC")
+            fire_ts = int(popup["alert_time"].timestamp())
+            rows.append({"event_id": "event-1", "occurrence_ts": fire_ts + popup["minutes"] * 60,
+                         "reminder_key": reminder_key(popup), "user_id": "user-1", "fire_ts": fire_ts})
+        assert {row["reminder_key"] for row in rows} == {IMMEDIATE_REMINDER_KEY}
+        assert db_manager.schedule_reminders(rows[:1]) == 1
+        assert db_manager.schedule_reminders(rows[1:]) == 0
+        # The first plan's fire time stands
+        [pending] = db_manager.get_pending_reminders(START_TS)
+        assert pending["fire_ts"] == START_TS - 240
+    finally:
+        db_manager.close_all_connections()
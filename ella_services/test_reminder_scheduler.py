@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from reminder_scheduler import ReminderScheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+async def noop(due):
+    pass
+
+
+def test_pop_due_returns_entries_in_fire_order():
+    clock = FakeClock()
+    scheduler = ReminderScheduler(noop, clock)
+    scheduler.schedule("late", 1300)
+    scheduler.schedule("early", 1100, payload="ctx")
+    scheduler.schedule("middle", 1200)
+
+    assert scheduler.next_fire_ts() == 1100
+    assert scheduler.pop_due(1250) == [("early", "ctx"), ("middle", None)]
+    assert len(scheduler) == 1 and "late" in scheduler
+
+
+def test_rescheduling_and_replace_group_supersede_old_entries():
+    scheduler = ReminderScheduler(noop, FakeClock())
+    scheduler.replace_group("user-1", [("a", 1100, None), ("b", 1200, None)])
+    scheduler.schedule("other", 1150)
+
+    # "a" moves later and "b" disappears from user-1's plan
+    scheduler.replace_group("user-1", [("a", 1400, None)])
+    assert "b" not in scheduler and "other" in scheduler
+    assert scheduler.next_fire_ts() == 1150
+    assert [key for key, _ in scheduler.pop_due(2000)] == ["other", "a"]
+
+
+@pytest.mark.asyncio
+async def test_run_sleeps_until_due_and_wakes_for_earlier_entries():
+    fired = []
+
+    async def fire(due):
+        fired.extend(key for key, _ in due)
+
+    scheduler = ReminderScheduler(fire)
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(scheduler.run())
+    try:
+        scheduler.schedule("later", scheduler._clock() + 60)
+        await asyncio.sleep(0.01)
+        assert fired == []
+
+        # An earlier entry wakes the sleeping loop instead of waiting out the minute
+        scheduler.schedule("soon", scheduler._clock() + 0.05)
+        await asyncio.sleep(0.2)
+        assert fired == ["soon"]
+        assert "later" in scheduler
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await scheduler.close()
@@ -0,0 +1,392 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import client_stubs
+
+# reminder_service imports the Google and MemGPT clients at module level
+client_stubs.install()
+
+import reminder_service
+from ella_dbo import db_manager
+from ella_dbo.event_feed import CREATED, DELETED, EventChangeFeed
+from ella_dbo.leases import ShardLeases
+from reminder_plan import reminder_plans
+from reminder_scheduler import ReminderScheduler
+
+
+class Sends:
+    """Stand-in for the services API: records reminder sends and answers with success."""
+
+    def __init__(self):
+        self.calls = []
+        self.success = True
+        self.failing_users = set()
+
+    async def __call__(self, user_id, event, reminder, user_timezone, content=None):
+        self.calls.append((user_id, event['id'], reminder['alert_type'], content))
+        return {"success": self.success and user_id not in self.failing_users}
+
+
+@pytest.fixture
+def sends(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_manager, "DB_FILE", str(tmp_path / "test.db"))
+    db_manager.initialize_database()
+    db_manager.user_cache.clear()
+    reminder_plans.clear()
+    monkeypatch.setattr(reminder_service, "reminder_scheduler", ReminderScheduler(reminder_service.fire_due_reminders))
+    monkeypatch.setattr(reminder_service, "pregen_scheduler", ReminderScheduler(reminder_service.pregenerate_reminders))
+    monkeypatch.setattr(reminder_service, "reminder_leases", ShardLeases("reminders", owner="worker-b", ttl=60))
+    monkeypatch.setattr(reminder_service, "event_feed", EventChangeFeed(durable=False))
+    sends = Sends()
+    monkeypatch.setattr(reminder_service, "send_reminder_via_api", sends)
+    yield sends
+    db_manager.user_cache.clear()
+    db_manager.close_all_connections()
+
+
+def seed_user(memgpt_user_id):
+    with db_manager.get_db_connection() as conn:
+        db_manager.upsert_user(
+            conn, "auth0_user_id", f"auth0|{memgpt_user_id}", memgpt_user_id=memgpt_user_id,
+            email=f"{memgpt_user_id}@example.com", memgpt_user_api_key="key", default_agent_key="agent",
+            local_timezone="UTC", reminder_method="email")
+
+
+def add_event(user_id, start_ts, summary="Standup"):
+    def iso(ts):
+        return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+    return db_manager.add_event(user_id, {
+        "summary": summary,
+        "start": {"dateTime": iso(start_ts), "timeZone": "UTC"},
+        "end": {"dateTime": iso(start_ts + 1800), "timeZone": "UTC"},
+        "local_timezone": "UTC",
+    })
+
+
+def due_reminder(user_id, event_id, start_ts, fire_ts, minutes=15):
+    return {"event_id": event_id, "occurrence_ts": start_ts, "reminder_key": f"send_email_{minutes}",
+            "user_id": user_id, "fire_ts": fire_ts}
+
+
+def statuses():
+    with db_manager.get_db_connection() as conn:
+        return {row[0]: row[1] for row in conn.execute("SELECT event_id, status FROM reminder_deliveries")}
+
+
+def user_groups():
+    return set(reminder_service.reminder_scheduler.groups())
+
+
+@pytest.mark.asyncio
+async def test_plan_users_bounds_fetches_and_isolates_slow_or_failing_users(sends, monkeypatch):
+    monkeypatch.setattr(reminder_service, "POLL_CONCURRENCY", 2)
+    monkeypatch.setattr(reminder_service, "USER_POLL_TIMEOUT", 0.2)
+    now = int(time.time())
+    users = ["slow", "broken", "user-1", "user-2", "user-3"]
+    events = {}
+    for user_id in users:
+        seed_user(user_id)
+        events[user_id] = db_manager.get_event(add_event(user_id, now + 3600))
+
+    failing = set()
+    in_flight, peak = set(), [0]
+
+    async def fetch(user_id, user_timezone):
+        in_flight.add(user_id)
+        peak[0] = max(peak[0], len(in_flight))
+        try:
+            await asyncio.sleep(0.01)
+            if user_id in failing and user_id == "slow":
+                await asyncio.sleep(1)
+            elif user_id in failing:
+                raise RuntimeError("database is locked")
+            return {"success": True, "events": [events[user_id]]}
+        finally:
+            in_flight.discard(user_id)
+    monkeypatch.setattr(reminder_service, "fetch_upcoming_events_for_user", fetch)
+
+    rows = [{"memgpt_user_id": user_id} for user_id in users]
+    await reminder_service.plan_users(rows)
+    assert user_groups() == set(users)
+
+    failing.update({"slow", "broken"})
+    started = time.monotonic()
+    deliveries = await reminder_service.plan_users(rows)
+    assert time.monotonic() - started < 1  # the slow user is given up on, not waited for
+    assert {delivery["user_id"] for delivery in deliveries} == {"user-1", "user-2", "user-3"}
+    # A user that could not be fetched keeps their previous plan
+    assert user_groups() == set(users)
+    assert peak[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_direct_event_source_returns_every_upcoming_event_in_api_shape(sends, monkeypatch):
+    monkeypatch.setattr(reminder_service, "REMINDER_EVENT_SOURCE", "direct")
+    monkeypatch.setattr(reminder_service, "HTTP_MAX_EVENTS", 2)
+    now = int(time.time())
+    seed_user("user-1")
+    event_ids = [add_event("user-1", now + 3600 * hours) for hours in (1, 2, 3)]
+    add_event("user-1", now + reminder_service.PLAN_HORIZON + 3600)  # beyond the horizon
+
+    result = await reminder_service.fetch_upcoming_events_for_user("user-1", "America/New_York")
+    assert result["success"]
+    expected = []
+    for event_id in event_ids:
+        event = db_manager.get_event(event_id)
+        del event["user_id"]
+        event["start"]["timeZone"] = event["end"]["timeZone"] = "America/New_York"
+        expected.append(event)
+    # No HTTP_MAX_EVENTS cap on the repository path
+    assert sorted(result["events"], key=lambda event: event["start"]["dateTime"]) == expected
+
+
+@pytest.mark.asyncio
+async def test_http_event_source_asks_for_at_most_the_cap_and_warns_when_reached(sends, monkeypatch, caplog):
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    requests = []
+
+    async def events(request):
+        requests.append(dict(request.query))
+        return web.json_response([{"id": f"e{n}"} for n in range(int(request.query["max_results"]))])
+
+    app = web.Application()
+    app.router.add_get("/events", events)
+    server = TestServer(app)
+    await server.start_server()
+    monkeypatch.setattr(reminder_service, "REMINDER_EVENT_SOURCE", "http")
+    monkeypatch.setattr(reminder_service, "HTTP_MAX_EVENTS", 2)
+    monkeypatch.setattr(reminder_service, "API_BASE_URL", str(server.make_url("")).rstrip("/"))
+    monkeypatch.setattr(reminder_service, "http_session", None)
+    try:
+        result = await reminder_service.fetch_upcoming_events_for_user("user-1", "UTC")
+    finally:
+        await reminder_service.close_http_session()
+        await server.close()
+
+    assert result == {"success": True, "events": [{"id": "e0"}, {"id": "e1"}]}
+    assert requests[0]["user_id"] == "user-1" and requests[0]["max_results"] == "2"
+    assert "at least 2 upcoming events" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_fire_due_reminders_claims_sends_and_records_once(sends):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    seed_user("user-1")
+    event_id = add_event("user-1", now + 600)
+    db_manager.schedule_reminders([due_reminder("user-1", event_id, now + 600, now - 1)])
+
+    await reminder_service.fire_due_reminders([])
+    await reminder_service.fire_due_reminders([])
+
+    assert sends.calls == [("user-1", event_id, "send_email", None)]
+    assert statuses() == {event_id: "sent"}
+
+
+@pytest.mark.asyncio
+async def test_fire_due_reminders_coalesces_a_users_reminders_within_the_window(sends, monkeypatch):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    seed_user("user-1")
+    first, second = add_event("user-1", now + 600, "Standup"), add_event("user-1", now + 780, "Review")
+    db_manager.schedule_reminders([
+        due_reminder("user-1", first, now + 600, now - 1),
+        due_reminder("user-1", second, now + 780, now + reminder_service.COALESCE_WINDOW - 60),
+    ])
+
+    async def digest(context, memgpt_user_api_key, agent_key, template):
+        assert "Standup" in context["events"] and "Review" in context["events"]
+        return "digest"
+    monkeypatch.setattr(reminder_service.email_router, "generate_reminder_content", digest)
+
+    await reminder_service.fire_due_reminders([])
+    assert [(call[2], call[3]) for call in sends.calls] == [("send_email", "digest")]
+    assert statuses() == {first: "sent", second: "sent"}
+
+
+@pytest.mark.asyncio
+async def test_failed_send_goes_back_to_pending_and_is_rescheduled(sends):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    seed_user("user-1")
+    event_id = add_event("user-1", now + 600)
+    reminder = due_reminder("user-1", event_id, now + 600, now - 1)
+    db_manager.schedule_reminders([reminder])
+    sends.success = False
+
+    await reminder_service.fire_due_reminders([])
+    assert statuses() == {event_id: "pending"}
+    assert reminder_service.delivery_key(reminder) in reminder_service.reminder_scheduler
+
+
+@pytest.mark.asyncio
+async def test_fire_due_reminders_skips_shards_this_worker_does_not_hold(sends):
+    now = int(time.time())
+    seed_user("user-1")
+    event_id = add_event("user-1", now + 600)
+    db_manager.schedule_reminders([due_reminder("user-1", event_id, now + 600, now - 1)])
+
+    await reminder_service.fire_due_reminders([])  # no leases renewed yet
+    assert sends.calls == []
+    assert statuses() == {event_id: "pending"}
+
+
+@pytest.mark.asyncio
+async def test_replayed_reminders_go_through_delivery_and_land_in_the_ledger(sends):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    for user_id in ("user-1", "user-2"):
+        seed_user(user_id)
+    upcoming = add_event("user-1", now + 600)
+    started = add_event("user-1", now - 300)
+    unreachable = add_event("user-2", now + 600)
+    # All fell due ten minutes ago, while no worker was firing
+    db_manager.schedule_reminders([
+        due_reminder("user-1", upcoming, now + 600, now - 600),
+        due_reminder("user-1", started, now - 300, now - 600),
+        due_reminder("user-2", unreachable, now + 600, now - 600),
+    ])
+    sends.failing_users = {"user-2"}
+
+    outcome = await reminder_service.replay_missed_reminders()
+
+    assert outcome == {"replay": 2, "stale": 1, "capped": 0}
+    assert sorted(sends.calls) == [("user-1", upcoming, "send_email", None),
+                                   ("user-2", unreachable, "send_email", None)]
+    assert statuses() == {upcoming: "sent", started: "missed", unreachable: "pending"}
+    with db_manager.get_db_connection() as conn:
+        errors = dict(conn.execute("SELECT event_id, last_error FROM reminder_deliveries"))
+    assert errors == {upcoming: None, started: "Event already started", unreachable: "Reminder API call failed"}
+
+
+@pytest.mark.asyncio
+async def test_pregenerated_text_is_sent_unless_the_event_changed_since(sends, monkeypatch):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    written = []
+
+    async def write(context, memgpt_user_api_key, agent_key):
+        written.append(context["event_summary"])
+        return f"About {context['event_summary']}"
+    monkeypatch.setattr(reminder_service.email_router, "generate_reminder", write)
+
+    due = []
+    for user_id in ("user-1", "user-2"):
+        seed_user(user_id)
+        event_id = add_event(user_id, now + 600)
+        event = db_manager.get_event(event_id)
+        reminder = {"alert_time": datetime.fromtimestamp(now - 1, timezone.utc), "alert_type": "send_email", "minutes": 15}
+        due += [((event_id, now + 600, f"send_{channel}_15"), (user_id, event, dict(reminder, alert_type=f"send_{channel}")))
+                for channel in ("email", "sms")]
+        db_manager.schedule_reminders([due_reminder(user_id, event_id, now + 600, now - 1)])
+    await reminder_service.pregenerate_reminders(due)
+    assert written == ["Standup", "Standup"]  # one text per occurrence, shared by its channels
+
+    # user-2's event is edited after its text was written: that text is for the old version
+    changed = due[2][0][0]
+    db_manager.update_event(changed, {"summary": "Retro"})
+    await reminder_service.fire_due_reminders([])
+
+    # The stale text is not sent; the reminders API writes a fresh one at send time
+    assert sorted(sends.calls) == [("user-1", due[0][0][0], "send_email", "About Standup"),
+                                   ("user-2", changed, "send_email", None)]
+    assert written == ["Standup", "Standup"]
+
+
+@pytest.mark.asyncio
+async def test_event_changes_replan_only_the_affected_user(sends):
+    await reminder_service.reminder_leases.renew()
+    now = int(time.time())
+    seed_user("user-1")
+    seed_user("user-2")
+    add_event("user-2", now + 7200)
+    follower = asyncio.create_task(reminder_service.follow_event_changes())
+    try:
+        await asyncio.sleep(0)
+        event_id = add_event("user-1", now + 7200)
+        await reminder_service.event_feed.publish_change(event_id, "user-1", CREATED)
+        for _ in range(100):
+            if user_groups():
+                break
+            await asyncio.sleep(0.01)
+        assert user_groups() == {"user-1"}
+        assert set(statuses()) == {event_id}
+
+        db_manager.delete_event(event_id)
+        await reminder_service.event_feed.publish_change(event_id, "user-1", DELETED)
+        for _ in range(100):
+            if not user_groups():
+                break
+            await asyncio.sleep(0.01)
+        assert user_groups() == set()
+    finally:
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_rebalance_plans_shards_taken_over_and_drops_shards_handed_back(sends):
+    now = int(time.time())
+    user_ids = [f"user-{n}" for n in range(8)]
+    for user_id in user_ids:
+        seed_user(user_id)
+        add_event(user_id, now + 7200)
+
+    # worker-a held every shard and died: its leases ran out a while ago
+    db_manager.acquire_shard_leases("reminders", "worker-a", ttl=60, now_ts=now - 120)
+    leases = reminder_service.reminder_leases
+    gained, lost = await leases.renew()
+    assert len(gained) == db_manager.SHARD_COUNT and not lost
+    await reminder_service.rebalance_shards(gained, lost)
+    assert user_groups() == set(user_ids)
+
+    # worker-c joins; worker-b hands half of the shards back on its next renewal
+    db_manager.acquire_shard_leases("reminders", "worker-c", ttl=60)
+    gained, lost = await leases.renew()
+    assert lost and not gained
+    await reminder_service.rebalance_shards(gained, lost)
+    kept = {user_id for user_id in user_ids if leases.owns(user_id)}
+    assert kept and kept != set(user_ids)
+    assert user_groups() == kept
+
+
+@pytest.mark.asyncio
+async def test_lifespan_shares_one_session_and_closes_it_after_the_poller_stops(sends, monkeypatch):
+    seen = []
+    poller_done = []
+
+    async def poll():
+        try:
+            while True:
+                seen.append(await reminder_service.get_http_session())
+                await asyncio.sleep(0.01)
+        finally:
+            # Still open while the poller winds down; closed only once it has
+            await asyncio.sleep(0.01)
+            poller_done.append(seen[-1].closed)
+
+    async def close_voice_client():
+        pass
+
+    monkeypatch.setattr(reminder_service, "poll_calendar_for_events", poll)
+    monkeypatch.setattr(reminder_service.voice_call_manager, "close", close_voice_client)
+    monkeypatch.setattr(reminder_service, "http_session", None)
+
+    async with reminder_service.reminder_app_lifespan(reminder_service.reminder_app):
+        await asyncio.sleep(0.05)
+        session = reminder_service.http_session
+        assert session is not None and not session.closed
+
+    assert len(seen) > 1 and all(used is session for used in seen)
+    assert poller_done == [False]
+    assert session.closed and reminder_service.http_session is None
@@ -26,7 +26,9 @@ logger = logging.getLogger(__name__)
 from google_service_manager import google_service_manager
 from memgpt_email_router import email_router
 from voice_call_manager import VoiceCallManager
-from ella_dbo.db_manager import get_user_data_by_field, add_event, get_events, update_event, delete_event, get_event
+from ella_dbo.db_manager import get_user_data_by_field, iter_events, to_utc_timestamp, MIN_TIMESTAMP, MAX_TIMESTAMP
+from ella_dbo import async_db_manager
+from ella_dbo.event_feed import event_feed, CREATED, UPDATED, DELETED
 import uuid
 from ella_dbo.models import Event
 
@@ -36,33 +38,50 @@ calendar_service = google_service_manager.get_calendar_service()
 voice_call_manager = VoiceCallManager()
 
 class UserDataManager:
+    @staticmethod
+    def _map_user_data(memgpt_user_id: str, user_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not user_data:
+            logger.warning(f"No user data found for ID: {memgpt_user_id}")
+            return None
+
+        logger.debug(f"Raw user data retrieved: {user_data}")
+
+        # Map database fields to expected fields
+        mapped_data = {
+            'email': user_data.get('email'),
+            'memgpt_api_key': user_data.get('memgpt_user_api_key'),
+            'agent_key': user_data.get('default_agent_key'),
+            'local_timezone': user_data.get('local_timezone', 'UTC'),
+            'default_reminder_time': user_data.get('default_reminder_time'),
+            'reminder_method': user_data.get('reminder_method')
+        }
+
+        # Check for missing or empty required fields
+        required_fields = ['email', 'memgpt_api_key', 'agent_key']
+        for field in required_fields:
+            if not mapped_data.get(field):
+                logger.warning(f"Missing or empty required field '{field}' for user {memgpt_user_id}")
+                logger.debug(f"Database value for {field}: {user_data.get(field)}")
+
+        return mapped_data
+
     @staticmethod
     def get_user_data(memgpt_user_id: str) -> Optional[Dict[str, Any]]:
         try:
             logger.debug(f"Attempting to retrieve user data for ID: {memgpt_user_id}")
             user_data = get_user_data_by_field('memgpt_user_id', memgpt_user_id)
-            if user_data:
-                logger.debug(f"Raw user data retrieved: {user_data}")
-                
-                # Map database fields to expected fields
-                mapped_data = {
-                    'email': user_data.get('email'),
-                    'memgpt_api_key': user_data.get('memgpt_user_api_key'),
-                    'agent_key': user_data.get('default_agent_key'),
-                    'local_timezone': user_data.get('local_timezone', 'UTC')
-                }
-                
-                # Check for missing or empty required fields
-                required_fields = ['email', 'memgpt_api_key', 'agent_key']
-                for field in required_fields:
-                    if not mapped_data.get(field):
-                        logger.warning(f"Missing or empty required field '{field}' for user {memgpt_user_id}")
-                        logger.debug(f"Database value for {field}: {user_data.get(field)}")
-                
-                return mapped_data
-            else:
-                logger.warning(f"No user data found for ID: {memgpt_user_id}")
-                return None
+            return UserDataManager._map_user_data(memgpt_user_id, user_data)
+        except Exception as e:
+            logger.error(f"Error retrieving user data: {str(e)}", exc_info=True)
+            return None
+
+    @staticmethod
+    async def get_user_data_async(memgpt_user_id: str) -> Optional[Dict[str, Any]]:
+        """Same as get_user_data, without blocking the event loop."""
+        try:
+            logger.debug(f"Attempting to retrieve user data for ID: {memgpt_user_id}")
+            user_data = await async_db_manager.get_user(memgpt_user_id)
+            return UserDataManager._map_user_data(memgpt_user_id, user_data)
         except Exception as e:
             logger.error(f"Error retrieving user data: {str(e)}", exc_info=True)
             return None
@@ -208,32 +227,37 @@ class EventManagementUtils:
             
         
 class EventManagementUtils:
+    @staticmethod
+    def apply_event_defaults(event_data: Dict[str, Any], user_timezone: str) -> Dict[str, Any]:
+        # Update event data with user's timezone if not provided
+        event_data['start']['timeZone'] = event_data['start'].get('timeZone') or user_timezone
+        event_data['end']['timeZone'] = event_data['end'].get('timeZone') or user_timezone
+        event_data['local_timezone'] = user_timezone
+
+        # Ensure all required fields are present
+        event_data['location'] = event_data.get('location') or ''
+        event_data['reminders'] = event_data.get('reminders') or {'useDefault': True}
+        event_data['recurrence'] = event_data.get('recurrence')
+        return event_data
+
     @staticmethod
     async def schedule_event(user_id: str, event_data: Dict[str, Any], user_data: Dict[str, Any]) -> Dict[str, Any]:
         try:
             # Use user's timezone from database, or default to UTC
             user_timezone = str(user_data.get('local_timezone', 'UTC'))
-            
-            # Update event data with user's timezone if not provided
-            event_data['start']['timeZone'] = event_data['start'].get('timeZone') or user_timezone
-            event_data['end']['timeZone'] = event_data['end'].get('timeZone') or user_timezone
-            event_data['local_timezone'] = user_timezone
-
-            # Ensure all required fields are present
-            event_data['location'] = event_data.get('location') or ''
-            event_data['reminders'] = event_data.get('reminders') or {'useDefault': True}
-            event_data['recurrence'] = event_data.get('recurrence')
+            EventManagementUtils.apply_event_defaults(event_data, user_timezone)
 
             # Check for conflicts
-            conflict_check = EventManagementUtils.check_conflicts(user_id, event_data['start'], event_data['end'], local_timezone=user_timezone)
+            conflict_check = await EventManagementUtils.check_conflicts(user_id, event_data['start'], event_data['end'], local_timezone=user_timezone)
             if not conflict_check["success"]:
                 return conflict_check
 
             # Add event to local database
-            event_id = add_event(user_id, event_data)
+            event_id = await async_db_manager.add_event(user_id, event_data)
             
             if event_id:
                 event_data['id'] = event_id
+                await event_feed.publish_change(event_id, user_id, CREATED)
                 return {"success": True, "event": event_data}
             else:
                 return {"success": False, "message": "Failed to add event to database"}
@@ -242,36 +266,74 @@ class EventManagementUtils:
             return {"success": False, "message": str(e)}
 
     @staticmethod
-    def check_conflicts(user_id: str, start: Dict[str, Any], end: Dict[str, Any], event_id: Optional[str] = None, local_timezone: str = 'UTC') -> Dict[str, Any]:
+    async def schedule_events_bulk(user_id: str, events: List[Dict[str, Any]], user_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Import many events in one transaction, skipping per-event conflict checks."""
+        try:
+            user_timezone = str(user_data.get('local_timezone', 'UTC'))
+            for event_data in events:
+                EventManagementUtils.apply_event_defaults(event_data, user_timezone)
+
+            results = await async_db_manager.add_events_bulk(user_id, events)
+            await event_feed.publish([
+                {'event_id': result['event_id'], 'user_id': user_id, 'op': CREATED}
+                for result in results if result['success']
+            ])
+            created = sum(1 for result in results if result['success'])
+            return {
+                "success": created == len(results),
+                "created": created,
+                "failed": len(results) - created,
+                "results": results
+            }
+        except Exception as e:
+            logger.error(f"Error bulk scheduling events: {str(e)}", exc_info=True)
+            return {"success": False, "message": str(e)}
+
+    @staticmethod
+    def export_bounds(time_min: Optional[str] = None, time_max: Optional[str] = None) -> tuple:
+        """UTC (start_ts, end_ts) of an export window; raises ValueError on a malformed bound.
+
+        Kept out of export_events so a bad bound is rejected before a streaming
+        response has sent its headers.
+        """
+        start_ts = to_utc_timestamp(time_min) if time_min else MIN_TIMESTAMP
+        end_ts = to_utc_timestamp(time_max) if time_max else MAX_TIMESTAMP
+        return start_ts, end_ts
+
+    @staticmethod
+    def export_events(user_id: str, start_ts: int = MIN_TIMESTAMP, end_ts: int = MAX_TIMESTAMP):
+        """Yield the user's events as NDJSON lines, streamed straight from the cursor."""
+        for event in iter_events(user_id, start_ts, end_ts):
+            yield json.dumps(event.to_event()) + "\n"
+
+    @staticmethod
+    async def check_conflicts(user_id: str, start: Dict[str, Any], end: Dict[str, Any], event_id: Optional[str] = None, local_timezone: str = 'UTC') -> Dict[str, Any]:
         try:
             start_dt = parse_datetime(start['dateTime'], start.get('timeZone', local_timezone))
             end_dt = parse_datetime(end['dateTime'], end.get('timeZone', local_timezone))
 
-            # Fetch events within the time range from local database
-            events = get_events(user_id, start_dt.isoformat(), end_dt.isoformat())
+            # The overlap query returns exactly the events that intersect [start, end)
+            events = await async_db_manager.get_events_overlapping(
+                user_id, int(start_dt.timestamp()), int(end_dt.timestamp()))
 
             conflicts = []
             for event in events:
-                if event['id'] == event_id:
+                if event.id == event_id:
                     continue  # Skip the event being updated
 
-                event_start = parse_datetime(event['start_time'], event.get('local_timezone', local_timezone))
-                event_end = parse_datetime(event['end_time'], event.get('local_timezone', local_timezone))
-
-                if (start_dt < event_end and end_dt > event_start):
-                    conflicts.append({
-                        'id': event['id'],
-                        'summary': event['summary'],
-                        'start': {'dateTime': event['start_time'], 'timeZone': event.get('local_timezone', local_timezone)},
-                        'end': {'dateTime': event['end_time'], 'timeZone': event.get('local_timezone', local_timezone)}
-                    })
+                conflicts.append({
+                    'id': event.id,
+                    'summary': event.summary,
+                    'start': {'dateTime': event.start_time, 'timeZone': event.local_timezone or local_timezone},
+                    'end': {'dateTime': event.end_time, 'timeZone': event.local_timezone or local_timezone}
+                })
 
             if conflicts:
                 return {
                     "success": False,
                     "message": "Conflicting events found",
                     "conflicts": conflicts,
-                    "available_slots": EventManagementUtils.find_available_slots(user_id, start_dt, end_dt, local_timezone)
+                    "available_slots": await EventManagementUtils.find_available_slots(user_id, start_dt, end_dt, local_timezone)
                 }
 
             return {"success": True}
@@ -280,20 +342,22 @@ class EventManagementUtils:
             return {"success": False, "message": str(e)}
 
     @staticmethod
-    def find_available_slots(user_id: str, start_dt: datetime, end_dt: datetime, local_timezone: str) -> List[Dict[str, str]]:
-        events = get_events(user_id, start_dt.isoformat(), (end_dt + timedelta(days=7)).isoformat())
+    async def find_available_slots(user_id: str, start_dt: datetime, end_dt: datetime, local_timezone: str) -> List[Dict[str, str]]:
+        events = await async_db_manager.get_events_overlapping(
+            user_id, int(start_dt.timestamp()), int((end_dt + timedelta(days=7)).timestamp()))
 
+        tz = start_dt.tzinfo
         available_slots = []
         current_slot_start = start_dt
 
         for event in events:
-            event_start = parse_datetime(event['start_time'], event.get('local_timezone', local_timezone))
+            event_start = datetime.fromtimestamp(event.start_ts, tz)
             if current_slot_start < event_start:
                 available_slots.append({
                     'start': current_slot_start.isoformat(),
                     'end': event_start.isoformat()
                 })
-            current_slot_start = parse_datetime(event['end_time'], event.get('local_timezone', local_timezone))
+            current_slot_start = max(current_slot_start, datetime.fromtimestamp(event.end_ts, tz))
 
         if current_slot_start < end_dt:
             available_slots.append({
@@ -312,7 +376,7 @@ class EventManagementUtils:
         local_timezone: str = 'UTC'
     ) -> Dict[str, Any]:
         try:
-            user_data = UserDataManager.get_user_data(user_id)
+            user_data = await UserDataManager.get_user_data_async(user_id)
             local_timezone = user_data.get('local_timezone', local_timezone)
             tz = pytz.timezone(local_timezone)
 
@@ -328,33 +392,15 @@ class EventManagementUtils:
                 time_max = time_min + timedelta(days=30)  # Default to 30 days from time_min
 
             # Fetch events from the database
-            events = get_events(user_id, time_min.isoformat(), time_max.isoformat())
+            events = await async_db_manager.get_events_overlapping(
+                user_id, int(time_min.timestamp()), int(time_max.timestamp()))
 
-            # Process and format events
-            formatted_events = []
-            for event in events:
-                formatted_event = {
-                    'id': event['id'],
-                    'summary': event['summary'],
-                    'description': event.get('description', ''),
-                    'start': {
-                        'dateTime': event['start_time'],
-                        'timeZone': local_timezone
-                    },
-                    'end': {
-                        'dateTime': event['end_time'],
-                        'timeZone': local_timezone
-                    },
-                    'location': event.get('location', ''),
-                    'reminders': json.loads(event.get('reminders', '{}')),
-                    'recurrence': json.loads(event.get('recurrence', '[]')),
-                    'local_timezone': event.get('local_timezone', local_timezone)
-                }
-                formatted_events.append(formatted_event)
+            # Only the records actually returned are shaped for the API
+            formatted_events = [event.to_event(local_timezone) for event in events[:max_results]]
 
             return {
                 "success": True,
-                "events": formatted_events[:max_results],
+                "events": formatted_events,
                 "nextPageToken": None  # Local DB doesn't use page tokens
             }
         except Exception as e:
@@ -374,7 +420,7 @@ class EventManagementUtils:
         reminders: Optional[Union[List[Dict[str, Any]], Dict[str, Any]]] = None,
         recurrence: Optional[List[str]] = None,
         update_series: bool = False,
-        local_timezone: str = 'UTC'
+        local_timezone: Optional[str] = None
     ) -> str:
         try:
             event_data = {
@@ -400,9 +446,10 @@ class EventManagementUtils:
             
             event_data = {k: v for k, v in event_data.items() if v is not None}
             
-            updated = update_event(event_id, event_data)
+            updated = await async_db_manager.update_event(event_id, event_data)
             if updated:
-                updated_event = get_event(event_id)
+                await event_feed.publish_change(event_id, user_id, UPDATED)
+                updated_event = await async_db_manager.get_event(event_id)
                 if updated_event:
                     return json.dumps({"success": True, "event": updated_event})
                 else:
@@ -420,8 +467,9 @@ class EventManagementUtils:
         delete_series: bool = False
     ) -> Dict[str, Any]:
         try:
-            deleted = delete_event(event_id)
+            deleted = await async_db_manager.delete_event(event_id)
             if deleted:
+                await event_feed.publish_change(event_id, user_id, DELETED)
                 return {"success": True, "message": f"Event {event_id} deleted successfully"}
             else:
                 return {"success": False, "message": f"Event {event_id} not found or could not be deleted"}
@@ -11,7 +11,7 @@ import asyncio
 from memgpt.client.client import RESTClient
 from ella_vapi.vapi_client import VAPIClient
 import uuid
-from ella_dbo.db_manager import get_db_connection, get_user_data_by_field
+from ella_dbo.db_manager import get_user_data_by_field
 from datetime import datetime, timedelta
 import time
 from dateutil import parser
@@ -141,8 +141,7 @@ async def vapi_call_handler(request: Request, x_vapi_secret: Optional[str] = Hea
     else:
         logging.info(f"Cache miss. Looking up user data for phone number: {phone_number}")
         try:
-            with get_db_connection() as conn:
-                user_data = get_user_data_by_field('phone', normalize_phone_number(phone_number))
+            user_data = get_user_data_by_field('phone', normalize_phone_number(phone_number))
             
             if not user_data:
                 logging.error(f"User data not found for phone number: {phone_number}")